@@ -0,0 +1,236 @@
+import asyncio
+import os
+import re
+import threading
+from typing import Any, NamedTuple, Optional
+
+from cascoda import instrument
+from cascoda.archive import open_output, output_path
+
+# airline (Whitefield's ns-3 side) logs this when a frame is below rxSensitivity
+HNP_MESSAGE = "snr <= snr_min, dropped"
+AIRLINE_LOG = "airline.log"
+
+CHUNK_SIZE = 1 << 20
+# LogFollower polling interval bounds (seconds)
+FOLLOW_POLL_MIN = 0.02
+FOLLOW_POLL_MAX = 0.5
+
+# e.g. "Setting node 1 ext_addr: 0xffffffffffffffff -> 0x66e80055237c0326"
+EXT_ADDR_RE = re.compile(
+    rb"Setting node (\d+) ext_addr: 0x[0-9a-fA-F]+ -> 0x([0-9a-fA-F]+)"
+)
+# e.g. "In OTmsgrecvCallback, sim time: 1200, aliveNodes: 3"
+SIM_TIME_RE = re.compile(rb"sim time: (\d+)")
+
+
+class LogEvents(NamedTuple):
+    # frames airline dropped below rxSensitivity (HNP_MESSAGE lines)
+    drops: int
+    # sim time logged last before the first drop, None without drops
+    first_drop_sim_time: Optional[int]
+    # node id -> registered extended address (hex)
+    ext_addrs: dict[int, str]
+    last_sim_time: Optional[int]
+
+
+def find_in_log(
+    log_path, message: str = HNP_MESSAGE, chunk_size: int = CHUNK_SIZE
+) -> Optional[int]:
+    """
+    Returns the byte offset of the first occurrence of message in the log, or
+    None. The log is read in chunks and the search stops at the first match, so
+    memory use doesn't depend on the log size.
+    """
+    needle = message.encode()
+    overlap = len(needle) - 1
+    offset = 0
+    tail = b""
+    with open_output(log_path) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return None
+            data = tail + chunk
+            found = data.find(needle)
+            if found != -1:
+                return offset - len(tail) + found
+            offset += len(chunk)
+            # keep enough of the end to match a message split across chunks
+            tail = data[-overlap:] if overlap else b""
+
+
+def hnp_in_log(log_path) -> bool:
+    return find_in_log(log_path) is not None
+
+
+def scan_log(log_path) -> LogEvents:
+    """
+    Extracts the SNR drops, ext_addr registrations and sim time stamps of an
+    airline.log in one streaming pass.
+    """
+    needle = HNP_MESSAGE.encode()
+    drops = 0
+    first_drop_sim_time = None
+    ext_addrs = {}
+    last_sim_time = None
+    with open_output(log_path) as f:
+        for line in f:
+            # cheap substring checks first, most lines match none of them
+            if needle in line:
+                if not drops:
+                    first_drop_sim_time = last_sim_time
+                drops += 1
+            elif b"sim time" in line:
+                match = SIM_TIME_RE.search(line)
+                if match:
+                    last_sim_time = int(match.group(1))
+            elif b"ext_addr" in line:
+                match = EXT_ADDR_RE.search(line)
+                if match:
+                    ext_addrs[int(match.group(1))] = match.group(2).decode()
+    return LogEvents(drops, first_drop_sim_time, ext_addrs, last_sim_time)
+
+
+def log_directory(pcap_directory) -> Optional[str]:
+    """
+    Returns the log folder backed up with the pcap folder pcap_directory
+    (log_<date> next to pcap_<date>, the dates can be a second apart).
+    """
+    pcap_directory = os.path.normpath(pcap_directory)
+    run_dir, pcap_name = os.path.split(pcap_directory)
+    log_dirs = sorted(
+        d
+        for d in os.listdir(run_dir)
+        if d.startswith("log") and os.path.isdir(os.path.join(run_dir, d))
+    )
+    if not log_dirs:
+        return None
+    log_name = pcap_name.replace("pcap", "log", 1)
+    if log_name not in log_dirs:
+        # the latest log folder not after the pcap one (both share the run time)
+        earlier = [d for d in log_dirs if d <= log_name]
+        log_name = earlier[-1] if earlier else log_dirs[0]
+    return os.path.join(run_dir, log_name)
+
+
+def log_stats(events: Optional[LogEvents]) -> dict[str, Any]:
+    """
+    The summary columns of a run's airline.log (empty values if there is none).
+    """
+    if events is None:
+        return {
+            "snr_drops": None,
+            "hnp_onset_sim_time": None,
+            "last_sim_time": None,
+            "registered_nodes": None,
+        }
+    return {
+        "snr_drops": events.drops,
+        "hnp_onset_sim_time": events.first_drop_sim_time,
+        "last_sim_time": events.last_sim_time,
+        "registered_nodes": len(events.ext_addrs),
+    }
+
+
+# LogEvents of the run whose pcaps are in pcap_directory, None without a log
+def run_log_events(pcap_directory) -> Optional[LogEvents]:
+    log_dir = log_directory(pcap_directory)
+    if log_dir is None or output_path(os.path.join(log_dir, AIRLINE_LOG)) is None:
+        return None
+    with instrument.stage("scan_log", log=log_dir):
+        return scan_log(os.path.join(log_dir, AIRLINE_LOG))
+
+
+class _ChunkMatcher:
+    # finds a message in a log read chunk by chunk, even split across chunks
+    def __init__(self, message: str):
+        self.needle = message.encode()
+        self.tail = b""
+
+    def feed(self, chunk: bytes) -> bool:
+        data = self.tail + chunk
+        if self.needle in data:
+            return True
+        overlap = len(self.needle) - 1
+        self.tail = data[-overlap:] if overlap else b""
+        return False
+
+
+class LogFollower(threading.Thread):
+    """
+    Follows a log while it is being written (like tail -f) and calls
+    on_match() once, as soon as message appears in it. The log doesn't have to
+    exist yet. Call finish() to stop following.
+    """
+
+    def __init__(self, log_path, on_match, message: str = HNP_MESSAGE):
+        super().__init__(daemon=True)
+        self.log_path = log_path
+        self.on_match = on_match
+        self.message = message
+        self.matched = False
+        self._finished = threading.Event()
+
+    def run(self):
+        matcher = _ChunkMatcher(self.message)
+        f = None
+        interval = FOLLOW_POLL_MIN
+        try:
+            while not self._finished.is_set():
+                if f is None:
+                    try:
+                        f = open(self.log_path, "rb")
+                    except FileNotFoundError:
+                        self._finished.wait(interval)
+                        interval = min(interval * 2, FOLLOW_POLL_MAX)
+                        continue
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    # nothing new yet, back off while the log is quiet
+                    self._finished.wait(interval)
+                    interval = min(interval * 2, FOLLOW_POLL_MAX)
+                    continue
+                interval = FOLLOW_POLL_MIN
+                if matcher.feed(chunk):
+                    self.matched = True
+                    self.on_match()
+                    return
+        finally:
+            if f is not None:
+                f.close()
+
+    def finish(self):
+        self._finished.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+
+async def follow_log(log_path, message: str = HNP_MESSAGE):
+    """
+    Coroutine version of LogFollower: returns as soon as message appears in the
+    log being written at log_path, follows it until cancelled otherwise.
+    """
+    matcher = _ChunkMatcher(message)
+    f = None
+    interval = FOLLOW_POLL_MIN
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(log_path, "rb")
+                except FileNotFoundError:
+                    await asyncio.sleep(interval)
+                    interval = min(interval * 2, FOLLOW_POLL_MAX)
+                    continue
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, FOLLOW_POLL_MAX)
+                continue
+            interval = FOLLOW_POLL_MIN
+            if matcher.feed(chunk):
+                return
+    finally:
+        if f is not None:
+            f.close()
@@ -0,0 +1,255 @@
+import errno
+import gzip
+import io
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd archives need the zstandard package, gzip is used instead
+    zstandard = None
+
+COMPRESSIONS = ("auto", "none", "gzip", "zstd")
+# compressed copies are the original file name plus the suffix
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# small files read by other tools as they are (e.g. simulation.json)
+UNCOMPRESSED_EXTENSIONS = (".json",)
+# hidden, so the readers never list a file that is still being written
+TMP_PREFIX = "."
+TMP_SUFFIX = ".tmp"
+
+
+def resolve_compression(compression: Optional[str]) -> Optional[str]:
+    # "gzip" or "zstd", None for "none"; "auto" prefers zstd when installed
+    if compression in (None, "none"):
+        return None
+    if compression == "auto":
+        return "zstd" if zstandard is not None else "gzip"
+    if compression not in SUFFIXES:
+        raise ValueError(f"unknown compression {compression}, use {COMPRESSIONS}")
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd compression needs zstandard (pip install zstandard)")
+    return compression
+
+
+def move_dir(src, dst):
+    """
+    Moves the folder src to dst (which must not exist). On the same file
+    system it is a single rename. Across file systems the folder is copied
+    next to dst first then renamed, so dst never holds a partial copy.
+    """
+    src, dst = str(src), str(dst)
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    try:
+        os.rename(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    parent, name = os.path.split(os.path.abspath(dst))
+    tmp = os.path.join(parent, TMP_PREFIX + name + TMP_SUFFIX)
+    shutil.move(src, tmp)
+    os.rename(tmp, dst)
+
+
+def output_name(file_name: str) -> Optional[str]:
+    """
+    The name of an output file before compression (pkt-1-0.pcap for
+    pkt-1-0.pcap.gz), None for the temporary files of a compression.
+    """
+    if file_name.startswith(TMP_PREFIX) and file_name.endswith(TMP_SUFFIX):
+        return None
+    for suffix in SUFFIXES.values():
+        if file_name.endswith(suffix):
+            return file_name[: -len(suffix)]
+    return file_name
+
+
+def output_path(path) -> Optional[str]:
+    # the output file as it is now, compressed or not, None if missing
+    path = str(path)
+    for candidate in (path, *(path + suffix for suffix in SUFFIXES.values())):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def output_size(path) -> Optional[int]:
+    """
+    The size of an output file before compression, None if missing. It is read
+    from the gzip trailer (modulo 2**32) or the zstd frame header, without
+    decompressing; a zstd copy that doesn't record it gives its own size.
+    """
+    current = output_path(path)
+    if current is None:
+        return None
+    if current.endswith(SUFFIXES["gzip"]):
+        with open(current, "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            return int.from_bytes(f.read(4), "little")
+    if current.endswith(SUFFIXES["zstd"]) and zstandard is not None:
+        with open(current, "rb") as f:
+            size = zstandard.frame_content_size(f.read(18))
+        if size >= 0:
+            return size
+    return os.path.getsize(current)
+
+
+def _open_file(path: str) -> BinaryIO:
+    if path.endswith(SUFFIXES["gzip"]):
+        return gzip.open(path, "rb")  # type: ignore[return-value]
+    if path.endswith(SUFFIXES["zstd"]):
+        if zstandard is None:
+            raise OSError(f"{path} is zstd compressed, install zstandard to read it")
+        # buffered, the pcap reader makes many small reads
+        return io.BufferedReader(zstandard.open(path, "rb"))
+    return open(path, "rb")
+
+
+def open_output(path) -> BinaryIO:
+    """
+    Opens a backed up output file for reading in binary mode, decompressing it
+    on the fly if it has been compressed since (see Archiver). The original
+    file is only removed once its compressed copy is complete, so one of them
+    can always be opened.
+    """
+    path = str(path)
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        pass
+    for suffix in SUFFIXES.values():
+        try:
+            return _open_file(path + suffix)
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError(errno.ENOENT, "No such output file", path)
+
+
+def compress_file(path: str, compression: str) -> tuple[int, int]:
+    """
+    Replaces the file at path with its compressed copy (path plus the
+    compression's suffix). The copy is written to a hidden temporary file and
+    renamed once complete, then the original is removed.
+    Returns the size before and after.
+    """
+    directory, name = os.path.split(path)
+    target = path + SUFFIXES[compression]
+    tmp = os.path.join(
+        directory, TMP_PREFIX + name + SUFFIXES[compression] + TMP_SUFFIX
+    )
+    try:
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            if compression == "zstd":
+                # the original size goes in the frame header (see output_size)
+                zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(
+                    src, dst, size=os.fstat(src.fileno()).st_size
+                )
+            else:
+                # no file name or time in the header, same input same output
+                with gzip.GzipFile(
+                    filename="",
+                    mode="wb",
+                    compresslevel=GZIP_LEVEL,
+                    fileobj=dst,
+                    mtime=0,
+                ) as gz:
+                    shutil.copyfileobj(src, gz, 1 << 20)
+        shutil.copystat(path, tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size, os.path.getsize(target)
+
+
+def compress_dir(directory, compression: str) -> tuple[int, int]:
+    # compresses every output file in directory, returns the total sizes
+    before = after = 0
+    for root, _, files in os.walk(str(directory)):
+        for name in sorted(files):
+            if (
+                output_name(name) != name
+                or name.endswith(UNCOMPRESSED_EXTENSIONS)
+                or os.path.islink(os.path.join(root, name))
+            ):
+                continue
+            size, compressed = compress_file(os.path.join(root, name), compression)
+            before += size
+            after += compressed
+    return before, after
+
+
+class Archiver:
+    """
+    Compresses backed up output folders in background threads, so the next
+    simulation starts while the previous one's logs and pcaps are compressed.
+    Readers go through open_output, which reads either form.
+    """
+
+    def __init__(self, compression: Optional[str] = "auto", workers: int = 1):
+        self.compression = resolve_compression(compression)
+        self.failures: list[tuple[str, Exception]] = []
+        self.size_before = 0
+        self.size_after = 0
+        self._executor = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="archive")
+            if self.compression is not None
+            else None
+        )
+        self._lock = threading.Lock()
+
+    def submit(self, directory) -> Optional[Future]:
+        if self._executor is None:
+            return None
+        return self._executor.submit(self._compress, str(directory))
+
+    def _compress(self, directory: str):
+        try:
+            before, after = compress_dir(directory, self.compression)
+        except Exception as e:
+            with self._lock:
+                self.failures.append((directory, e))
+            return
+        with self._lock:
+            self.size_before += before
+            self.size_after += after
+
+    def close(self):
+        # waits until every submitted folder is compressed
+        if self._executor is None:
+            return
+        self._executor.shutdown()
+        for directory, e in self.failures:
+            print(f"WARNING {directory} not compressed: {type(e).__name__}: {e}")
+        if self.size_before:
+            print(
+                f"outputs compressed with {self.compression}: "
+                + f"{self.size_before / 2**20:.1f} MB -> "
+                + f"{self.size_after / 2**20:.1f} MB"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def add_compress_argument(parser):
+    # the --compress option of the scripts running simulations
+    parser.add_argument(
+        "--compress",
+        choices=COMPRESSIONS,
+        default="auto",
+        help="compress the backed up logs and pcaps in the background "
+        + "(auto: zstd if installed, else gzip)",
+    )
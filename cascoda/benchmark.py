@@ -0,0 +1,538 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+from cascoda import extract_stats, generate_report
+from cascoda.airline_log import AIRLINE_LOG, HNP_MESSAGE, scan_log
+from cascoda.hdn_detector import detect_hnp
+from cascoda.pcap_reader import (
+    ICMPV6_ECHO_REPLY,
+    ICMPV6_ECHO_REQUEST,
+    LINKTYPE_IEEE802_15_4_WITHFCS,
+)
+from cascoda.run_catalog import rebuild_catalog
+from cascoda.stats_export import StatsExporter
+from cascoda.thread_crypto import ccm_star_encrypt, expand_key, thread_mac_key
+from cascoda.wf_config import (
+    CONFIG_TEMPLATE,
+    RunParams,
+    load_template,
+    write_variant,
+)
+
+DEFAULT_BASELINE = "../outputs/benchmark_baseline.json"
+DEFAULT_RESULTS = "../outputs/benchmark_results.json"
+
+# the network key and PAN id of the config template (so its configs decrypt)
+NETWORK_KEY = bytes.fromhex("00112233445566778899aabbccddeeff")
+PAN_ID = 0xFACE
+PING_DATA = 20  # echo payload bytes, small enough for one unfragmented frame
+CAPTURE_START = 1_600_000_000.0
+
+# a stage only regresses by more than this much on top of the tolerance,
+# so stages taking a few milliseconds don't fail on timer noise
+TIME_SLACK_S = 0.01
+MEMORY_SLACK_MB = 1.0
+
+
+# 802.15.4 data frame secured like Thread does (MIC-32 + encryption, key id
+# mode 1), from the extended address src, to dst (short or extended address)
+def mac_frame(
+    schedule: list[int], src: bytes, dst: bytes, counter: int, payload: bytes
+) -> bytes:
+    dst_mode = 2 if len(dst) == 2 else 3
+    fcf = 1 | (1 << 3) | (1 << 6) | (dst_mode << 10) | (1 << 12) | (3 << 14)
+    header = struct.pack("<HBH", fcf, counter & 0xFF, PAN_ID) + dst[::-1] + src[::-1]
+    header += bytes([5 | (1 << 3)]) + struct.pack("<I", counter) + b"\x01"
+    nonce = src + struct.pack(">I", counter) + b"\x05"
+    # the trailing 2 bytes are the (unchecked) FCS
+    return header + ccm_star_encrypt(schedule, nonce, header, payload, 4) + b"\0\0"
+
+
+# 6LoWPAN IPHC ICMPv6 echo, link-local addresses taken from the MAC header
+def echo_payload(icmp_type: int, seq: int, multicast: bool) -> bytes:
+    if multicast:
+        iphc = bytes([0x7B, 0x3B, 58, 0x01])  # to ff02::1
+    else:
+        iphc = bytes([0x7B, 0x33, 58])
+    icmp = bytes([icmp_type, 0, 0, 0]) + struct.pack(">HH", 0x1234, seq)
+    return iphc + icmp + bytes(PING_DATA)
+
+
+def write_pcap(path, records: list[tuple[float, bytes]]):
+    with open(path, "wb") as f:
+        f.write(
+            struct.pack(
+                "<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, LINKTYPE_IEEE802_15_4_WITHFCS
+            )
+        )
+        for timestamp, frame in records:
+            seconds = int(timestamp)
+            micros = int(round((timestamp - seconds) * 1e6))
+            f.write(struct.pack("<IIII", seconds, micros, len(frame), len(frame)))
+            f.write(frame)
+
+
+def write_ping_pcaps(
+    directory,
+    nodes: int = 3,
+    central: int = 1,
+    pings: int = 500,
+    loss: float = 0.3,
+    seed: int = 0,
+    network_key: bytes = NETWORK_KEY,
+):
+    """
+    Writes the pkt-<node>-0.pcap files of a synthetic run: every node except
+    central pings ff02::1 pings times, each lost request is sent again until
+    central replies (a request is lost with probability loss).
+    """
+    rnd = random.Random(seed)
+    schedule = expand_key(thread_mac_key(network_key, 0))
+    addresses = [bytes([0x10 + node]) + rnd.randbytes(7) for node in range(nodes)]
+    counters = [0] * nodes
+    records: dict[int, list[tuple[float, bytes]]] = {n: [] for n in range(nodes)}
+
+    def send(node: int, timestamp: float, dst: bytes, payload: bytes):
+        counters[node] += 1
+        frame = mac_frame(schedule, addresses[node], dst, counters[node], payload)
+        records[node].append((timestamp, frame))
+
+    timestamp = CAPTURE_START
+    for seq in range(1, pings + 1):
+        for node in range(nodes):
+            if node == central:
+                continue
+            while True:
+                timestamp += 0.01
+                request = echo_payload(ICMPV6_ECHO_REQUEST, seq, multicast=True)
+                send(node, timestamp, b"\xff\xff", request)
+                if rnd.random() >= loss:
+                    timestamp += 0.005
+                    reply = echo_payload(ICMPV6_ECHO_REPLY, seq, multicast=False)
+                    send(central, timestamp, addresses[node], reply)
+                    break
+
+    os.makedirs(directory, exist_ok=True)
+    for node in range(nodes):
+        write_pcap(os.path.join(directory, f"pkt-{node}-0.pcap"), records[node])
+
+
+def write_airline_log(
+    path,
+    nodes: int = 3,
+    lines: int = 100_000,
+    drops: int = 0,
+    drop_from: float = 0.9,
+    seed: int = 0,
+):
+    """
+    Writes an airline.log of about lines lines: the ext_addr registrations, then
+    sim time stamps and frame traffic, with drops SNR drop lines spread over
+    the part of the log after the drop_from fraction.
+    """
+    rnd = random.Random(seed)
+    first_drop = int(lines * drop_from)
+    drop_lines = set(
+        rnd.sample(range(first_drop, lines), min(drops, lines - first_drop))
+    )
+    with open(path, "w") as f:
+        for node in range(nodes):
+            f.write(
+                f"Setting node {node} ext_addr: 0xffffffffffffffff -> "
+                + f"0x{rnd.getrandbits(64):016x}\n"
+            )
+        for line in range(lines):
+            src = rnd.randrange(nodes)
+            dst = (src + 1 + rnd.randrange(nodes - 1)) % nodes if nodes > 1 else src
+            if line in drop_lines:
+                f.write(f"[{src} -> {dst}] {HNP_MESSAGE}\n")
+            elif line % 10 == 0:
+                f.write(
+                    f"In OTmsgrecvCallback, sim time: {line * 10}, "
+                    + f"aliveNodes: {nodes}\n"
+                )
+            else:
+                f.write(f"Tx frame src:{src} dst:{dst} len:{rnd.randrange(20, 127)}\n")
+
+
+def retry_sequences(packets: int, retry_rate: float = 0.2, seed: int = 0) -> np.ndarray:
+    # sequence numbers of packets requests, each sent again up to 3 times
+    rng = np.random.default_rng(seed)
+    attempts = 1 + rng.binomial(3, retry_rate, size=packets)
+    return np.repeat(np.arange(1, packets + 1, dtype=np.int32), attempts)[:packets]
+
+
+def write_config_set(
+    workspace,
+    sensitivities: list[float],
+    distances: int,
+    pings: int = 500,
+    log_lines: int = 10_000,
+    seed: int = 0,
+    template: str = CONFIG_TEMPLATE,
+):
+    """
+    Writes a config (with its JSON params) for every sensitivity and node
+    position iteration 1..distances to workspace/config, and the synthetic
+    pcaps and airline.log of its run to workspace/simulation_outputs, laid out
+    like the backed up Whitefield outputs (with their run catalog). Requests
+    get lost more often the further apart the nodes are and the higher the
+    sensitivity.
+    """
+    config_dir = os.path.join(workspace, "config")
+    outputs_dir = os.path.join(workspace, "simulation_outputs")
+    os.makedirs(config_dir, exist_ok=True)
+    base = load_template(template)
+    for s in sensitivities:
+        for x in range(1, distances + 1):
+            params = RunParams(n=3, t=1, s=s, x=x, p=88)
+            positions = [(0, 5 * x * node, 0) for node in range(params.n)]
+            path = write_variant(base.variant(params, positions), params, config_dir)
+            run_dir = os.path.join(outputs_dir, Path(path).stem)
+            loss = min(0.9, 0.05 * x + max(0.0, (s + 105) * 0.02))
+            run_seed = seed + len(os.listdir(config_dir))
+            write_ping_pcaps(
+                os.path.join(run_dir, "pcap_2022-01-01_00-00-00"),
+                pings=pings,
+                loss=loss,
+                seed=run_seed,
+            )
+            log_dir = os.path.join(run_dir, "log_2022-01-01_00-00-00")
+            os.makedirs(log_dir)
+            write_airline_log(
+                os.path.join(log_dir, AIRLINE_LOG),
+                lines=log_lines,
+                drops=x if loss > 0.3 else 0,
+                seed=run_seed,
+            )
+    rebuild_catalog(outputs_dir, config_dir)
+
+
+class Stage(NamedTuple):
+    name: str
+    run: Callable[[], object]
+    # run (untimed) before every timed run, e.g. to remove the previous output
+    setup: Optional[Callable[[], None]] = None
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def build_workspace(workspace, args) -> list[Stage]:
+    """
+    Generates the synthetic inputs in workspace (a copy of the repo layout, the
+    stages run from workspace/cascoda) and returns the benchmark stages.
+    """
+    workspace = os.path.abspath(workspace)
+    code_dir = os.path.join(workspace, "cascoda")
+    os.makedirs(code_dir, exist_ok=True)
+    os.makedirs(os.path.join(workspace, "outputs"), exist_ok=True)
+    os.makedirs(os.path.join(workspace, "logs"), exist_ok=True)
+    assets = os.path.join(code_dir, "assets")
+    if not os.path.exists(assets):
+        os.symlink(Path(__file__).resolve().parent / "assets", assets)
+
+    # one N node run for get_stats
+    run_dir = os.path.join(workspace, "single_run")
+    pcap_dir = os.path.join(run_dir, "pcap_2022-01-01_00-00-00", "")
+    write_ping_pcaps(pcap_dir, args.nodes, 1, args.pings, args.loss, args.seed)
+    params = RunParams(n=args.nodes, t=1, s=-100, x=1, p=88)
+    positions = [(0, 5 * node, 0) for node in range(args.nodes)]
+    config_path = write_variant(
+        load_template(CONFIG_TEMPLATE).variant(params, positions), params, run_dir
+    )
+
+    log_path = os.path.join(workspace, "logs", AIRLINE_LOG)
+    # a single drop on the last line, the worst case of the HNP check
+    write_airline_log(
+        log_path, args.nodes, args.log_lines, drops=1, drop_from=1 - 1 / args.log_lines
+    )
+    sequences = retry_sequences(args.packets, seed=args.seed)
+
+    write_config_set(
+        workspace,
+        args.sensitivities,
+        args.distances,
+        args.run_pings,
+        args.run_log_lines,
+        args.seed,
+    )
+
+    outlog = os.path.join(workspace, "logs", "hnp_output.log")
+    export_csv = os.path.join(workspace, "outputs", "benchmark_export.csv")
+    plot_dir = os.path.join(workspace, "outputs", "plots")
+
+    def export_stats():
+        with StatsExporter(export_csv) as exporter:
+            extract_stats.config_pcap_get_stats(
+                "../simulation_outputs",
+                backend="native",
+                on_stats=exporter.write,
+            )
+
+    def make_pdf():
+        generate_report.make_pdf(*generate_report.get_data(export_csv), workers=1)
+
+    return [
+        Stage(
+            "get_stats",
+            lambda: extract_stats.get_stats(
+                pcap_dir, config_path, backend="native", central_node=1
+            ),
+        ),
+        Stage(
+            "retries_per_packet", lambda: extract_stats.retries_per_packet(sequences)
+        ),
+        Stage(
+            "detect_hnp",
+            lambda: detect_hnp(log_path, outlog, -100, "[0,0,0]", {}),
+            lambda: _remove(outlog),
+        ),
+        Stage("scan_log", lambda: scan_log(log_path)),
+        Stage("export_stats", export_stats),
+        Stage("get_data", lambda: generate_report.get_data(export_csv)),
+        # plots are rendered every time, not read back by hash
+        Stage("make_pdf", make_pdf, lambda: _remove(plot_dir)),
+    ]
+
+
+STAGES = (
+    "get_stats",
+    "retries_per_packet",
+    "detect_hnp",
+    "scan_log",
+    "export_stats",
+    "get_data",
+    "make_pdf",
+)
+
+
+def measure(stage: Stage, repeat: int) -> dict[str, float]:
+    """
+    Best wall and CPU time of repeat runs, and the peak memory traced during one
+    more run (Python objects and numpy buffers, so it doesn't vary between runs
+    like the RSS does). Tracing slows Python code down, so it is kept off the
+    timed runs.
+    """
+    walls = []
+    cpus = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            if stage.setup is not None:
+                stage.setup()
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            stage.run()
+            cpus.append(time.process_time() - cpu)
+            walls.append(time.perf_counter() - wall)
+
+        if stage.setup is not None:
+            stage.setup()
+        tracemalloc.start()
+        try:
+            stage.run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {
+        "wall_s": round(min(walls), 6),
+        "cpu_s": round(min(cpus), 6),
+        "peak_mb": round(peak / 2**20, 3),
+    }
+
+
+def compare(
+    results: dict, baseline: dict, tolerance: float, memory_tolerance: float
+) -> list[str]:
+    """
+    Returns a message for every stage slower (or using more memory) than its
+    baseline by more than the tolerance (a fraction of the baseline).
+    """
+    if results["params"] != baseline["params"]:
+        raise ValueError(
+            "the baseline was recorded with other benchmark sizes: "
+            + json.dumps(baseline["params"])
+        )
+    regressions = []
+    for name, stage in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            continue
+        if stage["wall_s"] > base["wall_s"] * (1 + tolerance) + TIME_SLACK_S:
+            regressions.append(
+                f"{name}: {stage['wall_s']:.3f} s, baseline {base['wall_s']:.3f} s"
+            )
+        if stage["peak_mb"] > base["peak_mb"] * (1 + memory_tolerance) + (
+            MEMORY_SLACK_MB
+        ):
+            regressions.append(
+                f"{name}: {stage['peak_mb']:.1f} MB peak, "
+                + f"baseline {base['peak_mb']:.1f} MB"
+            )
+    return regressions
+
+
+def print_results(results: dict, baseline: Optional[dict]):
+    print(f"{'stage':<20}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}{'vs base':>10}")
+    for name, stage in results["stages"].items():
+        base = (baseline or {}).get("stages", {}).get(name)
+        change = f"{stage['wall_s'] / base['wall_s']:.2f}x" if base else "-"
+        print(
+            f"{name:<20}{stage['wall_s']:>10.3f}{stage['cpu_s']:>10.3f}"
+            + f"{stage['peak_mb']:>10.1f}{change:>10}"
+        )
+
+
+def run_benchmarks(args) -> dict:
+    workspace = args.workdir or tempfile.mkdtemp(prefix="cascoda_benchmark_")
+    cwd = os.getcwd()
+    try:
+        start = time.perf_counter()
+        stages = build_workspace(workspace, args)
+        print(f"inputs generated in {workspace} ({time.perf_counter() - start:.1f} s)")
+        os.chdir(os.path.join(workspace, "cascoda"))
+        results = {}
+        for stage in stages:
+            if stage.name in args.stages:
+                results[stage.name] = measure(stage, args.repeat)
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    params = {
+        name: getattr(args, name)
+        for name in (
+            "nodes",
+            "pings",
+            "loss",
+            "packets",
+            "log_lines",
+            "sensitivities",
+            "distances",
+            "run_pings",
+            "run_log_lines",
+            "seed",
+        )
+    }
+    return {
+        "params": params,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "stages": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline stages on synthetic pcaps, logs "
+        + "and configs, and check them against a stored baseline."
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--nodes", type=int, default=3, help="nodes of get_stats run")
+    parser.add_argument("--pings", type=int, default=500, help="pings per end node")
+    parser.add_argument("--loss", type=float, default=0.3, help="request loss rate")
+    parser.add_argument(
+        "--packets", type=int, default=1_000_000, help="retries_per_packet size"
+    )
+    parser.add_argument(
+        "--log-lines", type=int, default=1_000_000, help="airline.log lines"
+    )
+    parser.add_argument(
+        "--sensitivities",
+        type=float,
+        nargs="+",
+        default=[-99.0, -100.0, -101.0],
+        help="receive sensitivities of the config set",
+    )
+    parser.add_argument(
+        "--distances",
+        type=int,
+        default=5,
+        help="node position iterations per sensitivity in the config set",
+    )
+    parser.add_argument(
+        "--run-pings", type=int, default=100, help="pings per node in the config set"
+    )
+    parser.add_argument(
+        "--run-log-lines",
+        type=int,
+        default=10_000,
+        help="airline.log lines per run in the config set",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE, help="stored baseline results"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store these results as the baseline instead of comparing",
+    )
+    parser.add_argument("--output", default=DEFAULT_RESULTS, help="results json")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown against the baseline (0.25 = 25%%)",
+    )
+    parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        default=0.1,
+        help="allowed peak memory increase against the baseline",
+    )
+    parser.add_argument(
+        "--workdir", default=None, help="where to generate the inputs (default tmp)"
+    )
+    parser.add_argument("--keep", action="store_true", help="keep the generated inputs")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4)
+        print_results(results, None)
+        print(f"baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    try:
+        with open(args.baseline) as f:
+            baseline: Optional[dict] = json.load(f)
+    except FileNotFoundError:
+        baseline = None
+    print_results(results, baseline)
+    if baseline is None:
+        print(f"no baseline at {args.baseline}, store one with --save-baseline")
+        sys.exit(0)
+
+    try:
+        regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+    except ValueError as e:
+        sys.exit(str(e))
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
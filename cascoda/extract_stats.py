@@ -1,226 +1,431 @@
-import csv
+import argparse
+import io
 import os
 import re
 import subprocess
-import sys
-from typing import Any, Tuple
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, Optional, Tuple
 
 import numpy as np
 
+from cascoda import instrument, retry_analysis
+from cascoda.airline_log import LogEvents, log_stats, run_log_events
+from cascoda.archive import open_output, output_name
+from cascoda.latency_analysis import (
+    latency_percentiles,
+    match_replies,
+    window_series,
+)
+from cascoda.packet_table import PacketTable, table_from_capture
+from cascoda.pcap_reader import (
+    ICMPV6_ECHO_REPLY,
+    ICMPV6_ECHO_REQUEST,
+    EchoCapture,
+    Packet,
+    PcapDecodeError,
+    read_echo_packets,
+)
+from cascoda.retry_analysis import RetryAnalysis, analyse_retries
+from cascoda.run_catalog import CatalogRun, catalog_path, find_runs, rebuild_catalog
+from cascoda.stats_cache import DEFAULT_CACHE_PATH, cached_table
+from cascoda.stats_export import StatsExporter
+from cascoda.wf_config import WfConfig, run_params
+
+PCAP_BACKENDS = ("auto", "native", "tshark")
+NODE_PCAP_PATTERN = re.compile(r"pkt-(\d+)-0\.pcap$")
+# runs decoded ahead of the one being collected, per worker process
+IN_FLIGHT_PER_WORKER = 2
+
 
 # A list of filtered packets extracted from the pcap file
 # if used on central node, these are the replies packets sent to all end nodes
 # if used on end nodes, these are the total packets sent
-def tshark_get_filtered_packets(pcap_directory: str, pcap_file: str) -> list[str]:
-    output = subprocess.run(
-        ["tshark", "-r", pcap_directory + pcap_file, "-Y", "icmpv6"],
-        capture_output=True,
-    )
+def tshark_get_filtered_packets(pcap_directory: str, pcap_file: str) -> EchoCapture:
+    with instrument.stage("tshark", file=pcap_directory + pcap_file):
+        return _tshark_get_filtered_packets(pcap_directory, pcap_file)
+
+
+def _tshark_get_filtered_packets(pcap_directory: str, pcap_file: str) -> EchoCapture:
+    # the pcap is opened here and piped to tshark, so the Archiver compressing
+    # it meanwhile can't remove it under tshark (compressed ones are decompressed)
+    with open_output(pcap_directory + pcap_file) as f:
+        plain = isinstance(getattr(f, "raw", None), io.FileIO)
+        output = subprocess.run(
+            [
+                "tshark",
+                "-r",
+                "-",
+                "-Y",
+                "icmpv6.type == 128 || icmpv6.type == 129",
+                "-T",
+                "fields",
+                "-e",
+                "frame.time_epoch",
+                "-e",
+                "frame.time_relative",
+                "-e",
+                "ipv6.src",
+                "-e",
+                "ipv6.dst",
+                "-e",
+                "icmpv6.echo.sequence_number",
+                "-e",
+                "icmpv6.type",
+            ],
+            stdin=f if plain else None,
+            input=None if plain else f.read(),
+            capture_output=True,
+        )
+    error = output.stderr.decode("utf-8", errors="replace").strip()
+    # a capture cut short (a stopped simulation) keeps its whole packets, like
+    # the native reader, any other failure would pass as an empty capture
+    if output.returncode != 0 and "cut short" not in error:
+        raise RuntimeError(f"tshark failed on {pcap_directory + pcap_file}: {error}")
     string_output = output.stdout.decode("utf-8").rstrip()
-    split_string_output = string_output.splitlines()
-
-    return split_string_output
-
-
-# extracts the packet sequence number from a single packet
-def get_seq_value(packet_string: str) -> int:
-    seq_value_index = packet_string.find("seq=") + 4
-
-    return int(packet_string[seq_value_index:].split(",")[0])
-
-
-def get_source(packet_string: str) -> str:
-    return packet_string.strip().split(" ")[3]
-
-
-def get_sources_list(tshark_output: list[str]) -> list[str]:
-    return [get_source(packet_string) for packet_string in tshark_output]
 
-
-def get_destination(packet_string: str) -> str:
-    return packet_string.strip().split(" ")[5]
-
-
-def get_destination_list(tshark_output: list[str]) -> list[str]:
-    return [get_destination(packet_string) for packet_string in tshark_output]
-
-
-def filtered_response_sequences(central_node, node_0, node_2):
+    start = 0.0
+    packets = []
+    for line in string_output.splitlines():
+        epoch, relative, src, dst, seq, icmp_type = line.split("\t")
+        start = float(epoch) - float(relative)
+        # tunnelled packets list every header's address, keep the outer one
+        packets.append(
+            Packet(
+                float(relative),
+                src.split(",")[0],
+                dst.split(",")[0],
+                int(seq),
+                int(icmp_type.split(",")[0]),
+            )
+        )
+
+    return EchoCapture(start, packets, 0)
+
+
+# decodes the pcap in-process, without forking tshark
+def native_get_filtered_packets(
+    pcap_directory: str, pcap_file: str, network_key: Optional[bytes] = None
+) -> EchoCapture:
+    with open_output(pcap_directory + pcap_file) as f:
+        return read_echo_packets(f, network_key)
+
+
+def get_filtered_packets(
+    pcap_directory: str,
+    pcap_file: str,
+    network_key: Optional[bytes] = None,
+    backend: str = "auto",
+) -> EchoCapture:
     """
-    Returns lists of responses (sequence numbers) grouped by end node
+    Returns the ICMPv6 echo packets of a pcap file using the chosen backend.
+    "auto" uses the native reader and only falls back to tshark if the native
+    reader can't decode (or decrypt) every frame of the file, e.g. a frame
+    from a short address whose extended address never shows up in the capture.
     """
-    # get end nodes address
-    node_0_address = get_sources_list(node_0)[0]
-    node_2_address = get_sources_list(node_2)[0]
-
-    filtered_sequences_0 = []
-    filtered_sequences_2 = []
-
-    destinations = get_destination_list(central_node)
-    sequences = get_sequences_list(central_node)
-    for i in range(len(destinations)):
-        if destinations[i] == node_0_address:
-            filtered_sequences_0.append(sequences[i])
-        else:
-            filtered_sequences_2.append(sequences[i])
-
-    print(node_0_address, node_2_address)
-
-    return filtered_sequences_0, filtered_sequences_2
-
-
-# extracts a list of sequence numbers from the packets
-def get_sequences_list(tshark_output: list[str]) -> list[int]:
-    return [get_seq_value(packet_string) for packet_string in tshark_output]
-
-
-# extracts the time value from a single packet
-def get_time(packet_string: str) -> str:
-    return packet_string.strip().split(" ")[2]
-
-
-# extracts a list of times from the packets
-def get_times_list(tshark_output: list[str]) -> list[str]:
-    return [get_time(packet_string) for packet_string in tshark_output]
+    if backend == "tshark":
+        return tshark_get_filtered_packets(pcap_directory, pcap_file)
+
+    try:
+        capture = native_get_filtered_packets(pcap_directory, pcap_file, network_key)
+    except PcapDecodeError as e:
+        if backend == "native":
+            raise
+        print(f"native pcap reader failed ({e}), falling back to tshark")
+        return tshark_get_filtered_packets(pcap_directory, pcap_file)
+
+    if capture.undecrypted and backend == "auto":
+        print(
+            f"{capture.undecrypted} frames in {pcap_file} could not be decrypted, "
+            + "falling back to tshark"
+        )
+        try:
+            return tshark_get_filtered_packets(pcap_directory, pcap_file)
+        except FileNotFoundError:
+            print("tshark not found, using the native reader output")
+        except RuntimeError as e:
+            print(f"{e}, using the native reader output")
+
+    return capture
+
+
+# decodes a pcap file once into columns shared by all the stat functions
+# with a cache path, pcaps that haven't changed since the last run are not decoded
+def get_packet_table(
+    pcap_directory: str,
+    pcap_file: str,
+    network_key: Optional[bytes] = None,
+    backend: str = "auto",
+    cache: Optional[str] = None,
+) -> PacketTable:
+    def decode() -> PacketTable:
+        with instrument.stage("decode_pcap", file=pcap_directory + pcap_file):
+            return table_from_capture(
+                get_filtered_packets(pcap_directory, pcap_file, network_key, backend)
+            )
+
+    if cache is None:
+        return decode()
+    return cached_table(cache, pcap_directory + pcap_file, network_key, backend, decode)
+
+
+# maps every address an end node sent requests from to that node's id
+def node_address_index(nodes: dict[int, PacketTable]) -> dict[str, int]:
+    index = {}
+    for node, table in nodes.items():
+        requests = table.src[table.types == ICMPV6_ECHO_REQUEST]
+        for code in np.unique(requests):
+            index.setdefault(table.addresses[code], node)
+    return index
+
+
+def filtered_response_indices(
+    central_node: PacketTable, nodes: dict[int, PacketTable]
+) -> dict[int, np.ndarray]:
+    """
+    Returns the indices of the central node's replies grouped by end node,
+    in capture order. Replies to addresses of no end node are left out.
+    """
+    address_index = node_address_index(nodes)
+    # central node address code -> end node id (-1 if unknown), then one lookup
+    # per reply instead of comparing every reply with every node
+    code_to_node = np.array(
+        [address_index.get(address, -1) for address in central_node.addresses],
+        dtype=np.int32,
+    )
+    replies = np.flatnonzero(central_node.types == ICMPV6_ECHO_REPLY)
+    reply_nodes = code_to_node[central_node.dst[replies]]
 
+    # stable sort groups the replies per node, keeping the capture order
+    order = np.argsort(reply_nodes, kind="stable")
+    grouped_nodes = reply_nodes[order]
+    bounds = np.searchsorted(grouped_nodes, list(nodes), side="left")
+    ends = np.searchsorted(grouped_nodes, list(nodes), side="right")
 
-def get_files(rootdir: str) -> Tuple[list[str], dict[str, list[str]]]:
-    pcap_file_paths = {}
-    config_files = []
+    return {
+        node: replies[order[start:end]] for node, start, end in zip(nodes, bounds, ends)
+    }
 
-    for dir in next(os.walk(rootdir))[1]:
-        pcap_dirs = [x for x in next(os.walk(rootdir + "/" + dir))[1] if "pcap" in x]
-        config_file = dir + ".cfg"
-        config_files.append(config_file)
-        for pcap_dir in pcap_dirs:
-            pcap_files = os.listdir(os.path.join(rootdir, dir, pcap_dir))
-            pcap_file_paths_list = []
-            for pcap_file in pcap_files:
-                pcap_file_paths_list.append(
-                    os.path.join(rootdir, dir, pcap_dir, pcap_file)
-                )
-        pcap_file_paths.update({dir: pcap_file_paths_list})
 
-    return config_files, pcap_file_paths
+# the Thread network key from the nodeConfig line, used to decrypt the pcaps
+def get_network_key(config_file_path: str) -> Optional[bytes]:
+    return WfConfig.read(config_file_path).network_key
 
 
 def max_theoretical_ping(config_file_path: str) -> int:
-    with open(config_file_path, "r") as f:
-        max_theoretical = 0
-        for ln in f:
-            if ln.startswith("nodePing"):
-                num = ln.split(" ")[3]
-                max_theoretical = max_theoretical + int(num)
+    return WfConfig.read(config_file_path).max_theoretical_ping
+
 
-    return max_theoretical
+# the ids of the nodes that send pings (nodePing[X] lines of the config)
+def get_ping_nodes(config_file_path: str) -> list[int]:
+    return WfConfig.read(config_file_path).ping_nodes
 
 
-# used as a key for sorting the pcap directories (based on sensitivity)
-def extract_sensitivity(line):
-    # everything after "s-" (sensitivity)
-    post_sens = line.split("-")[1]
-    sens_end_index = post_sens.find("_")
-    return int(post_sens[0:sens_end_index])
+# {node id: pcap file name} of every node pcap in a pcap directory, compressed
+# pcaps are listed by their original name (see archive.open_output)
+def node_pcap_files(pcap_directory: str) -> dict[int, str]:
+    pcap_files = {}
+    for file_name in os.listdir(pcap_directory):
+        pcap_file = output_name(file_name)
+        match = NODE_PCAP_PATTERN.match(pcap_file) if pcap_file else None
+        if match:
+            pcap_files[int(match.group(1))] = pcap_file
+    return dict(sorted(pcap_files.items()))
 
 
-# return type -> Tuple[list[int], list[int]]:
-def retries_per_unique_sequence_number(sequences: list[int]):
+def retries_per_unique_sequence_number(
+    sequences: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
     """
     Returns the number of retries for each unique sequence number in the pcap file.
     """
-    unique_values, counts = np.unique(sequences, return_counts=True)
-    retries = [count - 1 for count in counts]
-    unique_values = unique_values.tolist()
+    analysis = analyse_retries(sequences)
 
-    return unique_values, retries
+    return analysis.unique_sequences, analysis.retries_per_sequence
 
 
-def retries_per_packet(sequences: list[int]) -> list[int]:
+def retries_per_packet(sequences: np.ndarray) -> list[int]:
     """
-    This returns the number of retries sequentially (for the entire pcap)
-    by tracking repitions in count_retries.
+    This returns the number of retries sequentially (for the entire pcap).
     Includes retries with value 0 (packet was sent Once, with no re-attempts).
     Can be used to track retries over time
     """
 
-    retries = []
-    count_retries = 0
-    # these two values are different to ensure they don't get treated as ==
-    prev_value = -1
-    current_value = 0
-    for sequence in sequences:
-        current_value = sequence
-        if current_value == prev_value and current_value != 0 and prev_value != 0:
-            count_retries += 1
-            retries.append(count_retries)
-        elif current_value != prev_value and current_value != 0 and prev_value != 0:
-            # the count has reset. store, and reset to 0
-            retries.append(count_retries)
-            count_retries = 0
+    return retry_analysis.retries_per_packet(sequences).tolist()
 
-        prev_value = current_value
 
-        # print(f"loop state. {current_value}, {prev_value}, {count_retries}")
+def get_stats(
+    pcap_directory, config_file_path, backend="auto", cache=None, central_node=None
+) -> dict[str, Any]:
+    # the pcaps and airline.log are decoded straight away
+    tables, log_events = submit_run(
+        None, config_file_path, pcap_directory, backend, cache
+    )
+    return collect_run(
+        config_file_path, pcap_directory, tables, log_events, central_node
+    )
+
 
-    return retries
+# the node answering the pings: given, or the non pinging node with most replies
+def find_central_node(
+    tables: dict[int, PacketTable], ping_nodes: list[int], central_node=None
+) -> int:
+    if central_node is not None:
+        return central_node
+    candidates = [node for node in tables if node not in ping_nodes]
+    if not candidates:
+        raise ValueError(f"no pcap of a node that doesn't ping (pinging {ping_nodes})")
+    return max(
+        candidates,
+        key=lambda node: int(np.count_nonzero(tables[node].types == ICMPV6_ECHO_REPLY)),
+    )
 
 
-def get_stats(pcap_directory, config_file_path) -> dict[str, Any]:
-    print(f"stats for pcap {pcap_directory} and config {config_file_path}")
+def timing_stats(
+    tables: dict[int, PacketTable],
+    central: int,
+    requests: dict[int, np.ndarray],
+    request_times: dict[int, np.ndarray],
+    retries: dict[int, RetryAnalysis],
+    response_indices: dict[int, np.ndarray],
+) -> dict[str, Any]:
+    """
+    Matches every end node's requests with the central node's replies to it
+    and builds the latency stats and the sliding window series (see
+    latency_analysis). Each pcap's times are relative to its own first frame,
+    so they are moved to absolute time (PacketTable.start) first.
+    """
     stats = dict[str, Any]()
-    packets_list_node0 = tshark_get_filtered_packets(
-        pcap_directory, pcap_file="pkt-0-0.pcap"
+    central_table = tables[central]
+    reply_times = central_table.start + central_table.times
+    latency = {
+        node: match_replies(
+            requests[node],
+            tables[node].start + request_times[node],
+            central_table.seqs[indices],
+            reply_times[indices],
+        )
+        for node, indices in response_indices.items()
+    }
+
+    for node, node_latency in latency.items():
+        stats[f"answered_requests_{node}"] = int(
+            np.count_nonzero(node_latency.answered)
+        )
+    stats["answered_requests"] = sum(
+        stats[f"answered_requests_{node}"] for node in latency
     )
-    packets_list_node1 = tshark_get_filtered_packets(
-        pcap_directory, pcap_file="pkt-1-0.pcap"
+    latencies = np.concatenate(
+        [node_latency.latencies for node_latency in latency.values()] or [[]]
     )
-    packets_list_node2 = tshark_get_filtered_packets(
-        pcap_directory, pcap_file="pkt-2-0.pcap"
+    answered = latencies[~np.isnan(latencies)]
+    stats["latency_mean_s"] = float(answered.mean()) if answered.size else None
+    for percentile, value in latency_percentiles(latencies).items():
+        stats[f"latency_p{percentile}_s"] = value
+    stats["latency_max_s"] = float(answered.max()) if answered.size else None
+
+    # time 0 of the windows is the first frame of any capture
+    captured = [table for table in tables.values() if len(table)]
+    origin = min((table.start for table in captured), default=0.0)
+    duration = max(
+        (table.start + table.times[-1] - origin for table in captured), default=0.0
     )
 
-    sequence_list_0 = get_sequences_list(packets_list_node0)
-    sequence_list_2 = get_sequences_list(packets_list_node2)
-    # link retries and times together (via sequence?)
-    time_list_0 = get_times_list(packets_list_node0)
-    time_list_2 = get_times_list(packets_list_node2)
+    def relative(times: list[np.ndarray]) -> np.ndarray:
+        return np.concatenate(times or [[]]) - origin
+
+    retry_times = []
+    for node, analysis in retries.items():
+        # every attempt but the first of each run of the same sequence number
+        retried = np.ones(len(request_times[node]), dtype=bool)
+        retried[analysis.run_starts] = False
+        retry_times.append(tables[node].start + request_times[node][retried])
+    windows = window_series(
+        relative([tables[node].start + times for node, times in request_times.items()]),
+        relative(retry_times),
+        relative([node_latency.reply_times for node_latency in latency.values()]),
+        answered,
+        duration,
+    )
+    stats["peak_throughput_per_s"] = float(windows.throughput.max())
+
+    # per unique sequence number, like retries_per_unique_sequence_node_*
+    for node, node_latency in latency.items():
+        stats[f"latency_{node}"] = node_latency.latencies.tolist()
+    for field, series in windows._asdict().items():
+        stats[f"window_{field}"] = series.tolist()
+    return stats
+
+
+def stats_from_tables(
+    tables: dict[int, PacketTable],
+    config_file_path,
+    central_node=None,
+    log_events: Optional[LogEvents] = None,
+) -> dict[str, Any]:
+    """
+    Builds the stats of a run from its decoded pcaps ({node id: table}).
+    Every node except the central one gets its own set of per node columns.
+    log_events (from the run's airline.log) adds the SNR drop columns.
+    """
+    stats = dict[str, Any]()
+    # the config is parsed once, the run params come from its JSON file
+    config = WfConfig.read(config_file_path)
+    ping_nodes = config.ping_nodes
+    central = find_central_node(tables, ping_nodes, central_node)
+    end_nodes = {node: table for node, table in tables.items() if node != central}
+    central_table = tables[central]
 
     # the responses from central sent to (and filtered by) end nodes
-    filtered_responses_0, filtered_responses_2 = filtered_response_sequences(
-        packets_list_node1, packets_list_node0, packets_list_node2
+    response_indices = filtered_response_indices(central_table, end_nodes)
+    filtered_responses = {
+        node: central_table.seqs[indices] for node, indices in response_indices.items()
+    }
+
+    # requests sent by each end node
+    requests = {
+        node: table.seqs[table.types == ICMPV6_ECHO_REQUEST]
+        for node, table in end_nodes.items()
+    }
+    request_times = {
+        node: table.times[table.types == ICMPV6_ECHO_REQUEST]
+        for node, table in end_nodes.items()
+    }
+    retries = {
+        node: analyse_retries(requests[node], request_times[node]) for node in end_nodes
+    }
+
+    # total replies sent to the end nodes.
+    stats["replies_from_central_node"] = int(
+        np.count_nonzero(central_table.types == ICMPV6_ECHO_REPLY)
     )
-
-    # total replies sent to node 0 and 2.
-    stats["replies_from_central_node"] = len(packets_list_node1)
     # max theoretical replies (if network had no collisions)
-    stats["max_theoretical"] = max_theoretical_ping(config_file_path)
+    stats["max_theoretical"] = config.max_theoretical_ping
 
-    stats["replies_to_0"] = len(filtered_responses_0)
-    stats["replies_to_2"] = len(filtered_responses_2)
+    for node in end_nodes:
+        stats[f"replies_to_{node}"] = len(filtered_responses[node])
 
-    stats["packets_sent_0"] = len(packets_list_node0)
-    stats["packets_sent_2"] = len(packets_list_node2)
-    stats["total_packets_sent"] = stats["packets_sent_0"] + stats["packets_sent_2"]
+    for node in end_nodes:
+        stats[f"packets_sent_{node}"] = len(requests[node])
+    stats["total_packets_sent"] = sum(len(seqs) for seqs in requests.values())
 
     # unique packets sent (aka highest sequence number)
-    stats["unique_packets_sent_0"] = len(set(sequence_list_0))
-    stats["unique_packets_sent_2"] = len(set(sequence_list_2))
-    stats["total_unique_packets_sent"] = (
-        stats["unique_packets_sent_0"] + stats["unique_packets_sent_2"]
+    for node in end_nodes:
+        stats[f"unique_packets_sent_{node}"] = len(retries[node].unique_sequences)
+    stats["total_unique_packets_sent"] = sum(
+        len(analysis.unique_sequences) for analysis in retries.values()
     )
 
-    stats["retries_per_unique_sequence_node_0"] = retries_per_unique_sequence_number(
-        sequence_list_0
-    )[1]
-
-    stats["retries_per_unique_sequence_node_2"] = retries_per_unique_sequence_number(
-        sequence_list_2
-    )[1]
+    for node in end_nodes:
+        stats[f"retries_per_unique_sequence_node_{node}"] = retries[
+            node
+        ].retries_per_sequence.tolist()
 
-    stats["sequence_numbers_0"] = sequence_list_0
-    stats["sequence_numbers_2"] = sequence_list_2
+    for node in end_nodes:
+        stats[f"sequence_numbers_{node}"] = requests[node].tolist()
 
-    stats["time_0"] = time_list_0
-    stats["time_2"] = time_list_2
+    for node in end_nodes:
+        stats[f"time_{node}"] = request_times[node].tolist()
 
     # Metrics central node
     # A) total replies / total sent (to central node)
@@ -239,69 +444,288 @@ def get_stats(pcap_directory, config_file_path) -> dict[str, Any]:
 
     # Metrics end nodes
     # C) X requests were sent, Y were unique"
-    stats["Node_0_request_stat"] = (
-        f'Node 0: {stats["packets_sent_0"]} requests were sent, '
-        + f'{stats["unique_packets_sent_0"]} were unique'
+    for node in end_nodes:
+        stats[f"Node_{node}_request_stat"] = (
+            f'Node {node}: {stats[f"packets_sent_{node}"]} requests were sent, '
+            + f'{stats[f"unique_packets_sent_{node}"]} were unique'
+        )
+
+    # request -> reply latency and the sliding window series
+    stats.update(
+        timing_stats(
+            tables, central, requests, request_times, retries, response_indices
+        )
     )
 
-    stats["Node_2_request_stat"] = (
-        f'Node 2: {stats["packets_sent_2"]} requests were sent, '
-        + f'{stats["unique_packets_sent_2"]} were unique'
-    )
-
-    config_params = [float(s) for s in re.findall(r"-?\d+\.?\d*", config_file_path)]
+    # SNR drops (the HNP) seen by airline
+    stats.update(log_stats(log_events))
 
-    stats["n"] = config_params[0]
-    stats["t"] = config_params[1]
-    stats["s"] = config_params[2]
-    stats["x"] = config_params[3]
-    stats["p"] = config_params[4]
+    params = run_params(config_file_path)
+    stats["n"] = float(params.n)
+    stats["t"] = float(params.t)
+    stats["s"] = float(params.s)
+    stats["x"] = float(params.x)
+    stats["p"] = float(params.p)
 
     return stats
 
 
+# runs fn in the executor, or straight away (as a finished future) if None
+def _submit(executor: Optional[Executor], fn, *args) -> Future:
+    if executor is not None:
+        return executor.submit(fn, *args)
+    future: Future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def submit_run(
+    executor: Optional[Executor],
+    config_file_path,
+    pcap_directory: str,
+    backend="auto",
+    cache=None,
+) -> Tuple[dict[int, Future], Future]:
+    """
+    Submits the decoding of a run's pcaps and airline.log to executor (done
+    straight away if None). Returns the futures ({node id: table}, log events)
+    to pass to collect_run.
+    """
+    network_key = get_network_key(config_file_path)
+    tables = {
+        node: _submit(
+            executor, get_packet_table, pcap_directory, f, network_key, backend, cache
+        )
+        for node, f in node_pcap_files(pcap_directory).items()
+    }
+    log_events = _submit(executor, run_log_events, pcap_directory)
+    return tables, log_events
+
+
+# the stats of a run submitted with submit_run, once it is decoded
+def collect_run(
+    config_file_path,
+    pcap_directory: str,
+    tables: dict[int, Future],
+    log_events: Future,
+    central_node=None,
+) -> dict[str, Any]:
+    print(f"stats for pcap {pcap_directory} and config {config_file_path}")
+    with instrument.stage("get_stats", config=str(config_file_path)):
+        return stats_from_tables(
+            {node: table.result() for node, table in tables.items()},
+            config_file_path,
+            central_node,
+            log_events.result(),
+        )
+
+
 # parent function for get_stats()
-def config_pcap_get_stats(rootdir):
+def config_pcap_get_stats(
+    rootdir,
+    backend="auto",
+    workers=1,
+    cache=None,
+    central_node=None,
+    on_stats=None,
+    sensitivities=None,
+    positions=None,
+    ping_sizes=None,
+    all_runs=False,
+    replicates=False,
+    config_dir="../config",
+):
+    """
+    Returns the stats of the runs in the run catalog of rootdir (see
+    run_catalog.find_runs for the filters and the order). Without a catalog,
+    one is built from the folders under rootdir first.
+    With workers > 1 the pcaps are decoded in a process pool, at most
+    IN_FLIGHT_PER_WORKER runs per worker ahead of the run being collected.
+    With a cache path, only pcaps that are new or changed are decoded.
+    A run that fails is reported and left out, the rest of the batch carries on.
+    If on_stats is given, it is called with (run id, stats) as each run
+    finishes and the stats are not accumulated (an empty list is returned).
+    """
+    catalog = catalog_path(rootdir)
+    if not os.path.exists(catalog):
+        added = rebuild_catalog(rootdir, config_dir)
+        print(f"run catalog {catalog} created with {added} runs")
+    catalog_runs = find_runs(
+        catalog, sensitivities, positions, ping_sizes, all_runs, replicates
+    )
+    with instrument.stage("config_pcap_get_stats", workers=workers):
+        return _config_pcap_get_stats(
+            catalog_runs, backend, workers, cache, central_node, on_stats
+        )
+
+
+def _config_pcap_get_stats(
+    catalog_runs: list[CatalogRun], backend, workers, cache, central_node, on_stats
+):
     all_stats = []
-    config_files, pcap_file_paths = get_files(rootdir)
-    # the first sort, sorts all paths by increasing each parameter in order
-    config_files.sort()
-    # but instead of -105 to -99 sensitivity we want to decrease sensitivity
-    # decrease the sensitivites from the sorted lists (by ignoring the -ve sign)
-    config_files.sort(key=extract_sensitivity)
-    for path in config_files:
+    extracted = 0
+    failures = []
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    # runs submitted and not collected yet, their decoded tables are held in
+    # their futures, so only a few runs per worker are submitted ahead
+    in_flight: deque = deque()
+    window = IN_FLIGHT_PER_WORKER * workers if executor is not None else 1
+
+    def collect_oldest():
+        nonlocal extracted
+        # collected in submission order so the output order stays deterministic
+        run_id, config_file_path, pcap_dir, tables, log_events = in_flight.popleft()
+        try:
+            stats = collect_run(
+                config_file_path, pcap_dir, tables, log_events, central_node
+            )
+        except Exception as e:
+            failures.append((run_id, e))
+            return
+        extracted += 1
+        if on_stats is not None:
+            with instrument.stage("export_stats", run=run_id):
+                on_stats(run_id, stats)
+        else:
+            # all stats can also be a dict using config or pcap_dir as key
+            all_stats.append(stats)
+
+    for run in catalog_runs:
         print("------------------" * 4)
-        config_file_path = os.path.join("../config", path)
+        config_file_path = run.config_file
         print(f"Path: {config_file_path}")
-        # config file is key to access pcap files
-        config_file_key = os.path.basename(path).split(".")[0]
-        # using any pcap path ([0] was chosen) access the full parent directory
-        pcap_dir = os.path.dirname(pcap_file_paths[config_file_key][0])
         # adds required trailing slash if not present, no change if present
-        pcap_dir = os.path.join(pcap_dir, "")
+        pcap_dir = os.path.join(run.pcap_dir, "")
         print("Pcap directory to extract/build stats from", pcap_dir)
-        stats = get_stats(pcap_dir, config_file_path)
-        # all stats can also be a dict using config or pcap_dir as key
-        all_stats.append(stats)
-    return all_stats
-
+        try:
+            tables, log_events = submit_run(
+                executor, config_file_path, pcap_dir, backend, cache
+            )
+        except Exception as e:
+            failures.append((run.run_id, e))
+            continue
+        in_flight.append((run.run_id, config_file_path, pcap_dir, tables, log_events))
+        if len(in_flight) >= window:
+            collect_oldest()
+    while in_flight:
+        collect_oldest()
+
+    if executor is not None:
+        executor.shutdown()
+
+    for run_id, e in failures:
+        print(f"FAILED {run_id}: {type(e).__name__}: {e}")
+    print(f"{extracted} runs extracted, {len(failures)} failed")
 
-def export_stats_to_csv(
-    all_stats, filename="../outputs/hidden_node_simulation_export.csv"
-):
-    fields = all_stats[0].keys()
-    with open(filename, "w") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fields)
-        writer.writeheader()
-        writer.writerows(all_stats)
+    return all_stats
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extract stats from the Whitefield simulation pcap files."
+    )
+    parser.add_argument(
+        "csv",
+        nargs="?",
+        default="",
+        help="output csv (default ../outputs/hidden_node_simulation_export.csv)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=PCAP_BACKENDS,
+        default="auto",
+        help="pcap decoder, auto uses the native reader with a tshark fallback",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes decoding pcaps, 0 uses every core",
+    )
+    parser.add_argument(
+        "--cache",
+        default=DEFAULT_CACHE_PATH,
+        help=f"decoded pcap cache (default {DEFAULT_CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="decode every pcap, without reading or writing the cache",
+    )
+    parser.add_argument(
+        "--central-node",
+        type=int,
+        default=None,
+        help="id of the node answering the pings (default: detected per run)",
+    )
+    parser.add_argument(
+        "--series",
+        default=None,
+        help="raw per packet series output (default <csv>_series.parquet)",
+    )
+    parser.add_argument(
+        "--sensitivities",
+        type=float,
+        nargs="+",
+        help="only extract runs of these receive sensitivities, e.g. -99 -100",
+    )
+    parser.add_argument(
+        "--positions",
+        type=int,
+        nargs="+",
+        help="only extract runs of these node position iterations (x)",
+    )
+    parser.add_argument(
+        "--ping-sizes",
+        type=int,
+        nargs="+",
+        help="only extract runs of these ping sizes",
+    )
+    parser.add_argument(
+        "--all-runs",
+        action="store_true",
+        help="extract every backed up run of each config, including runs that "
+        + "timed out or were stopped early (default: the latest ok run)",
+    )
+    parser.add_argument(
+        "--replicates",
+        action="store_true",
+        help="also extract the seeded runs of replicates.py (several per point, "
+        + "so the export can't be reported)",
+    )
+    parser.add_argument(
+        "--rebuild-catalog",
+        action="store_true",
+        help="add runs backed up without the run catalog to it first",
+    )
+    instrument.add_trace_arguments(parser)
+    args = parser.parse_args()
+
     rootdir = "../simulation_outputs"
-    all_stats = config_pcap_get_stats(rootdir)
-    if len(sys.argv) == 1:
-        export_stats_to_csv(all_stats)
-    elif str(sys.argv[1]) == "":
-        export_stats_to_csv(all_stats)
-    else:
-        export_stats_to_csv(all_stats, filename=str(sys.argv[1]))
+    if args.rebuild_catalog:
+        print(f"{rebuild_catalog(rootdir)} runs added to the run catalog")
+    workers = args.workers or os.cpu_count() or 1
+    cache = None if args.no_cache else args.cache
+    filename = args.csv or "../outputs/hidden_node_simulation_export.csv"
+    with instrument.tracing(args.trace, args.trace_format):
+        with StatsExporter(filename, args.series) as exporter:
+            config_pcap_get_stats(
+                rootdir,
+                args.backend,
+                workers,
+                cache,
+                args.central_node,
+                exporter.write,
+                args.sensitivities,
+                args.positions,
+                args.ping_sizes,
+                args.all_runs,
+                args.replicates,
+            )
+    print(f"summary written to {exporter.summary_path}")
+    print(f"raw series written to {exporter.series_path}")
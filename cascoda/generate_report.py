@@ -1,51 +1,163 @@
-import math
-import os
+import argparse
 import re
-import sys
 
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 from fpdf import FPDF
 
+from cascoda import instrument
+from cascoda.report_plots import plot_specs, render_plots
+
+# the summary columns the report uses, with the request stat of every end node
+# (REQUEST_STAT_PATTERN) after the first two, everything else is skipped
+REPORT_COLUMNS = [
+    "%_responded",
+    "network_efficiency_%",
+    "n",
+    "t",
+    "s",
+    "x",
+    "p",
+]
+# n, t, s, x and p are inferred, the labels print them as they are stored
+REPORT_DTYPES = {
+    "%_responded": "float64",
+    "network_efficiency_%": "float64",
+}
+REQUEST_STAT_PATTERN = re.compile(r"Node_(\d+)_request_stat")
+# widths of the table columns before the request stats, which share the rest
+TABLE_COLUMN_WIDTHS = (32, 28, 40)
+TABLE_WIDTH = 188
+CHUNK_ROWS = 100_000
+REPORT_PATH = "../outputs/Cascoda_Report.pdf"
+
+
+def filter_runs(df, sensitivities=None, distances=None):
+    # keeps the runs of the given receive sensitivities / node distances (x * 5)
+    if sensitivities is not None:
+        df = df[df["s"].isin(sensitivities)]
+    if distances is not None:
+        df = df[(df["x"] * 5).isin(distances)]
+    return df
+
+
+def request_stat_columns(header) -> list[str]:
+    # the Node_<node>_request_stat columns of a stats csv header, by node id
+    nodes = sorted(
+        int(match.group(1))
+        for match in map(REQUEST_STAT_PATTERN.fullmatch, header)
+        if match
+    )
+    return [f"Node_{node}_request_stat" for node in nodes]
+
 
-def get_data(filepath="../outputs/hidden_node_simulation_export.csv"):
-    df = pd.read_csv(filepath)
-    reduced_df = df[
-        [
-            "%_responded",
-            "network_efficiency_%",
-            "Node_0_request_stat",
-            "Node_2_request_stat",
-            "n",
-            "t",
-            "s",
-            "x",
-            "p",
-        ]
+def end_nodes(df) -> list[int]:
+    # the nodes with a request stat column (every node but the central one)
+    return [
+        int(REQUEST_STAT_PATTERN.fullmatch(column).group(1))
+        for column in request_stat_columns(df.columns)
     ]
-    sens_pos_df = df[["s", "x"]]
-
-    sim_run = []
-    for index, row in reduced_df.iterrows():
-        sim_run.append(
-            "n="
-            + str(row["n"])
-            + ", t="
-            + str(row["t"])
-            + ", s="
-            + str(row["s"])
-            + ", x="
-            + str(row["x"] * 5)
-            + ", p="
-            + str(row["p"])
+
+
+def table_widths(columns: int) -> tuple:
+    # the request stat columns share the width left by TABLE_COLUMN_WIDTHS
+    stats = columns - len(TABLE_COLUMN_WIDTHS)
+    if stats <= 0:
+        return TABLE_COLUMN_WIDTHS[:columns]
+    rest = TABLE_WIDTH - sum(TABLE_COLUMN_WIDTHS)
+    return TABLE_COLUMN_WIDTHS + (rest / stats,) * stats
+
+
+@instrument.timed("report.get_data")
+def get_data(
+    filepath="../outputs/hidden_node_simulation_export.csv",
+    sensitivities=None,
+    distances=None,
+):
+    """
+    Loads the report columns of the stats csv, in chunks filtered to the given
+    sensitivities and node distances (all runs if None), so the raw per packet
+    columns and runs left out are never held in memory.
+    """
+    request_stats = request_stat_columns(pd.read_csv(filepath, nrows=0).columns)
+    columns = REPORT_COLUMNS[:2] + request_stats + REPORT_COLUMNS[2:]
+    chunks = pd.read_csv(
+        filepath,
+        usecols=columns,
+        dtype={**REPORT_DTYPES, **{column: "object" for column in request_stats}},
+        chunksize=CHUNK_ROWS,
+    )
+    reduced_df = pd.concat(
+        [filter_runs(chunk, sensitivities, distances) for chunk in chunks],
+        ignore_index=True,
+    )[columns]
+    # runs without some end node (another central node) leave its cells empty
+    reduced_df[request_stats] = reduced_df[request_stats].fillna("")
+    if reduced_df.empty:
+        raise ValueError(f"no runs to report in {filepath}")
+    # the plots have one value per sensitivity and node distance
+    duplicated = reduced_df[reduced_df.duplicated(["s", "x"], keep=False)]
+    if not duplicated.empty:
+        points = sorted(set(zip(duplicated["s"], duplicated["x"])))
+        raise ValueError(
+            f"{filepath} has more than one run of the (s, x) points {points}, "
+            + "the report needs one run per point (export the stats without "
+            + "--all-runs)"
         )
+    sens_pos_df = reduced_df[["s", "x"]]
+
+    sim_run = (
+        "n="
+        + reduced_df["n"].astype(str)
+        + ", t="
+        + reduced_df["t"].astype(str)
+        + ", s="
+        + reduced_df["s"].astype(str)
+        + ", x="
+        + (reduced_df["x"] * 5).astype(str)
+        + ", p="
+        + reduced_df["p"].astype(str)
+    )
     sim_run_df = reduced_df.drop(columns=["n", "t", "s", "x", "p"])
     sim_run_df.insert(0, "sim_run_params", sim_run)
 
     return reduced_df, sens_pos_df, sim_run_df
 
 
-def hdp_stats(pdf, col_width, df, sens_pos_df):
+def hdp_text(df, sens_pos_df):
+    """
+    The text of the "Hidden Node Detected" column: the static simulation
+    parameters, and one line per receive sensitivity. Computed once per report,
+    the column is repeated on every table page.
+    """
+    params = (
+        "  - Number Of Nodes (n) = "
+        + str(int(df["n"].unique()[0]))
+        + "\n  - Simulation Run Time (t) = "
+        + str(int(df["t"].unique()[0]))
+        + "".join(
+            f"\n  - Node {node} Ping (p) = ping ff02::1 "
+            + str(int(df["p"].unique()[0]))
+            + " 500 0.01 1"
+            for node in end_nodes(df)
+        )
+        + "\n\nHNP = Hidden Node Problem"
+    )
+    # largest distance reached per sensitivity
+    max_x = sens_pos_df.groupby("s", sort=False)["x"].max()
+    lines = [
+        "Receive sensitivity (s) "
+        + str(sens)
+        + " encountered HNP at a linear node distance (x) of "
+        + str(x * 5)
+        + "."
+        for sens, x in max_x.items()
+    ]
+    return params, lines
+
+
+def hdp_stats(pdf, col_width, df, sens_pos_df, text=None):
+    params, lines = text or hdp_text(df, sens_pos_df)
     pdf.set_font("helvetica", style="", size=9)
     pdf.multi_cell(
         w=col_width,
@@ -57,35 +169,86 @@ def hdp_stats(pdf, col_width, df, sens_pos_df):
     pdf.multi_cell(
         w=col_width,
         h=5,
-        txt="  - Number Of Nodes (n) = "
-        + str(int(df["n"].unique()[0]))
-        + "\n  - Simulation Run Time (t) = "
-        + str(int(df["t"].unique()[0]))
-        + "\n  - Node 0 Ping (p) = ping ff02::1 "
-        + str(int(df["p"].unique()[0]))
-        + " 500 0.01 1"
-        + "\n  - Node 2 Ping (p) = ping ff02::1 "
-        + str(int(df["p"].unique()[0]))
-        + " 500 0.01 1"
-        + "\n\nHNP = Hidden Node Problem",
+        txt=params,
         align="L",
         border=0,
         ln=2,
     )
     pdf.cell(w=col_width, h=5, ln=2)
-    for sens in sens_pos_df["s"].unique():
-        line = (
-            "Receive sensitivity (s) "
-            + str(sens)
-            + " encountered HNP at a linear node distance (x) of "
-            + str(sens_pos_df.loc[sens_pos_df["s"] == sens].max()[1] * 5)
-            + "."
-        )
+    for line in lines:
         pdf.multi_cell(w=col_width, h=5, txt=line, border=0, ln=2)
 
     return pdf.get_y()
 
 
+def row_heights(df, font_size):
+    """
+    Line height of every table row: a row with a cell of more than 2 words gets
+    font_size * words / 2 (of the last such cell), other rows font_size.
+    """
+    words = df.astype(str).apply(lambda column: column.str.split().str.len())
+    long_cells = words.where(words > 2)
+    last_long = long_cells.ffill(axis=1).iloc[:, -1]
+    heights = np.where(last_long.notna(), font_size * last_long / 2, font_size)
+    return np.floor(heights)
+
+
+def page_breaks(heights, start_y, page_end=190):
+    """
+    Rows after which the table continues on a new page (at y = 10), given the
+    row heights and the y of the first row.
+    """
+    breaks = set()
+    y = start_y
+    for index, height in enumerate(heights[:-1]):
+        y += height
+        if y >= page_end:
+            breaks.add(index)
+            y = 10
+    return breaks
+
+
+def wrap_text(pdf, txt, w, cache=None):
+    """
+    Splits txt into the lines pdf.multi_cell(w=w) prints, with the current font.
+    cache is a dict (shared by the cells of one table) keeping the lines of each
+    text per font, the table repeats most cells.
+    """
+    if cache is None:
+        return pdf.multi_cell(w=w, txt=txt, split_only=True)
+    key = (pdf.font_family, pdf.font_style, pdf.font_size, w, txt)
+    if key not in cache:
+        cache[key] = pdf.multi_cell(w=w, txt=txt, split_only=True)
+    return cache[key]
+
+
+def table_cell(pdf, w, h, txt, fill, max_line_height, wrap_cache=None):
+    """
+    Same output as pdf.multi_cell(w, h, txt, border="LR", ln=3, align="C", fill,
+    max_line_height), printing the pre-wrapped lines with one cell() each.
+    """
+    lines = wrap_text(pdf, txt, w, wrap_cache)
+    y = pdf.y
+    for index, line in enumerate(lines):
+        is_last_line = index == len(lines) - 1
+        if h > max_line_height and not is_last_line:
+            cell_height = max_line_height
+            h -= cell_height
+        else:
+            cell_height = h
+        pdf.cell(
+            w,
+            cell_height,
+            line,
+            border="LR",
+            ln=0 if is_last_line else 2,
+            align="C",
+            fill=fill,
+        )
+    pdf.y = y
+
+
+@instrument.timed("report.table")
 def colored_table(
     pdf,
     headings,
@@ -93,8 +256,10 @@ def colored_table(
     x_offset,
     col_width_1,
     reduced_df,
-    col_widths=(32, 28, 40, 44, 44),
+    sens_pos_df,
+    col_widths=None,
 ):
+    col_widths = col_widths or table_widths(len(headings))
     pdf.set_x(x_offset)
     pdf.set_font("helvetica", style="", size=9)
     # Colors, line width and bold font:
@@ -111,62 +276,51 @@ def colored_table(
     pdf.set_text_color(0)
     pdf.set_font()
 
-    lh_list = []  # list with proper line_height for each row
-    use_default_height = 0  # flag
-    # create lh_list of line_heights which size is equal to num rows of data
-    default_line_height = pdf.font_size
-    for index, row in df.iterrows():
-        for datum in row:
-            word_list = str(datum).split()
-            number_of_words = len(word_list)  # how many words
-            if (
-                number_of_words > 2
-            ):  # names and cities formed by 2 words like Los Angeles are ok)
-                use_default_height = 1
-                new_line_height = pdf.font_size * (
-                    number_of_words / 2
-                )  # new height change according to data
-        if not use_default_height:
-            lh_list.append(default_line_height)
-        else:
-            lh_list.append(new_line_height)
-            use_default_height = 0
+    # the whole layout is planned before anything is drawn
+    line_heights = row_heights(df, pdf.font_size)
+    breaks = page_breaks(line_heights, pdf.get_y())
+    reference = {"text": hdp_text(reduced_df, sens_pos_df)}
+    wrap_cache: dict = {}
+    columns = [df[column].astype(str).tolist() for column in df.columns]
 
     fill = False
-    for index, row in df.iterrows():
+    for index, line_height in enumerate(line_heights):
         pdf.set_x(x_offset)
-        count = 0
-        for col in col_widths:
-            line_height = math.floor(lh_list[index])
-            pdf.multi_cell(
-                w=col,
-                h=line_height,
-                txt=str(row[count]),
-                border="LR",
-                ln=3,
-                align="C",
-                fill=fill,
-                max_line_height=pdf.font_size + 1.4,
+        for col, cells in zip(col_widths, columns):
+            table_cell(
+                pdf,
+                col,
+                line_height,
+                cells[index],
+                fill,
+                pdf.font_size + 1.4,
+                wrap_cache,
             )
-            count = count + 1
         fill = not fill
         pdf.ln(line_height)
         pdf.set_x(x_offset)
         pdf.cell(sum(col_widths), 0, "", "T")
-        if pdf.get_y() >= 190 and not df.shape[0] == (index + 1):
+        if index in breaks:
             # pdf.add_page(same=True)
-            fill_new_page(pdf, col_width_1, reduced_df)
+            fill_new_page(pdf, col_width_1, reduced_df, sens_pos_df, reference)
             pdf.set_xy(x_offset, 10)
             pdf.cell(sum(col_widths), 0, "", "T")
 
 
-def fill_new_page(pdf, col_width_1, df):
+def fill_new_page(pdf, col_width_1, df, sens_pos_df, reference=None):
+    """
+    Starts a new table page, with the "Hidden Node Detected" column repeated.
+    reference is a dict cache (shared by the pages of one table): the column is
+    the same on every page, so its text is computed once.
+    """
     pdf.add_page(same=True)
     # HND
     pdf.set_font("helvetica", style="I", size=8)
     pdf.cell(txt="Repeated for reference.", ln=1)
     pdf.ln()
-    hdp_stats(pdf, col_width_1, df, sens_pos_df)
+    pdf.set_font("helvetica", style="", size=9)
+    text = None if reference is None else reference.get("text")
+    hdp_stats(pdf, col_width_1, df, sens_pos_df, text)
     # Column break
     pdf.set_xy((10 + col_width_1 + 4), 10)
     pdf.set_fill_color(r=255, g=70, b=84)
@@ -174,82 +328,32 @@ def fill_new_page(pdf, col_width_1, df):
     pdf.set_fill_color(224, 235, 255)
 
 
-# used as a key for sorting the plot
-def extract_distance(line):
-    dis = int(line.split("_")[4].split(".")[0])
-    return f"{dis:02}"
+@instrument.timed("report.images")
+def insert_image(pdf, images):
+    # images: (name, PNG buffer) pairs, one page each
+    for name, image in images:
+        pdf.add_page(same=True)
+        pdf.image("assets/A4_background.png", x=0, y=0, w=297)
+        pdf.set_font("helvetica", style="B", size=16)
+        pdf.set_y(35)
+        pdf.cell(w=0, h=10, ln=2, txt=name, border=0, align="C")
 
+        plot_width = 170  # mm
+        center_image_x = (297 / 2) - (plot_width / 2)  # at 72dpi: 1 px = 0.352777778 mm
+        center_image_y = 50
+        pdf.image(
+            image, x=center_image_x, y=center_image_y, w=plot_width
+        )  # default image resolution is 72dpi
 
-def insert_image(pdf, image_dir):
-    image_dir_sorted = os.listdir(image_dir)
-    image_dir_sorted.sort()
-    sorted_files = sorted(
-        image_dir_sorted[2:],
-        key=lambda x: float(re.findall("(\d+)", x)[0]),  # noqa: W605
-    )
-    del image_dir_sorted[2:]
-    image_dir_sorted = image_dir_sorted + sorted_files
-    for file in image_dir_sorted:
-        if file.endswith(".png"):
-            image = os.path.join(image_dir, file)
-            pdf.add_page(same=True)
-            pdf.image("assets/A4_background.png", x=0, y=0, w=297)
-            pdf.set_font("helvetica", style="B", size=16)
-            pdf.set_y(35)
-            pdf.cell(w=0, h=10, ln=2, txt=file, border=0, align="C")
-
-            plot_width = 170  # mm
-            center_image_x = (297 / 2) - (
-                plot_width / 2
-            )  # at 72dpi: 1 px = 0.352777778 mm
-            center_image_y = 50
-            pdf.image(
-                image, x=center_image_x, y=center_image_y, w=plot_width
-            )  # default image resolution is 72dpi
-
-
-def make_plots(reduced_df):
-    reduced_df["x"] = reduced_df["x"] * 5
-    reduced_df = reduced_df.rename(columns={"x": "Node Distance"})
-    plot_df = reduced_df[["%_responded", "s", "Node Distance"]].pivot(
-        index="s",
-        columns="Node Distance",
-        values="%_responded",
-    )
-
-    plt.rcParams["figure.autolayout"] = True
-    prop_cycle = plt.rcParams["axes.prop_cycle"]
-    colors = prop_cycle.by_key()["color"]
-
-    ax = plot_df.plot(title="% Responded against Receive Sensitivity per Node Distance")
-    ax.invert_xaxis()
-    ax.set_xlabel("Receive Sensitivity")
-    ax.set_ylabel("% of requests responded to")
-    ax.legend(
-        title="Node Distance",
-        loc="center left",
-        bbox_to_anchor=(1.04, 0.5),
-        borderaxespad=0,
-    )
-    ax.figure.savefig("../outputs/plots/responded_V_rsens_all_nodes.png")
 
-    count = 0
-    for column in plot_df:
-        plt.clf()
-        title = "% Responded against Receive Sensitivity for Node Distance = " + str(
-            column
-        )
-        filename = "../outputs/plots/responded_V_rsens_distance_" + str(column) + ".png"
-        ax = plot_df[column].plot(title=title, legend=False, color=colors[count])
-        ax.invert_xaxis()
-        ax.set_xlabel("Receive Sensitivity")
-        ax.set_ylabel("% of requests responded to")
-        ax.figure.savefig(filename)
-        count = count + 1
-    return
+@instrument.timed("report.plots")
+def make_plots(reduced_df, workers=0):
+    # the combined plot, then one plot per node distance (see report_plots)
+    return render_plots(plot_specs(reduced_df), workers)
 
 
-def make_pdf(reduced_df, sens_pos_df, sim_run_df):
+@instrument.timed("report.make_pdf")
+def make_pdf(reduced_df, sens_pos_df, sim_run_df, workers=0, output=REPORT_PATH):
     pdf = FPDF(orientation="L", unit="mm", format="A4")
     pdf.add_page()
     pdf.set_font("helvetica", style="B", size=16)
@@ -284,11 +388,12 @@ def make_pdf(reduced_df, sens_pos_df, sim_run_df):
         + ' notation described in the "Hidden Node Detected" column.\n'
         + '  - "%_responded" is the percentage of requests responded to.\n'
         + '  - "network_efficiency_%" is the network efficiency'
-        + "(central node replies / max theoretical requests).\n"
-        + '  - "Node_0_request_stat" is the node 0 number of '
-        + "requests sent compared to the number of unique requests.\n"
-        + '  - "Node_2_request_stat" is the node 2 number of '
-        + "requests sent compared to the number of unique requests.",
+        + "(central node replies / max theoretical requests)."
+        + "".join(
+            f'\n  - "Node_{node}_request_stat" is the node {node} number of '
+            + "requests sent compared to the number of unique requests."
+            for node in end_nodes(reduced_df)
+        ),
         border=0,
         align="L",
         max_line_height=pdf.font_size + 1.4,
@@ -302,22 +407,55 @@ def make_pdf(reduced_df, sens_pos_df, sim_run_df):
         (10 + col_width_1 + 10),
         col_width_1,
         reduced_df,
+        sens_pos_df,
     )
 
     # Insert images
-    make_plots(reduced_df)
-    insert_image(pdf, "../outputs/plots/")
+    insert_image(pdf, make_plots(reduced_df, workers))
 
     # save pdf
-    pdf.output("../outputs/Cascoda_Report.pdf", "F")
+    with instrument.stage("report.output"):
+        pdf.output(output, "F")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 1:
-        reduced_df, sens_pos_df, sim_run_df = get_data()
-    elif str(sys.argv[1]) == "":
-        reduced_df, sens_pos_df, sim_run_df = get_data()
-    else:
-        reduced_df, sens_pos_df, sim_run_df = get_data(str(sys.argv[1]))
-
-    make_pdf(reduced_df, sens_pos_df, sim_run_df)
+    parser = argparse.ArgumentParser(description="Build the PDF report.")
+    parser.add_argument(
+        "csv",
+        nargs="?",
+        default="",
+        help="stats csv (default ../outputs/hidden_node_simulation_export.csv)",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=0,
+        help="processes rendering the plots (default 0: all cores)",
+    )
+    parser.add_argument(
+        "--sensitivities",
+        type=float,
+        nargs="+",
+        help="only report these receive sensitivities, e.g. -99 -100",
+    )
+    parser.add_argument(
+        "--distances",
+        type=float,
+        nargs="+",
+        help="only report these node distances (x * 5), e.g. 5 10",
+    )
+    instrument.add_trace_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.tracing(args.trace, args.trace_format):
+        if args.csv == "":
+            reduced_df, sens_pos_df, sim_run_df = get_data(
+                sensitivities=args.sensitivities, distances=args.distances
+            )
+        else:
+            reduced_df, sens_pos_df, sim_run_df = get_data(
+                args.csv, args.sensitivities, args.distances
+            )
+
+        make_pdf(reduced_df, sens_pos_df, sim_run_df, args.workers)
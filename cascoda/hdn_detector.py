@@ -1,53 +1,74 @@
+import argparse
 import json
-import subprocess
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-from cascoda.whitefield import run_simulation
+from cascoda import instrument
+from cascoda.airline_log import HNP_MESSAGE, hnp_in_log
+from cascoda.archive import Archiver, add_compress_argument
+from cascoda.hnp_search import SEARCH_MODES, find_hnp_onset
+from cascoda.scheduler import BatchScheduler
+from cascoda.sweep_store import SweepStore, store_path
+from cascoda.wf_config import RunParams, load_template, parse_positions, write_variant
+from cascoda.whitefield import SIMULATION_OUTPUTS, run_simulation, simulator_version
 
 
-def run_config(s, nP, c, ping, path):
-    # function to run the sim
-    outfile = "wf_ot_n3_t1_s" + str(s) + "_x" + str(c) + "_p" + str(ping) + ".cfg"
-    outfile_path = path + outfile
-
-    command = (
-        "./config-editor.sh -n 3 -t 1 -s "
-        + str(s)
-        + ' -x "'
-        + str(nP)
-        + '" -p "'
-        + str(ping)
-        + '" -i ../config/wf_ot_v1_8.cfg -o '
-        + outfile_path
+def add_resimulate_argument(parser):
+    # the option of the scripts running sweeps to ignore earlier results
+    parser.add_argument(
+        "--resimulate",
+        action="store_true",
+        help="simulate every config again, even those an earlier sweep "
+        + "already has results for",
     )
 
-    subprocess.run(command, shell=True)
 
-    return outfile, outfile_path
+def run_config(s, nP, c, ping, path, seed=None):
+    """
+    Generates the config of one simulation run from the template (in process,
+    no config-editor.sh), with its run params in a JSON file next to it.
+    With a seed, Airline's random seed is set (see WfConfig.set_seed).
+    """
+    params = RunParams(n=3, t=1, s=s, x=c, p=ping)
+    config = load_template().variant(params, parse_positions(nP))
+    if seed is not None:
+        config.set_seed(seed)
+    outfile_path = write_variant(config, params, path, seed)
+
+    return os.path.basename(outfile_path), outfile_path
+
+
+MAX_ITERATIONS = 50
+# the node positions of the first probe, moved apart by nodePos_change
+NODE_POSITIONS = "[0,0,0] [0,10,0] [0,20,0]"
+PING_SIZE = 83
+
+
+def log_hnp(outlog_file, sens, nPos, simulation_outputs):
+    with open(outlog_file, "a") as f:
+        f.writelines(
+            [
+                "\nHidden Node Problem detected at:",
+                "\nrxSensitivity=",
+                str(sens),
+                "\nnodePosition=",
+                nPos,
+                "\n",
+                "\nThe simulations output directories:",
+                json.dumps(simulation_outputs, sort_keys=False, indent=4),
+                "\n",
+            ]
+        )
 
 
 def detect_hnp(log_path, outlog_file, sens, nPos, simulation_outputs):
-    # function that returns False is no hidden node and True is hidden node detected
-    with open(log_path) as airline_log:
-        if "snr <= snr_min, dropped" in airline_log.read():
-            with open(outlog_file, "a") as f:
-                f.writelines(
-                    [
-                        "\nHidden Node Problem detected at:",
-                        "\nrxSensitivity=",
-                        str(sens),
-                        "\nnodePosition=",
-                        nPos,
-                        "\n",
-                        "\nThe simulations output directories:",
-                        json.dumps(simulation_outputs, sort_keys=False, indent=4),
-                        "\n",
-                    ]
-                )
-            return True
-        else:
-            return False
+    if hnp_in_log(log_path):
+        log_hnp(outlog_file, sens, nPos, simulation_outputs)
+        return True
+    else:
+        return False
 
 
 def nodePos_change(nP, c):
@@ -64,53 +85,233 @@ def nodePos_change(nP, c):
     return nPos_changed
 
 
-def workflow():
-    for sens in range(-99, -106, -1):
-        nodePos = "[0,0,0] [0,10,0] [0,20,0]"
-        count = 0
-        # ping is still hardcoded, but is now changeable (like sens and newNodePos)
-        ping = 83
-        hidden_node = False
-        current_date_formatted = datetime.now().strftime("%Y_%m_%d-%H_%M_%S")
-        # create logs folder if not exist
-        Path("../logs").mkdir(exist_ok=True, parents=True)
-        log_file = "../logs/sim_runs_" + current_date_formatted + ".log"
-        with open(log_file, "w") as f:
+def sweep_sensitivity(
+    sens,
+    simulate=run_simulation,
+    search="linear",
+    guess=None,
+    store=None,
+    on_reused=None,
+):
+    """
+    Searches the node distance at which the HNP appears for one receive
+    sensitivity (see hnp_search for the search modes). simulate(config_file_path)
+    runs one simulation. Returns the HNP node position iteration or None.
+    With a store (see sweep_store.SweepStore), configs it has a result for are
+    not simulated again, on_reused(config_file_path, output_dirs) is called for
+    them instead, and the result of every config simulated is added to it.
+    """
+    nodePos = NODE_POSITIONS
+    # ping is still hardcoded, but is now changeable (like sens and newNodePos)
+    ping = PING_SIZE
+    current_date_formatted = datetime.now().strftime("%Y_%m_%d-%H_%M_%S")
+    # create logs folder if not exist
+    Path("../logs").mkdir(exist_ok=True, parents=True)
+    log_file = "../logs/sim_runs_" + current_date_formatted + "_s" + str(sens) + ".log"
+    with open(log_file, "w") as f:
+        f.write("Results from simulation runs started at: " + current_date_formatted)
+    # print("\n")
+
+    probes = {}
+
+    def probe(count):
+        with instrument.stage("probe", s=sens, x=count):
+            return _probe(count)
+
+    def _probe(count):
+        newNodePos = nodePos_change(nodePos, count - 1)
+
+        configfile, configfile_path = run_config(
+            sens, newNodePos, count, ping, "../config/"
+        )
+
+        point = store.find(configfile_path) if store is not None else None
+        if point is not None:
+            simulation_output_logs = point.output_dirs
+            if on_reused is not None:
+                on_reused(configfile_path, simulation_output_logs)
+        else:
+            simulation_output_logs = simulate(configfile_path)
+        airline_log_path = str(simulation_output_logs["log"]) + "/airline.log"
+        # print(f"************* airline log path here {airline_log_path}")
+
+        # For logging purposes. Convert Dict to List of absolute paths
+        printable_sim_output_paths = [
+            str(path.resolve()) for (folder, path) in simulation_output_logs.items()
+        ]
+        probes[count] = (newNodePos, printable_sim_output_paths)
+
+        if point is not None:
+            hidden_node = point.hnp
+        else:
+            with instrument.stage("hnp_check"):
+                hidden_node = hnp_in_log(airline_log_path)
+            if store is not None:
+                store.record(configfile_path, hidden_node, simulation_output_logs)
+        with open(log_file, "a") as f:
             f.write(
-                "Results from simulation runs started at: " + current_date_formatted
+                f"\nProbe x={count} nodePosition={newNodePos}: HNP "
+                + ("detected" if hidden_node else "not detected")
+                + (" (earlier result reused)" if point is not None else "")
             )
-        # print("\n")
+        return hidden_node
 
-        while hidden_node is False:
-            newNodePos = nodePos_change(nodePos, count)
-            count = count + 1
+    onset = find_hnp_onset(probe, search, MAX_ITERATIONS, guess)
 
-            configfile, configfile_path = run_config(
-                sens, newNodePos, count, ping, "../config/"
+    if onset is None:
+        with open(log_file, "a") as f:
+            f.write(
+                f"\nHidden Node problem not detected after {MAX_ITERATIONS} "
+                + f"iterations ({len(probes)} simulations)."
             )
+    else:
+        log_hnp(log_file, sens, *probes[onset])
+        with open(log_file, "a") as f:
+            f.write(f"Found after {len(probes)} simulations ({search} search).\n")
 
-            simulation_output_logs = run_simulation(configfile_path)
-            airline_log_path = str(simulation_output_logs["log"]) + "/airline.log"
-            # print(f"************* airline log path here {airline_log_path}")
+    return onset
 
-            # For logging purposes. Convert Dict to List of absolute paths
-            printable_sim_output_paths = [
-                str(path.resolve()) for (folder, path) in simulation_output_logs.items()
-            ]
 
-            hidden_node = detect_hnp(
-                airline_log_path,
-                log_file,
-                sens,
-                newNodePos,
-                printable_sim_output_paths,
-            )
+def workflow(
+    concurrency=1,
+    retries=1,
+    search="linear",
+    timeout=None,
+    early_stop=False,
+    on_simulated=None,
+    compression=None,
+    reuse=False,
+):
+    """
+    Sweeps every receive sensitivity. With concurrency > 1 the sensitivities are
+    swept in parallel, each simulation running in its own isolated Whitefield
+    working directory (see scheduler.BatchScheduler).
+    With the "neighbour" search, each sweep starts from the most recent HNP
+    distance found for another sensitivity.
+    A simulation still running after timeout seconds is stopped and fails.
+    With early_stop, a simulation is stopped as soon as the HNP is logged (its
+    outputs then only cover the simulation up to that point).
+    on_simulated(config_file_path, output_dirs) is called as each simulation
+    finishes (e.g. to extract its stats while the sweep goes on).
+    With a compression (see archive.COMPRESSIONS), the backed up logs and pcaps
+    are compressed in the background while the next simulations run.
+    With reuse, configs already simulated by an earlier sweep (same config
+    content and Whitefield version, outputs still there) are not simulated
+    again, so an interrupted sweep resumes where it stopped (see sweep_store).
+    on_simulated is called for them too.
+    """
+    store = None
+    if reuse:
+        store = SweepStore(
+            store_path(SIMULATION_OUTPUTS), simulator_version(), early_stop
+        )
+    with Archiver(compression) as archiver:
+        _workflow(
+            concurrency,
+            retries,
+            search,
+            timeout,
+            early_stop,
+            on_simulated,
+            archiver,
+            store,
+        )
+
+
+def _workflow(
+    concurrency, retries, search, timeout, early_stop, on_simulated, archiver, store
+):
+    sensitivities = range(-99, -106, -1)
+    last_onset = [None]
+
+    def simulate(config_file, **kwargs):
+        outputs = run_simulation(
+            config_file,
+            timeout=timeout,
+            stop_on=HNP_MESSAGE if early_stop else None,
+            archiver=archiver,
+            **kwargs,
+        )
+        if on_simulated is not None:
+            on_simulated(config_file, outputs)
+        return outputs
+
+    def sweep(sens, simulate=simulate):
+        onset = sweep_sensitivity(
+            sens, simulate, search, last_onset[0], store, on_simulated
+        )
+        if onset is not None:
+            last_onset[0] = onset
+
+    if concurrency <= 1:
+        for sens in sensitivities:
+            sweep(sens)
+        return
+
+    scheduler = BatchScheduler(
+        concurrency=concurrency, retries=retries, simulate=simulate
+    )
 
-            if count == 50:
-                with open(log_file, "a") as f:
-                    f.write("\nHidden Node problem not detected after 50 iterations.")
-                break
+    def parallel_sweep(sens):
+        try:
+            sweep(sens, scheduler.run)
+        except Exception as e:
+            print(f"Sweep of sensitivity {sens} stopped: {e}")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(parallel_sweep, sensitivities))
+    scheduler.shutdown()
+    print(f"Simulation manifest written to {scheduler.manifest_path}")
 
 
 if __name__ == "__main__":
-    workflow()
+    parser = argparse.ArgumentParser(
+        description="Sweep receive sensitivities until the HNP is detected."
+    )
+    parser.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=1,
+        help="number of simulations run at once in isolated working directories",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="times a failed simulation is retried (with --concurrency > 1)",
+    )
+    parser.add_argument(
+        "--search",
+        choices=SEARCH_MODES,
+        default="linear",
+        help="how node distances are probed: one by one (linear), exponential "
+        + "then bisection (bisect), or bisect from the last HNP distance found "
+        + "(neighbour)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="seconds after which a simulation is stopped and counted as failed",
+    )
+    parser.add_argument(
+        "--early-stop",
+        action="store_true",
+        help="stop each simulation as soon as the HNP shows up in airline.log",
+    )
+    add_compress_argument(parser)
+    add_resimulate_argument(parser)
+    instrument.add_trace_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.tracing(args.trace, args.trace_format):
+        workflow(
+            args.concurrency,
+            args.retries,
+            args.search,
+            args.timeout,
+            args.early_stop,
+            compression=args.compress,
+            reuse=not args.resimulate,
+        )
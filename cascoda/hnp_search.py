@@ -0,0 +1,82 @@
+from typing import Callable, Optional
+
+SEARCH_MODES = ("linear", "bisect", "neighbour")
+
+
+def linear_search(probe: Callable[[int], bool], max_x: int) -> Optional[int]:
+    for x in range(1, max_x + 1):
+        if probe(x):
+            return x
+    return None
+
+
+def bisect(probe: Callable[[int], bool], lo: int, hi: int) -> int:
+    """
+    Smallest x in (lo, hi] with probe(x) True, given probe(lo) is False
+    (or lo == 0) and probe(hi) is True.
+    """
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if probe(mid):
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+def gallop_search(
+    probe: Callable[[int], bool], max_x: int, guess: int = 1
+) -> Optional[int]:
+    """
+    Exponential search away from guess until the HNP onset is bracketed, then
+    bisection inside the bracket. Needs the onset to be monotonic in x.
+    """
+    guess = min(max(guess, 1), max_x)
+    step = 1
+    if probe(guess):
+        hi = guess
+        lo = guess - step
+        # step down until a point without the HNP (x = 0 is always negative)
+        while lo >= 1 and probe(lo):
+            hi = lo
+            step *= 2
+            lo = guess - step
+        return bisect(probe, max(lo, 0), hi)
+
+    lo = guess
+    while lo < max_x:
+        hi = min(guess + step, max_x)
+        if probe(hi):
+            return bisect(probe, lo, hi)
+        lo = hi
+        step *= 2
+    return None
+
+
+def find_hnp_onset(
+    probe: Callable[[int], bool],
+    mode: str = "linear",
+    max_x: int = 50,
+    guess: Optional[int] = None,
+) -> Optional[int]:
+    """
+    Returns the smallest node position iteration x (1..max_x) at which
+    probe(x) detects the HNP, or None. Every x is probed at most once.
+    "linear" probes 1, 2, 3, ...; "bisect" gallops up from 1 then bisects;
+    "neighbour" does the same starting from guess (e.g. the onset found for
+    the neighbouring sensitivity).
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"unknown search mode {mode}, use one of {SEARCH_MODES}")
+    results: dict[int, bool] = {}
+
+    def memo_probe(x: int) -> bool:
+        if x not in results:
+            results[x] = probe(x)
+        return results[x]
+
+    if mode == "linear":
+        return linear_search(memo_probe, max_x)
+    if mode == "bisect" or guess is None:
+        return gallop_search(memo_probe, max_x, 1)
+    return gallop_search(memo_probe, max_x, guess)
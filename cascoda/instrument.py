@@ -0,0 +1,258 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Iterator, Optional
+
+# the trace file of the current run, inherited by worker processes
+TRACE_ENV = "CASCODA_TRACE"
+# id of the current run, so runs appended to the same trace file can be told apart
+TRACE_RUN_ENV = "CASCODA_TRACE_RUN"
+TRACE_FORMATS = ("jsonl", "chrome")
+
+# audit events of a new process being started (os.fork for worker processes)
+SUBPROCESS_EVENTS = (
+    "subprocess.Popen",
+    "os.system",
+    "os.posix_spawn",
+    "os.exec",
+    "os.fork",
+)
+
+# (pid, stages open in the current thread or asyncio task, innermost last)
+_open = contextvars.ContextVar("cascoda_stages", default=(0, ()))
+_write_lock = threading.Lock()
+_hook_installed = False
+
+
+def trace_path() -> Optional[str]:
+    return os.environ.get(TRACE_ENV)
+
+
+def _open_stages() -> tuple[dict[str, Any], ...]:
+    # a forked worker process starts without the stages of its parent
+    pid, stages = _open.get()
+    return stages if pid == os.getpid() else ()
+
+
+def _audit_hook(event: str, args):
+    if event in SUBPROCESS_EVENTS or event.startswith("os.spawn"):
+        for open_stage in _open_stages():
+            open_stage["subprocesses"] += 1
+
+
+def _install_hook():
+    # audit hooks can't be removed, it only counts while stages are open
+    global _hook_installed
+    if not _hook_installed:
+        sys.addaudithook(_audit_hook)
+        _hook_installed = True
+
+
+def _maxrss_mb(who: int) -> float:
+    # ru_maxrss is in kB on Linux, bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _write(path: str, event: dict[str, Any]):
+    line = json.dumps(event, default=str) + "\n"
+    # one append per event, so threads and worker processes can share the file
+    with _write_lock:
+        with open(path, "a") as f:
+            f.write(line)
+
+
+@contextlib.contextmanager
+def stage(name: str, **args) -> Iterator[None]:
+    """
+    Records the wall time, CPU time (of the calling thread), CPU time of the
+    subprocesses reaped, number of subprocesses started and peak RSS of the
+    process while the with block runs, as one event of the trace file.
+    Stages nest per thread and per asyncio task. The CPU time of a stage run
+    in a task also counts the other tasks of the event loop.
+    Does nothing unless tracing is on (see tracing).
+    """
+    path = trace_path()
+    if path is None:
+        yield
+        return
+    _install_hook()
+    current = {"subprocesses": 0}
+    stages = _open_stages()
+    parent = stages[-1]["name"] if stages else None
+    current["name"] = name
+    token = _open.set((os.getpid(), stages + (current,)))
+    start = time.time()
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    children_cpu = _children_cpu()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _open.reset(token)
+        event = {
+            "run": os.environ.get(TRACE_RUN_ENV),
+            "name": name,
+            "parent": parent,
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "start": start,
+            "wall_s": round(time.perf_counter() - wall, 6),
+            "cpu_s": round(time.thread_time() - cpu, 6),
+            "children_cpu_s": round(_children_cpu() - children_cpu, 6),
+            "subprocesses": current["subprocesses"],
+            "peak_rss_mb": _maxrss_mb(resource.RUSAGE_SELF),
+            "children_peak_rss_mb": _maxrss_mb(resource.RUSAGE_CHILDREN),
+            "error": error,
+            "args": args,
+        }
+        _write(path, event)
+
+
+def timed(name: str):
+    # decorator form of stage, for functions that are a stage as a whole
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def read_events(path: str, run: Optional[str] = None) -> list[dict[str, Any]]:
+    # the events of the trace file (of one run if given), in the order written
+    events = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                event = json.loads(line)
+                if run is None or event.get("run") == run:
+                    events.append(event)
+    return events
+
+
+def write_chrome_trace(events: list[dict[str, Any]], path: str):
+    """
+    Writes the events in the Chrome trace format (complete "X" events), to be
+    opened in chrome://tracing or https://ui.perfetto.dev.
+    """
+    trace_events = [
+        {
+            "name": event["name"],
+            "cat": event["parent"] or "pipeline",
+            "ph": "X",
+            "ts": round(event["start"] * 1e6),
+            "dur": round(event["wall_s"] * 1e6),
+            "pid": event["pid"],
+            "tid": event["tid"],
+            "args": {
+                key: value
+                for key, value in event.items()
+                if key not in ("name", "start", "pid", "tid", "args")
+            }
+            | event["args"],
+        }
+        for event in events
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+def summary_table(events: list[dict[str, Any]]) -> str:
+    """
+    One line per stage name (in order of first appearance): calls, total and
+    mean wall time, total CPU time (own and subprocesses), subprocesses started
+    and the largest peak RSS.
+    """
+    totals: dict[str, dict[str, float]] = defaultdict(
+        lambda: dict(calls=0, wall=0.0, cpu=0.0, children=0.0, procs=0, rss=0.0)
+    )
+    for event in events:
+        total = totals[event["name"]]
+        total["calls"] += 1
+        total["wall"] += event["wall_s"]
+        total["cpu"] += event["cpu_s"]
+        total["children"] += event["children_cpu_s"]
+        total["procs"] += event["subprocesses"]
+        total["rss"] = max(total["rss"], event["peak_rss_mb"])
+    lines = [
+        f"{'stage':<28}{'calls':>7}{'wall s':>10}{'mean s':>9}{'cpu s':>9}"
+        + f"{'child s':>9}{'procs':>7}{'rss MB':>9}"
+    ]
+    for name, total in totals.items():
+        lines.append(
+            f"{name:<28}{total['calls']:>7}{total['wall']:>10.3f}"
+            + f"{total['wall'] / total['calls']:>9.3f}{total['cpu']:>9.3f}"
+            + f"{total['children']:>9.3f}{total['procs']:>7}{total['rss']:>9.1f}"
+        )
+    return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def tracing(path: Optional[str], trace_format: str = "jsonl") -> Iterator[None]:
+    """
+    Turns tracing on for the with block (and the worker processes it starts).
+    The stage events are appended to path as JSON lines while the run goes on.
+    At the end a summary table is printed and, with the "chrome" format, the
+    run's events are written to path as a Chrome trace instead.
+    Does nothing if path is None.
+    """
+    if path is None:
+        yield
+        return
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f"unknown trace format {trace_format}, use {TRACE_FORMATS}")
+    path = os.path.abspath(path)
+    events_path = path + ".jsonl" if trace_format == "chrome" else path
+    run = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    previous = {key: os.environ.get(key) for key in (TRACE_ENV, TRACE_RUN_ENV)}
+    os.environ[TRACE_ENV] = events_path
+    os.environ[TRACE_RUN_ENV] = run
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        events = read_events(events_path, run) if os.path.exists(events_path) else []
+        print(summary_table(events))
+        if trace_format == "chrome":
+            write_chrome_trace(events, path)
+            os.remove(events_path)
+        print(f"trace written to {path}")
+
+
+def add_trace_arguments(parser):
+    # the --trace options shared by the command line scripts
+    parser.add_argument(
+        "--trace",
+        default=None,
+        help="record the time, CPU, subprocesses and peak RSS of every stage here",
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=TRACE_FORMATS,
+        default="jsonl",
+        help="JSON lines, or a Chrome trace (chrome://tracing, Perfetto)",
+    )
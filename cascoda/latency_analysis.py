@@ -0,0 +1,131 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+# sliding windows of WINDOW_SECONDS, one starting every STEP_SECONDS
+WINDOW_SECONDS = 10.0
+STEP_SECONDS = 5.0
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+class RequestLatency(NamedTuple):
+    # one entry per unique sequence number requested, in sequence number order
+    # (the order of RetryAnalysis.unique_sequences)
+    sequences: np.ndarray
+    request_times: np.ndarray  # absolute time of the first attempt
+    latencies: np.ndarray  # seconds until the reply, nan if never answered
+
+    @property
+    def answered(self) -> np.ndarray:
+        return ~np.isnan(self.latencies)
+
+    @property
+    def reply_times(self) -> np.ndarray:
+        # absolute time of the reply to each answered request
+        answered = self.answered
+        return self.request_times[answered] + self.latencies[answered]
+
+
+class WindowSeries(NamedTuple):
+    starts: np.ndarray  # seconds from the start of the simulation
+    requests: np.ndarray  # request attempts sent in the window
+    retries: np.ndarray  # of those, the attempts repeating the one before
+    replies: np.ndarray  # replies answering a request, sent in the window
+    throughput: np.ndarray  # replies per second
+    mean_latency: np.ndarray  # of the requests answered in the window, nan if none
+
+
+def first_times(sequences, times, size: int) -> np.ndarray:
+    """
+    Returns the time of the first packet of each sequence number, indexed by
+    sequence number (nan for numbers that never appear). Linear in the number of
+    packets, whatever their order.
+    """
+    first = np.full(size, np.inf)
+    np.minimum.at(first, np.asarray(sequences, dtype=np.int64), times)
+    first[np.isinf(first)] = np.nan
+    return first
+
+
+def match_replies(
+    request_seqs, request_times, reply_seqs, reply_times
+) -> RequestLatency:
+    """
+    Joins the requests of one end node with the central node's replies to it on
+    sequence number (times are absolute, i.e. PacketTable.start + times).
+    A request is timed from its first attempt (so retries count towards its
+    latency) to the first reply with its sequence number. A reply sent before
+    the request (a sequence number reused after a restart) leaves it
+    unanswered. The join goes through tables indexed by sequence number (16
+    bit in ICMPv6), instead of sorting either side.
+    """
+    request_seqs = np.asarray(request_seqs, dtype=np.int64)
+    reply_seqs = np.asarray(reply_seqs, dtype=np.int64)
+    size = int(max(request_seqs.max(initial=-1), reply_seqs.max(initial=-1))) + 1
+    first_request = first_times(request_seqs, request_times, size)
+    first_reply = first_times(reply_seqs, reply_times, size)
+
+    sequences = np.flatnonzero(~np.isnan(first_request))
+    latencies = first_reply[sequences] - first_request[sequences]
+    latencies[latencies < 0] = np.nan
+    return RequestLatency(sequences, first_request[sequences], latencies)
+
+
+def window_sums(
+    times, duration: float, window: float, step: float, weights=None
+) -> np.ndarray:
+    """
+    Returns the number of times (or the sum of their weights) in each window
+    [k * step, k * step + window) starting up to duration. Each time is
+    counted in its step first, then the steps of each window are added up
+    from a cumulative sum, so the cost doesn't grow with window / step.
+    """
+    steps_per_window = int(round(window / step))
+    if step <= 0 or not np.isclose(steps_per_window * step, window):
+        raise ValueError(f"window {window} s is not a multiple of step {step} s")
+    windows = int(duration // step) + 1
+    per_step = np.bincount(
+        np.floor_divide(times, step).astype(np.int64),
+        weights=weights,
+        minlength=windows + steps_per_window - 1,
+    )
+    total = np.concatenate(([0], np.cumsum(per_step)))
+    return total[steps_per_window : windows + steps_per_window] - total[:windows]
+
+
+def window_series(
+    request_times,
+    retry_times,
+    reply_times,
+    latencies,
+    duration: float,
+    window: float = WINDOW_SECONDS,
+    step: float = STEP_SECONDS,
+) -> WindowSeries:
+    """
+    Computes the sliding window series of a run from the packets of every end
+    node, with times relative to the start of the simulation: requests and
+    retries are counted when sent, answered requests (latencies, in the order
+    of reply_times) when their reply was sent.
+    """
+    replies = window_sums(reply_times, duration, window, step)
+    latency_sums = window_sums(reply_times, duration, window, step, latencies)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_latency = latency_sums / replies
+    return WindowSeries(
+        np.arange(len(replies)) * step,
+        window_sums(request_times, duration, window, step),
+        window_sums(retry_times, duration, window, step),
+        replies,
+        replies / window,
+        mean_latency,
+    )
+
+
+def latency_percentiles(latencies: np.ndarray) -> dict[int, Optional[float]]:
+    # LATENCY_PERCENTILES of the answered requests, None if none was answered
+    answered = latencies[~np.isnan(latencies)]
+    if answered.size == 0:
+        return {percentile: None for percentile in LATENCY_PERCENTILES}
+    values = np.percentile(answered, LATENCY_PERCENTILES)
+    return {p: float(value) for p, value in zip(LATENCY_PERCENTILES, values)}
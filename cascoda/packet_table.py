@@ -0,0 +1,53 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from cascoda.pcap_reader import EchoCapture
+
+
+class PacketTable(NamedTuple):
+    """
+    Columnar view of the echo packets of one pcap file.
+    Addresses are interned: src/dst hold indices into `addresses`.
+    """
+
+    start: float  # absolute timestamp of the first frame in the capture
+    times: np.ndarray  # float64, relative to start
+    seqs: np.ndarray  # int32
+    types: np.ndarray  # uint8, ICMPv6 type
+    src: np.ndarray  # int32 address codes
+    dst: np.ndarray  # int32 address codes
+    addresses: list[str]
+
+    def __len__(self) -> int:
+        return len(self.seqs)
+
+    # returns the code of an address in this table, -1 if it never appears
+    def address_code(self, address: str) -> int:
+        try:
+            return self.addresses.index(address)
+        except ValueError:
+            return -1
+
+
+def table_from_capture(capture: EchoCapture) -> PacketTable:
+    """
+    Decodes the packet records into columns in a single pass.
+    """
+    codes: dict[str, int] = {}
+    if capture.packets:
+        times, srcs, dsts, seqs, types = zip(*capture.packets)
+    else:
+        times = srcs = dsts = seqs = types = ()
+    src = [codes.setdefault(address, len(codes)) for address in srcs]
+    dst = [codes.setdefault(address, len(codes)) for address in dsts]
+
+    return PacketTable(
+        capture.start,
+        np.array(times, dtype=np.float64),
+        np.array(seqs, dtype=np.int32),
+        np.array(types, dtype=np.uint8),
+        np.array(src, dtype=np.int32),
+        np.array(dst, dtype=np.int32),
+        list(codes),
+    )
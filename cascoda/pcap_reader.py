@@ -0,0 +1,529 @@
+import ipaddress
+import struct
+from functools import lru_cache
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+
+from cascoda.thread_crypto import ccm_star_decrypt, expand_key, thread_mac_key
+
+# pcap link types carrying IEEE 802.15.4 frames
+LINKTYPE_IEEE802_15_4_WITHFCS = 195
+LINKTYPE_IEEE802_15_4_NONASK_PHY = 215
+LINKTYPE_IEEE802_15_4_NOFCS = 230
+LINKTYPE_IEEE802_15_4_TAP = 283
+
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+
+# OpenThread default mesh-local prefix, used for 6LoWPAN context 0
+DEFAULT_MESH_LOCAL_PREFIX = bytes.fromhex("fdde:ad00:beef:0000".replace(":", ""))
+
+_MIC_LENGTHS = (0, 4, 8, 16, 0, 4, 8, 16)
+# interface identifier of an address formed from a short address (0000:00ff:fe00:XXXX)
+_SHORT_IID_PREFIX = b"\x00\x00\x00\xff\xfe\x00"
+
+
+class PcapDecodeError(Exception):
+    pass
+
+
+class Packet(NamedTuple):
+    """
+    A single ICMPv6 echo message. time is relative to the first frame of the
+    capture (same as tshark's default time column).
+    """
+
+    time: float
+    src: str
+    dst: str
+    seq: int
+    type: int
+
+
+class EchoCapture(NamedTuple):
+    start: float  # absolute timestamp of the first frame in the capture
+    packets: list[Packet]
+    undecrypted: int  # secured frames that could not be decrypted
+
+
+# yields (timestamp, linktype, frame bytes) for every frame in a pcap/pcapng file
+def iter_frames(f: BinaryIO) -> Iterator[Tuple[float, int, bytes]]:
+    magic = f.read(4)
+    if magic == b"\x0a\x0d\x0d\x0a":
+        yield from _iter_pcapng(f, magic)
+    elif len(magic) == 4:
+        yield from _iter_pcap(f, magic)
+
+
+def _iter_pcap(f: BinaryIO, magic: bytes) -> Iterator[Tuple[float, int, bytes]]:
+    if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+        endian = "<"
+    elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+        endian = ">"
+    else:
+        raise PcapDecodeError(f"not a pcap file (magic {magic.hex()})")
+    resolution = 1e-9 if magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d") else 1e-6
+    header = f.read(20)
+    if len(header) < 20:
+        raise PcapDecodeError("truncated pcap header")
+    linktype = struct.unpack(endian + "I", header[16:20])[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + "IIII")
+    while True:
+        record_header = f.read(16)
+        if len(record_header) < 16:
+            return
+        ts_sec, ts_frac, incl_len, _ = record.unpack(record_header)
+        data = f.read(incl_len)
+        if len(data) < incl_len:
+            return
+        yield ts_sec + ts_frac * resolution, linktype, data
+
+
+def _iter_pcapng(f: BinaryIO, magic: bytes) -> Iterator[Tuple[float, int, bytes]]:
+    endian = "<"
+    interfaces: list[Tuple[int, float]] = []
+    block_type = magic
+    while True:
+        length_bytes = f.read(4)
+        if len(length_bytes) < 4:
+            return
+        if block_type == b"\x0a\x0d\x0d\x0a":
+            # section header, byte order magic decides endianness of the section
+            bom = f.read(4)
+            endian = "<" if bom == b"\x4d\x3c\x2b\x1a" else ">"
+            block_len = struct.unpack(endian + "I", length_bytes)[0]
+            # the rest of the block but its trailing length, read below
+            f.read(block_len - 16)
+            interfaces = []
+        else:
+            btype = struct.unpack(endian + "I", block_type)[0]
+            block_len = struct.unpack(endian + "I", length_bytes)[0]
+            body = f.read(block_len - 12)
+            if len(body) < block_len - 12:
+                return
+            if btype == 1:
+                interfaces.append(_pcapng_interface(body, endian))
+            elif btype == 6 and interfaces:
+                if_id, ts_high, ts_low, cap_len = struct.unpack(
+                    endian + "IIII", body[:16]
+                )
+                if if_id >= len(interfaces):
+                    raise PcapDecodeError(
+                        f"packet of interface {if_id}, "
+                        + f"{len(interfaces)} interfaces described"
+                    )
+                linktype, resolution = interfaces[if_id]
+                timestamp = ((ts_high << 32) | ts_low) * resolution
+                yield timestamp, linktype, body[20 : 20 + cap_len]
+            elif btype == 3 and interfaces:
+                # simple packet blocks carry no timestamp
+                orig_len = struct.unpack(endian + "I", body[:4])[0]
+                yield 0.0, interfaces[0][0], body[4 : 4 + orig_len]
+        f.read(4)  # trailing block length
+        block_type = f.read(4)
+        if len(block_type) < 4:
+            return
+
+
+def _pcapng_interface(body: bytes, endian: str) -> Tuple[int, float]:
+    linktype = struct.unpack(endian + "H", body[:2])[0]
+    resolution = 1e-6
+    offset = 8
+    while offset + 4 <= len(body):
+        code, length = struct.unpack(endian + "HH", body[offset : offset + 4])
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            tsresol = body[offset + 4]
+            if tsresol & 0x80:
+                resolution = 2.0 ** -(tsresol & 0x7F)
+            else:
+                resolution = 10.0**-tsresol
+        offset += 4 + length + (-length % 4)
+    return linktype, resolution
+
+
+# strips link layer framing so that only the MAC frame (without FCS) remains
+def mac_frame(linktype: int, data: bytes) -> Optional[bytes]:
+    if linktype == LINKTYPE_IEEE802_15_4_WITHFCS:
+        return data[:-2]
+    if linktype == LINKTYPE_IEEE802_15_4_NOFCS:
+        return data
+    if linktype == LINKTYPE_IEEE802_15_4_NONASK_PHY:
+        # preamble (4), SFD (1) and PHY length (1) precede the frame
+        return data[6 : 6 + data[5]][:-2]
+    if linktype == LINKTYPE_IEEE802_15_4_TAP:
+        header_len = struct.unpack("<H", data[2:4])[0]
+        fcs_len = 2
+        offset = 4
+        while offset + 4 <= header_len:
+            tlv_type, tlv_len = struct.unpack("<HH", data[offset : offset + 4])
+            if tlv_type == 0:
+                fcs_len = (0, 2, 4)[data[offset + 4]]
+            offset += 4 + tlv_len + (-tlv_len % 4)
+        frame = data[header_len:]
+        return frame[: len(frame) - fcs_len]
+    return None
+
+
+class MacFrame(NamedTuple):
+    header: bytes  # MHR including the auxiliary security header
+    payload: bytes  # MAC payload, still encrypted if security is enabled
+    src: Optional[bytes]  # big-endian short (2) or extended (8) address
+    dst: Optional[bytes]
+    security_level: int
+    key_index: int
+    frame_counter: int
+
+
+def _read_address(frame: bytes, offset: int, mode: int) -> Tuple[Optional[bytes], int]:
+    if mode == 2:
+        return frame[offset : offset + 2][::-1], offset + 2
+    if mode == 3:
+        return frame[offset : offset + 8][::-1], offset + 8
+    return None, offset
+
+
+def _pan_ids_present(version: int, dst_mode: int, src_mode: int, compress: int):
+    if version < 2:
+        return dst_mode != 0, src_mode != 0 and not compress
+    # IEEE 802.15.4-2015 table 7-2
+    if dst_mode == 0 and src_mode == 0:
+        return bool(compress), False
+    if src_mode == 0:
+        return not compress, False
+    if dst_mode == 0:
+        return False, not compress
+    if dst_mode == 3 and src_mode == 3:
+        return not compress, False
+    return True, not compress
+
+
+def parse_mac_frame(frame: bytes) -> Optional[MacFrame]:
+    """
+    Parses the IEEE 802.15.4 MAC header of a data frame.
+    Returns None for non data frames or malformed headers.
+    """
+    if len(frame) < 3:
+        return None
+    fcf = frame[0] | (frame[1] << 8)
+    if fcf & 0x07 != 1:
+        return None
+    security = (fcf >> 3) & 1
+    compress = (fcf >> 6) & 1
+    seq_suppressed = (fcf >> 8) & 1
+    ie_present = (fcf >> 9) & 1
+    dst_mode = (fcf >> 10) & 3
+    version = (fcf >> 12) & 3
+    src_mode = (fcf >> 14) & 3
+
+    offset = 2 if version == 2 and seq_suppressed else 3
+    dst_pan, src_pan = _pan_ids_present(version, dst_mode, src_mode, compress)
+    if dst_pan:
+        offset += 2
+    dst, offset = _read_address(frame, offset, dst_mode)
+    if src_pan:
+        offset += 2
+    src, offset = _read_address(frame, offset, src_mode)
+
+    level = key_index = frame_counter = 0
+    if security:
+        if offset >= len(frame):
+            return None
+        control = frame[offset]
+        level = control & 0x07
+        key_id_mode = (control >> 3) & 0x03
+        offset += 1
+        if not (control >> 5) & 1:
+            frame_counter = struct.unpack("<I", frame[offset : offset + 4])[0]
+            offset += 4
+        offset += (0, 0, 4, 8)[key_id_mode]
+        if key_id_mode:
+            key_index = frame[offset]
+            offset += 1
+
+    if ie_present:
+        # skip header IEs, payload IEs (after HT1) are not supported
+        while True:
+            if offset + 2 > len(frame):
+                return None
+            descriptor = frame[offset] | (frame[offset + 1] << 8)
+            element_id = (descriptor >> 7) & 0xFF
+            offset += 2 + (descriptor & 0x7F)
+            if element_id == 0x7E:
+                return None
+            if element_id == 0x7F:
+                break
+
+    if offset > len(frame):
+        return None
+    return MacFrame(
+        frame[:offset], frame[offset:], src, dst, level, key_index, frame_counter
+    )
+
+
+def _iid_from_mac(address: Optional[bytes]) -> bytes:
+    if address is None:
+        return b"\x00" * 8
+    if len(address) == 8:
+        return bytes([address[0] ^ 0x02]) + address[1:]
+    return _SHORT_IID_PREFIX + address
+
+
+def _decompress_address(
+    data: bytes, offset: int, context: int, mode: int, mac: Optional[bytes], prefix
+) -> Tuple[bytes, int]:
+    base = b"\xfe\x80" + b"\x00" * 6 if not context else prefix
+    if mode == 0:
+        if context:
+            return b"\x00" * 16, offset
+        return data[offset : offset + 16], offset + 16
+    if mode == 1:
+        return base + data[offset : offset + 8], offset + 8
+    if mode == 2:
+        return base + _SHORT_IID_PREFIX + data[offset : offset + 2], (offset + 2)
+    return base + _iid_from_mac(mac), offset
+
+
+def _decompress_multicast(data: bytes, offset: int, mode: int) -> Tuple[bytes, int]:
+    if mode == 0:
+        return data[offset : offset + 16], offset + 16
+    if mode == 1:
+        address = b"\xff" + data[offset : offset + 1] + b"\x00" * 9
+        return address + data[offset + 1 : offset + 6], offset + 6
+    if mode == 2:
+        address = b"\xff" + data[offset : offset + 1] + b"\x00" * 11
+        return address + data[offset + 1 : offset + 4], offset + 4
+    return b"\xff\x02" + b"\x00" * 13 + data[offset : offset + 1], offset + 1
+
+
+def parse_iphc(
+    data: bytes, mac_src, mac_dst, prefix: bytes = DEFAULT_MESH_LOCAL_PREFIX
+) -> Optional[Tuple[bytes, bytes, int, int]]:
+    """
+    Decompresses a 6LoWPAN IPHC header (RFC 6282).
+    Returns (src, dst, next header, offset of the IPv6 payload) or None if the
+    next header is compressed (i.e. not ICMPv6).
+    """
+    if len(data) < 2:
+        return None
+    tf = (data[0] >> 3) & 3
+    nh = (data[0] >> 2) & 1
+    hlim = data[0] & 3
+    cid = (data[1] >> 7) & 1
+    sac = (data[1] >> 6) & 1
+    sam = (data[1] >> 4) & 3
+    multicast = (data[1] >> 3) & 1
+    dac = (data[1] >> 2) & 1
+    dam = data[1] & 3
+
+    offset = 2 + cid
+    offset += (4, 3, 1, 0)[tf]
+    if nh:
+        return None
+    next_header = data[offset]
+    offset += 1
+    if hlim == 0:
+        offset += 1
+
+    src, offset = _decompress_address(data, offset, sac, sam, mac_src, prefix)
+    if multicast:
+        if dac:
+            return None
+        dst, offset = _decompress_multicast(data, offset, dam)
+    else:
+        dst, offset = _decompress_address(data, offset, dac, dam, mac_dst, prefix)
+    return src, dst, next_header, offset
+
+
+class _Fragment(NamedTuple):
+    packet: Tuple[str, str, int, int]
+    size: int
+    received: int
+
+
+def _lowpan_echo(
+    payload: bytes, mac_src, mac_dst, prefix: bytes, fragments: dict
+) -> Optional[Tuple[str, str, int, int]]:
+    """
+    Decodes the 6LoWPAN dispatch chain down to the ICMPv6 echo header.
+    First fragments are held in `fragments` until the datagram completes, so
+    the packet is reported at the same frame as tshark's reassembly.
+    """
+    offset = 0
+    # mesh header: originator/final addresses replace the MAC addresses
+    if payload and payload[0] >> 6 == 0b10:
+        orig_len = 2 if payload[0] & 0x20 else 8
+        final_len = 2 if payload[0] & 0x10 else 8
+        offset = 1
+        mac_src = payload[offset : offset + orig_len]
+        offset += orig_len
+        mac_dst = payload[offset : offset + final_len]
+        offset += final_len
+    if offset < len(payload) and payload[offset] == 0x50:
+        offset += 2  # broadcast header
+    if offset >= len(payload):
+        return None
+
+    dispatch = payload[offset]
+    key = (mac_src, mac_dst)
+    if dispatch >> 3 == 0b11100:
+        tag = payload[offset + 2 : offset + 4]
+        pending = fragments.get(key + (tag,))
+        if pending is None:
+            return None
+        received = pending.received + len(payload) - offset - 5
+        if received >= pending.size:
+            del fragments[key + (tag,)]
+            return pending.packet
+        fragments[key + (tag,)] = pending._replace(received=received)
+        return None
+
+    first_fragment = None
+    if dispatch >> 3 == 0b11000:
+        size = ((dispatch & 0x07) << 8) | payload[offset + 1]
+        first_fragment = (size, payload[offset + 2 : offset + 4])
+        offset += 4
+        dispatch = payload[offset] if offset < len(payload) else 0
+
+    if dispatch == 0x41:
+        ip = payload[offset + 1 : offset + 41]
+        if len(ip) < 40:
+            return None
+        src, dst, next_header = ip[8:24], ip[24:40], ip[6]
+        header_end = offset + 41
+    elif dispatch >> 5 == 0b011:
+        iphc = parse_iphc(payload[offset:], mac_src, mac_dst, prefix)
+        if iphc is None:
+            return None
+        src, dst, next_header, header_end = iphc
+        header_end += offset
+    else:
+        return None
+
+    icmp = payload[header_end : header_end + 8]
+    if next_header != 58 or len(icmp) < 8:
+        return None
+    if icmp[0] not in (ICMPV6_ECHO_REQUEST, ICMPV6_ECHO_REPLY):
+        return None
+    packet = (
+        ipaddress.IPv6Address(src).compressed,
+        ipaddress.IPv6Address(dst).compressed,
+        struct.unpack(">H", icmp[6:8])[0],
+        icmp[0],
+    )
+    if first_fragment is not None:
+        size, tag = first_fragment
+        received = 40 + len(payload) - header_end
+        if received < size:
+            fragments[key + (tag,)] = _Fragment(packet, size, received)
+            return None
+    return packet
+
+
+# AES key schedule of the Thread MAC key for a key index
+@lru_cache(maxsize=None)
+def _mac_key_schedule(network_key: bytes, key_index: int) -> list[int]:
+    # key index = (key sequence & 0x7f) + 1
+    return expand_key(thread_mac_key(network_key, key_index - 1))
+
+
+def _decrypt(mac: MacFrame, network_key: bytes, source: bytes) -> Optional[bytes]:
+    # the payload of a secured frame sent from the extended address source,
+    # None if the MIC doesn't match
+    nonce = source + struct.pack(">I", mac.frame_counter)
+    nonce += bytes([mac.security_level])
+    return ccm_star_decrypt(
+        _mac_key_schedule(network_key, mac.key_index),
+        nonce,
+        mac.header,
+        mac.payload,
+        _MIC_LENGTHS[mac.security_level],
+        encrypted=mac.security_level >= 4,
+    )
+
+
+def _decrypt_short_source(
+    mac: MacFrame, network_key: bytes, sources: dict, extended: dict
+) -> Optional[bytes]:
+    """
+    Decrypts a secured frame sent from a short address. Its nonce needs the
+    sender's extended address, so the extended addresses seen in the capture
+    (extended) are tried until the MIC matches, and the one that did is kept
+    for the short address (sources). Without a MIC a wrong address can't be
+    told apart, so those frames are only decrypted with a known address.
+    """
+    known = sources.get(mac.src)
+    if known is not None:
+        payload = _decrypt(mac, network_key, known)
+        if payload is not None:
+            return payload
+    if not _MIC_LENGTHS[mac.security_level]:
+        return None
+    for candidate in extended:
+        if candidate == known:
+            continue
+        payload = _decrypt(mac, network_key, candidate)
+        if payload is not None:
+            sources[mac.src] = candidate
+            return payload
+    return None
+
+
+def _mac_from_link_local(address: str) -> Optional[bytes]:
+    # the extended address an fe80::/64 address was formed from (see _iid_from_mac)
+    packed = ipaddress.IPv6Address(address).packed
+    if packed[:8] != b"\xfe\x80" + bytes(6) or packed[8:14] == _SHORT_IID_PREFIX:
+        return None
+    return bytes([packed[8] ^ 0x02]) + packed[9:]
+
+
+def read_echo_packets(
+    f: BinaryIO,
+    network_key: Optional[bytes] = None,
+    prefix: bytes = DEFAULT_MESH_LOCAL_PREFIX,
+) -> EchoCapture:
+    """
+    Decodes every ICMPv6 echo request/reply from a pcap or pcapng stream.
+    Secured frames are decrypted with the Thread MAC key derived from
+    network_key, frames that cannot be decrypted are counted in `undecrypted`.
+    Frames from a short address are decrypted with the extended address of
+    their sender, learnt from the capture (see _decrypt_short_source).
+    """
+    packets = []
+    fragments: dict = {}
+    start = None
+    undecrypted = 0
+    # extended addresses seen so far (an ordered set), short -> extended address
+    extended: dict[bytes, None] = {}
+    sources: dict[Optional[bytes], bytes] = {}
+    for timestamp, linktype, data in iter_frames(f):
+        if start is None:
+            start = timestamp
+        frame = mac_frame(linktype, data)
+        if frame is None:
+            raise PcapDecodeError(f"unsupported link type {linktype}")
+        mac = parse_mac_frame(frame)
+        if mac is None:
+            continue
+        for address in (mac.src, mac.dst):
+            if address is not None and len(address) == 8:
+                extended.setdefault(address)
+        payload: Optional[bytes] = mac.payload
+        if mac.security_level:
+            if not network_key or not mac.key_index:
+                undecrypted += 1
+                continue
+            if mac.src is not None and len(mac.src) == 8:
+                payload = _decrypt(mac, network_key, mac.src)
+            else:
+                payload = _decrypt_short_source(mac, network_key, sources, extended)
+            if payload is None:
+                undecrypted += 1
+                continue
+        echo = _lowpan_echo(payload, mac.src, mac.dst, prefix, fragments)
+        if echo is not None:
+            packets.append(Packet(round(timestamp - start, 9), *echo))
+            source = _mac_from_link_local(echo[0])
+            if source is not None:
+                extended.setdefault(source)
+    return EchoCapture(start or 0.0, packets, undecrypted)
@@ -0,0 +1,255 @@
+import argparse
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Optional
+
+from cascoda import generate_report, instrument
+from cascoda.archive import add_compress_argument
+from cascoda.extract_stats import PCAP_BACKENDS, collect_run, submit_run
+from cascoda.hdn_detector import add_resimulate_argument, workflow
+from cascoda.hnp_search import SEARCH_MODES
+from cascoda.run_catalog import run_id
+from cascoda.stats_cache import DEFAULT_CACHE_PATH
+from cascoda.stats_export import StatsExporter
+
+DEFAULT_CSV = "../outputs/hidden_node_simulation_export.csv"
+
+
+class StatsWorker:
+    """
+    Extracts the stats of each simulation in the background as soon as it is
+    handed over with submit(), while the next simulations run. The pcaps are
+    decoded in up to workers processes (in the background thread if 1), and
+    every run's stats are written to the exporter in the order submitted.
+    """
+
+    def __init__(
+        self,
+        exporter: StatsExporter,
+        workers: int = 1,
+        backend: str = "auto",
+        cache: Optional[str] = DEFAULT_CACHE_PATH,
+        central_node: Optional[int] = None,
+    ):
+        self.exporter = exporter
+        self.backend = backend
+        self.cache = cache
+        self.central_node = central_node
+        self.failures: list[tuple[str, Exception]] = []
+        self._decoder = (
+            ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        )
+        # a single collector thread, so the exporter is only written from there
+        self._collector = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+
+    def submit(self, config_file_path, output_dirs: dict):
+        # output_dirs as returned by whitefield.run_simulation
+        config_file_path = str(config_file_path)
+        pcap_dir = os.path.join(str(output_dirs["pcap"]), "")
+        with self._lock:
+            submitted = None
+            if self._decoder is not None:
+                try:
+                    submitted = submit_run(
+                        self._decoder,
+                        config_file_path,
+                        pcap_dir,
+                        self.backend,
+                        self.cache,
+                    )
+                except Exception as e:
+                    self.failures.append((config_file_path, e))
+                    return
+            self._collector.submit(self._collect, config_file_path, pcap_dir, submitted)
+
+    def _collect(self, config_file_path: str, pcap_dir: str, submitted):
+        try:
+            if submitted is None:
+                submitted = submit_run(
+                    None, config_file_path, pcap_dir, self.backend, self.cache
+                )
+            stats = collect_run(
+                config_file_path, pcap_dir, *submitted, self.central_node
+            )
+            with instrument.stage("export_stats", config=config_file_path):
+                self.exporter.write(run_id(config_file_path, pcap_dir), stats)
+        except Exception as e:
+            with self._lock:
+                self.failures.append((config_file_path, e))
+            return
+
+    def close(self):
+        # waits until every submitted run is extracted
+        self._collector.shutdown()
+        if self._decoder is not None:
+            self._decoder.shutdown()
+        for config_file_path, e in self.failures:
+            print(f"FAILED {config_file_path}: {type(e).__name__}: {e}")
+        print(f"{self.exporter.runs} runs extracted, {len(self.failures)} failed")
+
+
+def sort_runs(reduced_df, sens_pos_df, sim_run_df):
+    # runs finish in any order, the report lists them by decreasing sensitivity
+    # then increasing node distance like extract_stats does
+    order = reduced_df.sort_values(
+        ["s", "x"], ascending=[False, True], kind="stable"
+    ).index
+    return reduced_df.loc[order], sens_pos_df.loc[order], sim_run_df.loc[order]
+
+
+def run_pipeline(
+    csv_path: str = DEFAULT_CSV,
+    series_path: Optional[str] = None,
+    report_path: str = generate_report.REPORT_PATH,
+    concurrency: int = 1,
+    retries: int = 1,
+    search: str = "linear",
+    timeout: Optional[float] = None,
+    early_stop: bool = False,
+    workers: int = 1,
+    backend: str = "auto",
+    cache: Optional[str] = DEFAULT_CACHE_PATH,
+    central_node: Optional[int] = None,
+    report_workers: int = 0,
+    compression: Optional[str] = None,
+    reuse: bool = False,
+) -> dict[str, Any]:
+    """
+    Runs the sensitivity sweep (see hdn_detector.workflow), extracting the
+    stats of each simulation in the background as it finishes, then builds the
+    report from them once the sweep is over. With reuse, the stats of configs
+    an earlier sweep already simulated are extracted from its outputs. The
+    stats are read from the outputs while they are being compressed (see
+    archive.open_output).
+    Returns the output paths.
+    """
+    with StatsExporter(csv_path, series_path) as exporter:
+        worker = StatsWorker(exporter, workers, backend, cache, central_node)
+        try:
+            workflow(
+                concurrency,
+                retries,
+                search,
+                timeout,
+                early_stop,
+                on_simulated=worker.submit,
+                compression=compression,
+                reuse=reuse,
+            )
+        finally:
+            worker.close()
+
+    outputs = {"summary": exporter.summary_path, "series": exporter.series_path}
+    if exporter.runs == 0:
+        print("no runs extracted, no report")
+        return outputs
+    data = sort_runs(*generate_report.get_data(csv_path))
+    generate_report.make_pdf(*data, report_workers, report_path)
+    outputs["report"] = report_path
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sweep receive sensitivities, extract the stats of each "
+        + "simulation while the next ones run, then build the PDF report."
+    )
+    parser.add_argument(
+        "csv", nargs="?", default=DEFAULT_CSV, help=f"stats csv (default {DEFAULT_CSV})"
+    )
+    parser.add_argument(
+        "--series",
+        default=None,
+        help="raw per packet series output (default <csv>_series.parquet)",
+    )
+    parser.add_argument(
+        "--report",
+        default=generate_report.REPORT_PATH,
+        help=f"PDF report (default {generate_report.REPORT_PATH})",
+    )
+    parser.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=1,
+        help="number of simulations run at once in isolated working directories",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="times a failed simulation is retried (with --concurrency > 1)",
+    )
+    parser.add_argument(
+        "--search",
+        choices=SEARCH_MODES,
+        default="linear",
+        help="how node distances are probed (see hdn_detector.py --help)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="seconds after which a simulation is stopped and counted as failed",
+    )
+    parser.add_argument(
+        "--early-stop",
+        action="store_true",
+        help="stop each simulation as soon as the HNP shows up in airline.log",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes decoding pcaps in the background, 0 uses every core",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=PCAP_BACKENDS,
+        default="auto",
+        help="pcap decoder, auto uses the native reader with a tshark fallback",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"don't read or write the decoded pcap cache ({DEFAULT_CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--central-node",
+        type=int,
+        default=None,
+        help="id of the node answering the pings (default: detected per run)",
+    )
+    parser.add_argument(
+        "--report-workers",
+        type=int,
+        default=0,
+        help="processes rendering the plots (default 0: all cores)",
+    )
+    add_compress_argument(parser)
+    add_resimulate_argument(parser)
+    instrument.add_trace_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.tracing(args.trace, args.trace_format):
+        outputs = run_pipeline(
+            args.csv,
+            args.series,
+            args.report,
+            args.concurrency,
+            args.retries,
+            args.search,
+            args.timeout,
+            args.early_stop,
+            args.workers or os.cpu_count() or 1,
+            args.backend,
+            None if args.no_cache else DEFAULT_CACHE_PATH,
+            args.central_node,
+            args.report_workers,
+            args.compress,
+            not args.resimulate,
+        )
+    for name, path in outputs.items():
+        print(f"{name} written to {path}")
@@ -0,0 +1,448 @@
+import argparse
+import csv
+import functools
+import math
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional, Sequence
+
+from cascoda import instrument
+from cascoda.airline_log import AIRLINE_LOG, hnp_in_log
+from cascoda.archive import Archiver, add_compress_argument
+from cascoda.extract_stats import PCAP_BACKENDS, get_stats
+from cascoda.hdn_detector import (
+    NODE_POSITIONS,
+    PING_SIZE,
+    add_resimulate_argument,
+    nodePos_change,
+    run_config,
+)
+from cascoda.run_catalog import run_id
+from cascoda.scheduler import BatchScheduler
+from cascoda.stats_cache import DEFAULT_CACHE_PATH
+from cascoda.stats_export import StatsExporter
+from cascoda.sweep_store import SweepStore, store_path
+from cascoda.wf_config import run_params
+from cascoda.whitefield import SIMULATION_OUTPUTS, run_simulation, simulator_version
+
+# the stats averaged over the replicates of a point
+METRICS = ("%_responded", "network_efficiency_%")
+DEFAULT_SUMMARY_CSV = "../outputs/replicates_summary.csv"
+DEFAULT_REPLICATES_CSV = "../outputs/replicates.csv"
+# the seed of the first replicate, the next ones count up from it
+BASE_SEED = 0xABCDEF
+
+
+def _t_within(t: float, df: int) -> float:
+    # P(|T| <= t) for Student's t with df (integer) degrees of freedom, from the
+    # finite series of Abramowitz & Stegun 26.7.3 and 26.7.4
+    theta = math.atan(t / math.sqrt(df))
+    cos2 = math.cos(theta) ** 2
+    term = total = 1.0
+    if df % 2:
+        if df == 1:
+            return 2 * theta / math.pi
+        for k in range(2, df - 1, 2):
+            term *= k / (k + 1) * cos2
+            total += term
+        return 2 / math.pi * (theta + math.sin(theta) * math.cos(theta) * total)
+    for k in range(1, df - 2, 2):
+        term *= k / (k + 1) * cos2
+        total += term
+    return math.sin(theta) * total
+
+
+@functools.lru_cache(maxsize=None)
+def t_critical(confidence: float, df: int) -> float:
+    """
+    The two sided critical value of Student's t distribution, e.g. 2.776 for a
+    95% confidence interval with 4 degrees of freedom (found by bisection).
+    """
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence must be between 0 and 1, not {confidence}")
+    low, high = 0.0, 1.0
+    while _t_within(high, df) < confidence:
+        low, high = high, high * 2
+    for _ in range(100):
+        middle = (low + high) / 2
+        if _t_within(middle, df) < confidence:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+class Welford:
+    """
+    Running mean and variance of a stream of values (Welford's algorithm),
+    numerically stable and without keeping the values.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # sum of squared differences from the mean
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        # sample variance, nan with less than 2 values
+        return self._m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def half_width(self, confidence: float = 0.95) -> float:
+        # of the t confidence interval of the mean, inf with less than 2 values
+        if self.count < 2:
+            return math.inf
+        return t_critical(confidence, self.count - 1) * self.std / math.sqrt(self.count)
+
+
+class PointStats:
+    """
+    The replicates of one parameter point, aggregated as they come in.
+    converged() tells when the confidence interval of every metric is narrow
+    enough to stop adding replicates.
+    """
+
+    def __init__(
+        self, name: str, metrics: Sequence[str] = METRICS, confidence: float = 0.95
+    ):
+        self.name = name
+        self.confidence = confidence
+        self.metrics = {metric: Welford() for metric in metrics}
+        self.replicates = 0
+        self.failed = 0
+
+    def add(self, stats: dict[str, Any]):
+        self.replicates += 1
+        for metric, welford in self.metrics.items():
+            value = stats.get(metric)
+            if value is not None and math.isfinite(value):
+                welford.add(value)
+
+    def converged(self, precision: float, min_replicates: int = 3) -> bool:
+        # every metric's interval is within +/- precision (in the metric's unit)
+        return self.replicates >= min_replicates and all(
+            welford.half_width(self.confidence) <= precision
+            for welford in self.metrics.values()
+        )
+
+    def row(self, precision: float, min_replicates: int = 3) -> dict[str, Any]:
+        # one summary csv row: mean, std and confidence interval of each metric
+        row: dict[str, Any] = {
+            "name": self.name,
+            "replicates": self.replicates,
+            "failed": self.failed,
+            "converged": self.converged(precision, min_replicates),
+        }
+        for metric, welford in self.metrics.items():
+            half_width = welford.half_width(self.confidence)
+            row[f"{metric}_mean"] = round(welford.mean, 4) if welford.count else None
+            row[f"{metric}_std"] = round(welford.std, 4) if welford.count > 1 else None
+            row[f"{metric}_ci_low"] = (
+                round(welford.mean - half_width, 4) if welford.count > 1 else None
+            )
+            row[f"{metric}_ci_high"] = (
+                round(welford.mean + half_width, 4) if welford.count > 1 else None
+            )
+        return row
+
+
+def replicate_point(
+    config_file: Callable[[int], str],
+    simulate: Callable[[str], dict],
+    extract: Callable[[str, dict], dict],
+    point: PointStats,
+    precision: float,
+    min_replicates: int = 3,
+    max_replicates: int = 10,
+    concurrency: int = 1,
+    base_seed: int = BASE_SEED,
+) -> PointStats:
+    """
+    Simulates replicates of one point with the seeds base_seed, base_seed + 1,
+    ... (config_file(seed) writes each replicate's config), concurrency at a
+    time, and adds the stats extract(config_file_path, output_dirs) returns to
+    point as each replicate finishes. No replicate is started once the point
+    has converged (see PointStats.converged) or max_replicates were started,
+    the ones still running are waited for and added too.
+    """
+    seeds = iter(range(base_seed, base_seed + max_replicates))
+    running: dict[Future, int] = {}
+
+    def replicate(seed: int) -> dict:
+        config_file_path = config_file(seed)
+        with instrument.stage("replicate", config=config_file_path, seed=seed):
+            return extract(config_file_path, simulate(config_file_path))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        def start_next():
+            if point.converged(precision, min_replicates):
+                return
+            seed = next(seeds, None)
+            if seed is not None:
+                running[executor.submit(replicate, seed)] = seed
+
+        for _ in range(concurrency):
+            start_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                seed = running.pop(future)
+                try:
+                    point.add(future.result())
+                except Exception as e:
+                    point.failed += 1
+                    print(f"FAILED {point.name} seed {seed}: {type(e).__name__}: {e}")
+                start_next()
+    return point
+
+
+# writes the config of one replicate, with the node positions of the sweep's
+# probe x (see hdn_detector.sweep_sensitivity)
+def replicate_config(s: float, x: int, ping: int, seed: int) -> str:
+    return run_config(
+        s, nodePos_change(NODE_POSITIONS, x - 1), x, ping, "../config/", seed
+    )[1]
+
+
+def run_replicates(
+    sensitivities: Sequence[float],
+    positions: Sequence[int],
+    ping: int = PING_SIZE,
+    precision: float = 1.0,
+    confidence: float = 0.95,
+    min_replicates: int = 3,
+    max_replicates: int = 10,
+    concurrency: int = 1,
+    retries: int = 1,
+    timeout: Optional[float] = None,
+    base_seed: int = BASE_SEED,
+    summary_path: str = DEFAULT_SUMMARY_CSV,
+    replicates_path: str = DEFAULT_REPLICATES_CSV,
+    backend: str = "auto",
+    cache: Optional[str] = DEFAULT_CACHE_PATH,
+    compression: Optional[str] = None,
+    reuse: bool = False,
+) -> list[dict[str, Any]]:
+    """
+    Simulates every sensitivity x node position iteration point with seeded
+    replicates until the confidence interval of each metric (METRICS) is within
+    +/- precision, or max_replicates were run (see replicate_point).
+    The stats of every replicate are written to replicates_path (see
+    StatsExporter), and the mean, std and confidence interval of each point to
+    summary_path as soon as the point is done. With reuse, replicates already
+    simulated (same seeded config and Whitefield version) are not simulated
+    again (see sweep_store). Returns the summary rows.
+    """
+    store = None
+    if reuse:
+        store = SweepStore(store_path(SIMULATION_OUTPUTS), simulator_version())
+    lock = threading.Lock()
+    rows = []
+    with Archiver(compression) as archiver, StatsExporter(replicates_path) as exporter:
+        scheduler = None
+        if concurrency > 1:
+            # replicates run at once in the scheduler's isolated directories
+            scheduler = BatchScheduler(
+                concurrency=concurrency,
+                retries=retries,
+                simulate=functools.partial(
+                    run_simulation, timeout=timeout, archiver=archiver
+                ),
+            )
+
+        def simulate(config_file_path: str) -> dict:
+            reused = store.find(config_file_path) if store is not None else None
+            if reused is not None:
+                return reused.output_dirs
+            if scheduler is not None:
+                output_dirs = scheduler.run(config_file_path)
+            else:
+                output_dirs = run_simulation(
+                    config_file_path, timeout=timeout, archiver=archiver
+                )
+            if store is not None:
+                # the same verdict as hdn_detector.sweep_sensitivity records
+                with instrument.stage("hnp_check"):
+                    hnp = hnp_in_log(os.path.join(str(output_dirs["log"]), AIRLINE_LOG))
+                store.record(config_file_path, hnp, output_dirs)
+            return output_dirs
+
+        def extract(config_file_path: str, output_dirs: dict) -> dict:
+            pcap_dir = os.path.join(str(output_dirs["pcap"]), "")
+            stats = get_stats(pcap_dir, config_file_path, backend, cache)
+            with lock:
+                exporter.write(run_id(config_file_path, pcap_dir), stats)
+            return stats
+
+        with open(summary_path, "w", newline="") as summary_file:
+            writer = None
+            try:
+                for s in sensitivities:
+                    for x in positions:
+                        config_file = functools.partial(replicate_config, s, x, ping)
+                        params = run_params(config_file(base_seed))
+                        point = replicate_point(
+                            config_file,
+                            simulate,
+                            extract,
+                            PointStats(
+                                params.file_name()[: -len(".cfg")], METRICS, confidence
+                            ),
+                            precision,
+                            min_replicates,
+                            max_replicates,
+                            concurrency,
+                            base_seed,
+                        )
+                        row = {
+                            **params._asdict(),
+                            **point.row(precision, min_replicates),
+                        }
+                        if writer is None:
+                            writer = csv.DictWriter(summary_file, fieldnames=list(row))
+                            writer.writeheader()
+                        writer.writerow(row)
+                        # a point's summary is readable as soon as it is done
+                        summary_file.flush()
+                        rows.append(row)
+                        print(
+                            f"{point.name}: {point.replicates} replicates, "
+                            + ("converged" if row["converged"] else "not converged")
+                        )
+            finally:
+                if scheduler is not None:
+                    scheduler.shutdown()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulate seeded replicates of sweep points until their "
+        + "stats are known to a given precision."
+    )
+    parser.add_argument(
+        "csv",
+        nargs="?",
+        default=DEFAULT_SUMMARY_CSV,
+        help=f"per point summary csv (default {DEFAULT_SUMMARY_CSV})",
+    )
+    parser.add_argument(
+        "--replicates-csv",
+        default=DEFAULT_REPLICATES_CSV,
+        help=f"stats of every replicate (default {DEFAULT_REPLICATES_CSV})",
+    )
+    parser.add_argument(
+        "--sensitivities",
+        type=float,
+        nargs="+",
+        default=[-100],
+        help="receive sensitivities of the points, e.g. -99 -100",
+    )
+    parser.add_argument(
+        "--positions",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="node position iterations (x) of the points",
+    )
+    parser.add_argument(
+        "--ping", type=int, default=PING_SIZE, help="ping size of the points"
+    )
+    parser.add_argument(
+        "--precision",
+        type=float,
+        default=1.0,
+        help="stop a point once the confidence interval of every metric is "
+        + "within +/- this many percentage points",
+    )
+    parser.add_argument(
+        "--confidence", type=float, default=0.95, help="confidence level"
+    )
+    parser.add_argument(
+        "--min-replicates",
+        type=int,
+        default=3,
+        help="replicates run before a point can stop",
+    )
+    parser.add_argument(
+        "--max-replicates",
+        type=int,
+        default=10,
+        help="replicates after which a point stops, converged or not",
+    )
+    parser.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=1,
+        help="number of replicates simulated at once in isolated working "
+        + "directories",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="times a failed simulation is retried (with --concurrency > 1)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="seconds after which a simulation is stopped and counted as failed",
+    )
+    parser.add_argument(
+        "--seed",
+        type=lambda value: int(value, 0),
+        default=BASE_SEED,
+        help=f"seed of the first replicate (default {BASE_SEED:#x})",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=PCAP_BACKENDS,
+        default="auto",
+        help="pcap decoder, auto uses the native reader with a tshark fallback",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="decode every pcap, without reading or writing the cache",
+    )
+    add_compress_argument(parser)
+    add_resimulate_argument(parser)
+    instrument.add_trace_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.tracing(args.trace, args.trace_format):
+        run_replicates(
+            args.sensitivities,
+            args.positions,
+            args.ping,
+            args.precision,
+            args.confidence,
+            args.min_replicates,
+            args.max_replicates,
+            args.concurrency,
+            args.retries,
+            args.timeout,
+            args.seed,
+            args.csv,
+            args.replicates_csv,
+            args.backend,
+            None if args.no_cache else DEFAULT_CACHE_PATH,
+            args.compress,
+            not args.resimulate,
+        )
+    print(f"summary written to {args.csv}")
+    print(f"replicates written to {args.replicates_csv}")
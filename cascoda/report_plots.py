@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import NamedTuple, Optional
+
+import matplotlib
+import pandas as pd
+from matplotlib.figure import Figure
+
+# figures are only drawn to PNG buffers, never shown
+matplotlib.use("Agg")
+
+PLOT_DIR = "../outputs/plots/"
+# name -> input hash of every plot in PLOT_DIR, to skip unchanged plots
+PLOT_HASHES = "plot_hashes.json"
+# bump when the plot styling changes, so every plot is rendered again
+PLOT_VERSION = 1
+
+Y_LABEL = "% of requests responded to"
+X_LABEL = "Receive Sensitivity"
+
+
+class PlotSpec(NamedTuple):
+    # everything a plot is drawn from (plain values, so it hashes and pickles)
+    name: str  # png file name
+    title: str
+    index: list  # receive sensitivities
+    columns: dict  # line label -> % responded per sensitivity (None if missing)
+    color: Optional[str]  # single line colour, None for the default colour cycle
+    legend_title: Optional[str]  # None for no legend
+
+    def digest(self) -> str:
+        data = dict(self._asdict(), version=PLOT_VERSION, mpl=matplotlib.__version__)
+        return hashlib.sha256(
+            json.dumps(data, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+
+def plot_specs(reduced_df: pd.DataFrame) -> list[PlotSpec]:
+    """
+    The combined % responded plot, then one plot per node distance (ascending).
+    """
+    plot_df = (
+        reduced_df.assign(**{"Node Distance": reduced_df["x"] * 5})[
+            ["%_responded", "s", "Node Distance"]
+        ]
+        .pivot(index="s", columns="Node Distance", values="%_responded")
+        .sort_index(axis=1)
+    )
+    index = plot_df.index.tolist()
+
+    def values(column):
+        return [None if pd.isna(v) else float(v) for v in plot_df[column]]
+
+    colors = matplotlib.rcParams["axes.prop_cycle"].by_key()["color"]
+    specs = [
+        PlotSpec(
+            "responded_V_rsens_all_nodes.png",
+            "% Responded against Receive Sensitivity per Node Distance",
+            index,
+            {str(column): values(column) for column in plot_df},
+            None,
+            "Node Distance",
+        )
+    ]
+    for count, column in enumerate(plot_df):
+        specs.append(
+            PlotSpec(
+                "responded_V_rsens_distance_" + str(column) + ".png",
+                "% Responded against Receive Sensitivity for Node Distance = "
+                + str(column),
+                index,
+                {str(column): values(column)},
+                colors[count % len(colors)],
+                None,
+            )
+        )
+    return specs
+
+
+def render_plot(spec: PlotSpec) -> bytes:
+    """
+    Draws a plot on its own figure (no pyplot global state) and returns the PNG.
+    """
+    fig = Figure(tight_layout=True)
+    ax = fig.subplots()
+    df = pd.DataFrame(spec.columns, index=pd.Index(spec.index, name="s"), dtype=float)
+    if spec.color is None:
+        df.plot(ax=ax, title=spec.title)
+    else:
+        df.iloc[:, 0].plot(ax=ax, title=spec.title, legend=False, color=spec.color)
+    ax.invert_xaxis()
+    ax.set_xlabel(X_LABEL)
+    ax.set_ylabel(Y_LABEL)
+    if spec.legend_title is not None:
+        ax.legend(
+            title=spec.legend_title,
+            loc="center left",
+            bbox_to_anchor=(1.04, 0.5),
+            borderaxespad=0,
+        )
+    image = BytesIO()
+    fig.savefig(image, format="png")
+    return image.getvalue()
+
+
+def _load_hashes(plot_dir: str) -> dict[str, str]:
+    try:
+        with open(os.path.join(plot_dir, PLOT_HASHES)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def render_plots(
+    specs: list[PlotSpec], workers: int = 0, plot_dir: Optional[str] = PLOT_DIR
+) -> list[tuple[str, BytesIO]]:
+    """
+    Returns (name, PNG buffer) of every plot, in specs order. Plots are rendered
+    in up to workers processes (0 = all cores). With a plot_dir, the PNGs are
+    also saved there and a plot whose inputs haven't changed since it was saved
+    is read back instead of being rendered again.
+    """
+    hashes = _load_hashes(plot_dir) if plot_dir else {}
+    images: dict[str, bytes] = {}
+    for spec in specs:
+        path = os.path.join(plot_dir, spec.name) if plot_dir else None
+        if path and hashes.get(spec.name) == spec.digest() and os.path.isfile(path):
+            with open(path, "rb") as f:
+                images[spec.name] = f.read()
+    todo = [spec for spec in specs if spec.name not in images]
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as executor:
+            rendered = list(executor.map(render_plot, todo))
+    else:
+        rendered = [render_plot(spec) for spec in todo]
+    print(f"{len(todo)} plots rendered, {len(specs) - len(todo)} unchanged")
+
+    if plot_dir:
+        os.makedirs(plot_dir, exist_ok=True)
+        for spec, png in zip(todo, rendered):
+            with open(os.path.join(plot_dir, spec.name), "wb") as f:
+                f.write(png)
+            hashes[spec.name] = spec.digest()
+        with open(os.path.join(plot_dir, PLOT_HASHES), "w") as f:
+            json.dump(hashes, f, indent=4)
+    images.update((spec.name, png) for spec, png in zip(todo, rendered))
+    return [(spec.name, BytesIO(images[spec.name])) for spec in specs]
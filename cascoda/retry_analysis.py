@@ -0,0 +1,89 @@
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+class RetryAnalysis(NamedTuple):
+    # consecutive runs of the same sequence number (one run = one packet + retries)
+    run_values: np.ndarray
+    run_starts: np.ndarray  # index of the first packet of each run
+    run_lengths: np.ndarray
+    # retries per unique sequence number (counting every appearance of it)
+    unique_sequences: np.ndarray
+    retries_per_sequence: np.ndarray
+    # histogram[k] = number of unique sequence numbers retried k times
+    histogram: np.ndarray
+    # same series as extract_stats.retries_per_packet
+    retries_per_packet: np.ndarray
+    # (time of the first attempt, retries) for every run, empty without times
+    retry_times: np.ndarray
+    run_retries: np.ndarray
+
+
+def run_length_encode(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns (run values, run start indices, run lengths) of a 1D array.
+    """
+    values = np.asarray(values)
+    if values.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return values[:0], empty, empty
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    lengths = np.diff(np.append(starts, values.size))
+    return values[starts], starts, lengths
+
+
+def retries_per_packet(sequences) -> np.ndarray:
+    """
+    Vectorized form of the sequential retry counter: for every consecutive pair
+    of non zero sequence numbers, a repeat emits the running retry count and a
+    change emits the count reached by the previous run (then resets it).
+    Pairs involving a 0 sequence number emit nothing and keep the count.
+    """
+    seqs = np.asarray(sequences, dtype=np.int64)
+    prev = np.concatenate(([-1], seqs[:-1]))
+    valid = (seqs != 0) & (prev != 0)
+    same = (seqs == prev)[valid]
+    if same.size == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # retries counted strictly before / up to and including each event
+    counted = np.cumsum(same)
+    before = counted - same
+    # the n-th change event starts group n, with the retry count at that point
+    group = np.cumsum(~same)
+    group_base = np.concatenate(([0], before[~same]))
+
+    repeats = counted - group_base[group]
+    changes = before - group_base[np.maximum(group - 1, 0)]
+    return np.where(same, repeats, changes)
+
+
+def analyse_retries(sequences, times: Optional[np.ndarray] = None) -> RetryAnalysis:
+    """
+    Computes every retry metric of a capture's sequence numbers in one call.
+    """
+    seqs = np.asarray(sequences, dtype=np.int64)
+    run_values, run_starts, run_lengths = run_length_encode(seqs)
+    unique_sequences, counts = np.unique(seqs, return_counts=True)
+    retries_per_sequence = counts - 1
+    histogram = np.bincount(retries_per_sequence) if seqs.size else counts
+
+    if times is not None and len(times) == seqs.size:
+        retry_times = np.asarray(times, dtype=np.float64)[run_starts]
+        run_retries = run_lengths - 1
+    else:
+        retry_times = np.zeros(0, dtype=np.float64)
+        run_retries = np.zeros(0, dtype=np.int64)
+
+    return RetryAnalysis(
+        run_values,
+        run_starts,
+        run_lengths,
+        unique_sequences,
+        retries_per_sequence,
+        histogram,
+        retries_per_packet(seqs),
+        retry_times,
+        run_retries,
+    )
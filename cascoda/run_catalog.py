@@ -0,0 +1,277 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import NamedTuple, Optional, Sequence
+
+from cascoda.airline_log import log_directory
+from cascoda.wf_config import replicate_seed, run_params
+
+CATALOG_FILE = "run_catalog.sqlite"
+# written to the backed up log folder by whitefield.run_simulation
+SIMULATION_INFO_FILE = "simulation.json"
+# timestamp of the backup folder names, e.g. pcap_2022_03_01-14_05_59
+BACKUP_DATE_FORMAT = "%Y_%m_%d-%H_%M_%S"
+# status of a simulation that ran in full
+OK_STATUS = "ok"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    config_file TEXT NOT NULL,
+    n INTEGER,
+    t INTEGER,
+    s REAL,
+    x INTEGER,
+    p INTEGER,
+    started TEXT,
+    finished TEXT,
+    wall_time_s REAL,
+    status TEXT,
+    pcap_dir TEXT NOT NULL UNIQUE,
+    log_dir TEXT,
+    seed INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_params ON runs (s, x, p);
+CREATE INDEX IF NOT EXISTS runs_name ON runs (name);
+"""
+
+
+class CatalogRun(NamedTuple):
+    # one backed up simulation, a config simulated again gets another row
+    id: int
+    name: str  # config file name without extension
+    config_file: str
+    n: Optional[int]
+    t: Optional[int]
+    s: Optional[float]
+    x: Optional[int]
+    p: Optional[int]
+    started: Optional[str]  # ISO timestamps
+    finished: Optional[str]
+    wall_time_s: Optional[float]
+    status: Optional[str]  # ok, timed_out or stopped_early
+    pcap_dir: str
+    log_dir: Optional[str]
+    seed: Optional[int]  # replicates.py runs, None for sweep runs
+
+    @property
+    def run_id(self) -> str:
+        return run_id(self.config_file, self.pcap_dir)
+
+
+# identifies a backed up run: config name and pcap folder, e.g.
+# wf_ot_n3_t1_s-99_x1_p83/pcap_2022_03_01-14_05_59
+def run_id(config_file, pcap_dir) -> str:
+    return Path(config_file).stem + "/" + Path(pcap_dir).name
+
+
+def catalog_path(simulation_outputs) -> str:
+    return os.path.join(simulation_outputs, CATALOG_FILE)
+
+
+def open_catalog(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # concurrent simulations record their runs in the same file
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(runs)")]
+    if "seed" not in columns:
+        # catalogs created before replicates were recorded
+        try:
+            with conn:
+                conn.execute("ALTER TABLE runs ADD COLUMN seed INTEGER")
+        except sqlite3.OperationalError as e:
+            # added in the meantime by another process
+            if "duplicate column" not in str(e):
+                raise
+    return conn
+
+
+def simulation_info(log_dir) -> dict:
+    # the simulation.json saved with a run's logs, empty if there is none
+    try:
+        with open(os.path.join(log_dir, SIMULATION_INFO_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def simulation_status(info: dict) -> str:
+    if info.get("timed_out"):
+        return "timed_out"
+    if info.get("stopped_early"):
+        return "stopped_early"
+    return OK_STATUS
+
+
+def record_run(
+    path: str,
+    config_file,
+    pcap_dir,
+    log_dir=None,
+    started: Optional[datetime] = None,
+    finished: Optional[datetime] = None,
+    wall_time_s: Optional[float] = None,
+    status: str = OK_STATUS,
+):
+    """
+    Adds a backed up run to the catalog at path. The run params come from the
+    config's JSON file (left empty for configs without params, e.g. the
+    template). A pcap folder already in the catalog is left as it is.
+    """
+    conn = open_catalog(path)
+    try:
+        with conn:
+            _insert_run(
+                conn,
+                config_file,
+                pcap_dir,
+                log_dir,
+                started,
+                finished,
+                wall_time_s,
+                status,
+            )
+    finally:
+        conn.close()
+
+
+def _insert_run(
+    conn: sqlite3.Connection,
+    config_file,
+    pcap_dir,
+    log_dir,
+    started: Optional[datetime],
+    finished: Optional[datetime],
+    wall_time_s: Optional[float],
+    status: str,
+):
+    try:
+        params: Sequence[Optional[float]] = run_params(config_file)
+    except ValueError:
+        params = (None,) * 5
+    conn.execute(
+        "INSERT OR IGNORE INTO runs (name, config_file, n, t, s, x, p, "
+        + "started, finished, wall_time_s, status, pcap_dir, log_dir, seed) "
+        + "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            Path(config_file).stem,
+            os.path.abspath(config_file),
+            *params,
+            started.isoformat() if started else None,
+            finished.isoformat() if finished else None,
+            wall_time_s,
+            status,
+            os.path.abspath(pcap_dir),
+            os.path.abspath(log_dir) if log_dir else None,
+            replicate_seed(config_file),
+        ),
+    )
+
+
+def _in(column: str, values: Optional[Sequence]) -> tuple[str, list]:
+    # "column IN (?, ?)" condition and its parameters, none for None
+    if values is None:
+        return "", []
+    return f"{column} IN ({', '.join('?' * len(values))})", list(values)
+
+
+def find_runs(
+    path: str,
+    sensitivities: Optional[Sequence[float]] = None,
+    positions: Optional[Sequence[int]] = None,
+    ping_sizes: Optional[Sequence[int]] = None,
+    all_runs: bool = False,
+    replicates: bool = False,
+) -> list[CatalogRun]:
+    """
+    Returns the runs of the catalog with the given receive sensitivities, node
+    position iterations (x) and ping sizes (all if None), by decreasing
+    sensitivity, then increasing x and backup order. Only the most recently
+    backed up ok run of each config is returned (runs that timed out or were
+    stopped early are left out), unless all_runs is set. The seeded runs of
+    replicates.py (several per point) are only returned with replicates.
+    """
+    conditions = []
+    values: list = []
+    for column, wanted in (("s", sensitivities), ("x", positions), ("p", ping_sizes)):
+        condition, params = _in(column, wanted)
+        if condition:
+            conditions.append(condition)
+            values += params
+    if not replicates:
+        conditions.append("seed IS NULL")
+    if not all_runs:
+        conditions.append(
+            "id = (SELECT MAX(id) FROM runs AS r "
+            + "WHERE r.name = runs.name AND r.status = ?)"
+        )
+        values.append(OK_STATUS)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    conn = open_catalog(path)
+    try:
+        rows = conn.execute(
+            f"SELECT * FROM runs {where} ORDER BY s DESC, x, p, name, id",
+            values,
+        ).fetchall()
+    finally:
+        conn.close()
+    return [CatalogRun(*row) for row in rows]
+
+
+def _backup_date(folder_name: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(folder_name.split("_", 1)[1], BACKUP_DATE_FORMAT)
+    except (IndexError, ValueError):
+        return None
+
+
+def rebuild_catalog(simulation_outputs, config_dir="../config") -> int:
+    """
+    Adds every run backed up under simulation_outputs (<config name>/pcap_<date>
+    folders) to its catalog, e.g. runs backed up before the catalog existed.
+    Returns the number of runs added.
+    """
+    conn = open_catalog(catalog_path(simulation_outputs))
+    try:
+        before = conn.total_changes
+        with conn:
+            for run_dir in sorted(os.scandir(simulation_outputs), key=_name):
+                if run_dir.is_dir():
+                    _add_run_dir(conn, run_dir.path, config_dir)
+        return conn.total_changes - before
+    finally:
+        conn.close()
+
+
+def _name(entry: os.DirEntry) -> str:
+    return entry.name
+
+
+def _add_run_dir(conn: sqlite3.Connection, run_dir: str, config_dir):
+    # the pcap folders of one config, oldest first so the ids follow the backups
+    config_file = os.path.join(config_dir, os.path.basename(run_dir) + ".cfg")
+    for entry in sorted(os.scandir(run_dir), key=_name):
+        if not (entry.is_dir() and entry.name.startswith("pcap")):
+            continue
+        log_dir = log_directory(entry.path)
+        info = simulation_info(log_dir) if log_dir is not None else {}
+        finished = _backup_date(entry.name)
+        wall_time = info.get("wall_time_s")
+        started = None
+        if finished is not None and wall_time is not None:
+            started = finished - timedelta(seconds=wall_time)
+        _insert_run(
+            conn,
+            config_file,
+            entry.path,
+            log_dir,
+            started,
+            finished,
+            wall_time,
+            simulation_status(info),
+        )
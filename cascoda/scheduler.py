@@ -0,0 +1,201 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+from cascoda.whitefield import WHITEFIELD_PATH, run_simulation, simulation_wall_time
+
+JOBS_ROOT = "../simulation_jobs"
+
+# created fresh in every job directory, everything else is linked to whitefield
+JOB_LOCAL_DIRS = ("log", "pcap")
+# whitefield_status.sh is run from scripts/
+JOB_SCRIPT_DIRS = ("scripts",)
+
+
+def prepare_workdir(workdir, wf_path=WHITEFIELD_PATH) -> Path:
+    """
+    Builds an isolated Whitefield working directory: every entry of wf_path is
+    symlinked, except the log and pcap folders (which also hold the UDS paths)
+    that each job gets on its own. Folders that scripts are run from get real
+    directories, so relative paths like ../log stay inside the job directory.
+    """
+    workdir = Path(workdir)
+    wf_path = Path(wf_path).resolve()
+    _link_entries(wf_path, workdir, JOB_LOCAL_DIRS + JOB_SCRIPT_DIRS)
+    for folder in JOB_SCRIPT_DIRS:
+        if (wf_path / folder).is_dir():
+            _link_entries(wf_path / folder, workdir / folder, ())
+    for folder in JOB_LOCAL_DIRS:
+        (workdir / folder).mkdir(exist_ok=True)
+    return workdir
+
+
+def _link_entries(source: Path, target: Path, skip: tuple):
+    target.mkdir(parents=True, exist_ok=True)
+    for entry in source.iterdir():
+        link = target / entry.name
+        if entry.name in skip or link.exists() or link.is_symlink():
+            continue
+        link.symlink_to(entry)
+
+
+# empties the per job folders, e.g. before retrying a failed simulation
+def reset_workdir(workdir):
+    for folder in JOB_LOCAL_DIRS:
+        shutil.rmtree(Path(workdir, folder), ignore_errors=True)
+        Path(workdir, folder).mkdir()
+
+
+class JobManifest:
+    """
+    The JSON manifest of a batch of simulations: one record per job (config,
+    status, attempts, working directory, outputs and times), rewritten after
+    every change so it survives a crash. Shared by BatchScheduler and
+    wf_async.run_batch, which only differ in how they wait for a simulation.
+    """
+
+    def __init__(self, manifest_path: Optional[str] = None):
+        current_date_formatted = datetime.now().strftime("%Y_%m_%d-%H_%M_%S")
+        self.path = manifest_path or (
+            "../logs/batch_manifest_" + current_date_formatted + ".json"
+        )
+        self.jobs: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, config_file: str, job_id: Optional[str] = None) -> dict:
+        job: dict = {}
+        self.record(
+            job,
+            job_id=job_id or Path(config_file).stem,
+            config_file=str(config_file),
+            status="queued",
+            attempts=0,
+        )
+        return job
+
+    def start(self, job: dict, workdir) -> float:
+        # the job got a slot, returns its start time for finish()
+        self.record(
+            job,
+            status="running",
+            workdir=str(workdir),
+            started=datetime.now().isoformat(),
+        )
+        return time.monotonic()
+
+    def attempt_failed(self, job: dict, error: Exception, workdir):
+        lines = traceback.format_exception_only(type(error), error)
+        self.record(job, error="".join(lines).strip())
+        # the next attempt starts from clean output folders
+        reset_workdir(workdir)
+
+    def succeeded(self, job: dict, outputs: dict):
+        outputs = {
+            folder: str(Path(path).resolve()) for folder, path in outputs.items()
+        }
+        self.record(
+            job,
+            status="ok",
+            outputs=outputs,
+            wall_time_s=simulation_wall_time(outputs.get("log", "")),
+        )
+
+    def finish(self, job: dict, started: float):
+        self.record(
+            job,
+            finished=datetime.now().isoformat(),
+            duration_s=round(time.monotonic() - started, 3),
+        )
+
+    def record(self, job: dict, **changes):
+        with self._lock:
+            job.update(changes)
+            if not any(known is job for known in self.jobs):
+                self.jobs.append(job)
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(self.jobs, f, indent=4)
+
+
+class BatchScheduler:
+    """
+    Runs Whitefield simulations concurrently, each in its own working directory.
+    At most `concurrency` simulations run at once, a failed simulation is
+    retried up to `retries` times, and every job is recorded in a JSON manifest.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 2,
+        retries: int = 1,
+        manifest_path: Optional[str] = None,
+        jobs_root: str = JOBS_ROOT,
+        wf_path: str = WHITEFIELD_PATH,
+        simulate: Callable = run_simulation,
+    ):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.simulate = simulate
+        self.manifest = JobManifest(manifest_path)
+        self.manifest_path = self.manifest.path
+        # one working directory per slot, a job holds a slot while it runs
+        self._slots: queue.Queue = queue.Queue()
+        for slot in range(concurrency):
+            workdir = Path(jobs_root, f"slot_{slot}")
+            self._slots.put(prepare_workdir(workdir, wf_path))
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def run(self, config_file: str, job_id: Optional[str] = None) -> dict:
+        """
+        Runs one simulation (blocking until a slot is free) and returns its
+        output directories. Raises the last error if every attempt failed.
+        """
+        record = self._run_job(config_file, job_id)
+        if record["status"] != "ok":
+            raise RuntimeError(f"{record['job_id']} failed: {record['error']}")
+        return {folder: Path(path) for folder, path in record["outputs"].items()}
+
+    def _run_job(self, config_file: str, job_id: Optional[str] = None) -> dict:
+        job = self.manifest.add(config_file, job_id)
+        workdir = self._slots.get()
+        started = self.manifest.start(job, workdir)
+        try:
+            for attempt in range(1, self.retries + 2):
+                self.manifest.record(job, attempts=attempt)
+                try:
+                    outputs = self.simulate(
+                        os.path.abspath(config_file), wf_path=str(workdir)
+                    )
+                except Exception as e:
+                    self.manifest.attempt_failed(job, e, workdir)
+                    continue
+                self.manifest.succeeded(job, outputs)
+                break
+            else:
+                self.manifest.record(job, status="failed")
+        finally:
+            self._slots.put(workdir)
+            self.manifest.finish(job, started)
+        return job
+
+    def submit(self, config_file: str, job_id: Optional[str] = None) -> Future:
+        return self._executor.submit(self._run_job, config_file, job_id)
+
+    def run_batch(self, config_files: list[str]) -> list[dict]:
+        """
+        Runs every config and returns the job records in config order.
+        A job failing does not stop the others.
+        """
+        futures = [self.submit(config_file) for config_file in config_files]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self._executor.shutdown()
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Callable, Optional
+
+import numpy as np
+
+from cascoda.archive import output_path, output_size
+from cascoda.packet_table import PacketTable
+
+# bump when pcap decoding or the PacketTable layout changes, invalidates the cache
+EXTRACTOR_VERSION = 1
+
+DEFAULT_CACHE_PATH = "../outputs/stats_cache.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packet_tables (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    version INTEGER,
+    backend TEXT,
+    key_hash TEXT,
+    start REAL,
+    times BLOB,
+    seqs BLOB,
+    types BLOB,
+    src BLOB,
+    dst BLOB,
+    addresses TEXT
+)
+"""
+
+
+def open_cache(cache_path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    # several extraction workers may share the file
+    conn = sqlite3.connect(cache_path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(_SCHEMA)
+    return conn
+
+
+# everything that must match for a cached table to still be valid
+def cache_key(pcap_path: str, network_key: Optional[bytes], backend: str) -> tuple:
+    # the size before compression, compressing keeps the modification time
+    # (archive.compress_file), so a pcap compressed since is not decoded again
+    mtime_ns = os.stat(output_path(pcap_path) or pcap_path).st_mtime_ns
+    key_hash = hashlib.sha256(network_key).hexdigest() if network_key else ""
+    return (
+        os.path.abspath(pcap_path),
+        output_size(pcap_path),
+        mtime_ns,
+        EXTRACTOR_VERSION,
+        backend,
+        key_hash,
+    )
+
+
+def load_table(conn: sqlite3.Connection, key: tuple) -> Optional[PacketTable]:
+    row = conn.execute(
+        "SELECT size, mtime_ns, version, backend, key_hash, start, times, seqs, "
+        + "types, src, dst, addresses FROM packet_tables WHERE path = ?",
+        (key[0],),
+    ).fetchone()
+    if row is None or tuple(row[:5]) != key[1:]:
+        return None
+    start, times, seqs, types, src, dst, addresses = row[5:]
+    return PacketTable(
+        start,
+        np.frombuffer(times, dtype=np.float64),
+        np.frombuffer(seqs, dtype=np.int32),
+        np.frombuffer(types, dtype=np.uint8),
+        np.frombuffer(src, dtype=np.int32),
+        np.frombuffer(dst, dtype=np.int32),
+        json.loads(addresses),
+    )
+
+
+def store_table(conn: sqlite3.Connection, key: tuple, table: PacketTable):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO packet_tables VALUES "
+            + "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            key
+            + (
+                table.start,
+                table.times.astype(np.float64).tobytes(),
+                table.seqs.astype(np.int32).tobytes(),
+                table.types.astype(np.uint8).tobytes(),
+                table.src.astype(np.int32).tobytes(),
+                table.dst.astype(np.int32).tobytes(),
+                json.dumps(table.addresses),
+            ),
+        )
+
+
+def cached_table(
+    cache_path: str,
+    pcap_path: str,
+    network_key: Optional[bytes],
+    backend: str,
+    decode: Callable[[], PacketTable],
+) -> PacketTable:
+    """
+    Returns the table of pcap_path from the cache, only calling decode() when
+    the file is new or has changed since it was cached.
+    """
+    key = cache_key(pcap_path, network_key, backend)
+    conn = open_cache(cache_path)
+    try:
+        table = load_table(conn, key)
+        if table is None:
+            table = decode()
+            store_table(conn, key, table)
+    finally:
+        conn.close()
+    return table
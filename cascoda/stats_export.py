@@ -0,0 +1,134 @@
+import csv
+import os
+from typing import Any, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # the raw series fall back to a long format csv
+    pa = None
+    pq = None
+
+SERIES_SCHEMA_FIELDS = ("run_id", "series", "index", "value")
+
+
+def split_stats(stats: dict[str, Any]) -> Tuple[dict[str, Any], dict[str, list]]:
+    """
+    Splits a run's stats into the summary values and the raw per packet series
+    (every list valued stat, e.g. sequence_numbers_0, time_0).
+    """
+    summary = {}
+    series = {}
+    for key, value in stats.items():
+        if isinstance(value, list):
+            series[key] = value
+        else:
+            summary[key] = value
+    return summary, series
+
+
+def series_path(summary_path: str) -> str:
+    stem = os.path.splitext(summary_path)[0]
+    return stem + ("_series.parquet" if pa is not None else "_series.csv")
+
+
+class StatsExporter:
+    """
+    Writes each run's stats as soon as it is available: one summary row per run
+    to a csv, and the raw series in long format (run_id, series, index, value)
+    to a Parquet file (csv if pyarrow is not installed).
+    Nothing is kept in memory between runs. The csv header has every summary
+    column of the runs written so far, a run with new columns (e.g. other end
+    nodes) rewrites the csv with the wider header.
+    """
+
+    def __init__(self, summary_path: str, raw_series_path: Optional[str] = None):
+        self.summary_path = summary_path
+        self.series_path = raw_series_path or series_path(summary_path)
+        self._summary_file = open(summary_path, "w", newline="")
+        self._summary_writer: Optional[csv.DictWriter] = None
+        self._series_writer: Any = None
+        self._series_file = None
+        self.runs = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, run_id: str, stats: dict[str, Any]):
+        summary, series = split_stats(stats)
+        summary["run_id"] = run_id
+        self._write_summary(summary)
+        self._write_series(run_id, series)
+        self.runs += 1
+
+    def _write_summary(self, summary: dict[str, Any]):
+        if self._summary_writer is None:
+            self._summary_writer = csv.DictWriter(
+                self._summary_file, fieldnames=list(summary)
+            )
+            self._summary_writer.writeheader()
+        fieldnames = list(self._summary_writer.fieldnames)
+        new = [key for key in summary if key not in fieldnames]
+        if new:
+            # e.g. the per node columns of a run with other nodes than the first
+            self._add_columns(fieldnames + new)
+        self._summary_writer.writerow(summary)
+        self._summary_file.flush()
+
+    def _add_columns(self, fieldnames: list[str]):
+        """
+        Rewrites the summary csv with a header of fieldnames, the rows already
+        written get empty values in the new columns. The rows are copied one at
+        a time to a temporary file, which then replaces the csv.
+        """
+        self._summary_file.close()
+        tmp = self.summary_path + ".tmp"
+        with open(self.summary_path, newline="") as src, open(
+            tmp, "w", newline=""
+        ) as dst:
+            writer = csv.DictWriter(dst, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(csv.DictReader(src))
+        os.replace(tmp, self.summary_path)
+        self._summary_file = open(self.summary_path, "a", newline="")
+        self._summary_writer = csv.DictWriter(self._summary_file, fieldnames=fieldnames)
+
+    def _write_series(self, run_id: str, series: dict[str, list]):
+        if pa is not None:
+            run_ids, names, indices, values = [], [], [], []
+            for name, data in series.items():
+                run_ids.extend([run_id] * len(data))
+                names.extend([name] * len(data))
+                indices.extend(range(len(data)))
+                values.extend(data)
+            table = pa.table(
+                {
+                    "run_id": pa.array(run_ids, pa.string()).dictionary_encode(),
+                    "series": pa.array(names, pa.string()).dictionary_encode(),
+                    "index": pa.array(indices, pa.int32()),
+                    "value": pa.array(values, pa.float64()),
+                }
+            )
+            if self._series_writer is None:
+                self._series_writer = pq.ParquetWriter(self.series_path, table.schema)
+            self._series_writer.write_table(table)
+        else:
+            if self._series_writer is None:
+                self._series_file = open(self.series_path, "w", newline="")
+                self._series_writer = csv.writer(self._series_file)
+                self._series_writer.writerow(SERIES_SCHEMA_FIELDS)
+            for name, data in series.items():
+                self._series_writer.writerows(
+                    (run_id, name, i, value) for i, value in enumerate(data)
+                )
+            self._series_file.flush()
+
+    def close(self):
+        self._summary_file.close()
+        if pa is not None and self._series_writer is not None:
+            self._series_writer.close()
+        if self._series_file is not None:
+            self._series_file.close()
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from cascoda.run_catalog import simulation_info
+from cascoda.wf_config import WfConfig
+
+SWEEP_STORE_FILE = "sweep_results.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    config_sha256 TEXT NOT NULL,
+    simulator_version TEXT NOT NULL,
+    name TEXT NOT NULL,
+    hnp INTEGER NOT NULL,
+    stopped_early INTEGER NOT NULL,
+    log_dir TEXT NOT NULL,
+    pcap_dir TEXT NOT NULL,
+    recorded TEXT NOT NULL,
+    PRIMARY KEY (config_sha256, simulator_version)
+)
+"""
+
+
+class SweepPoint(NamedTuple):
+    # the result of simulating one config
+    name: str  # config file name without extension
+    hnp: bool  # the HNP showed up in airline.log
+    stopped_early: bool  # outputs only cover the simulation up to the HNP
+    log_dir: str
+    pcap_dir: str
+
+    @property
+    def output_dirs(self) -> dict[str, Path]:
+        # as returned by whitefield.run_simulation
+        return {"log": Path(self.log_dir), "pcap": Path(self.pcap_dir)}
+
+
+def store_path(simulation_outputs) -> str:
+    return os.path.join(simulation_outputs, SWEEP_STORE_FILE)
+
+
+def open_store(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # the sweeps of several sensitivities record their points at the same time
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(_SCHEMA)
+    return conn
+
+
+class SweepStore:
+    """
+    The HNP verdict and output folders of every config simulated by a sweep,
+    keyed by the config's content (see WfConfig.digest) and the simulator
+    version, so a sweep run again (or resumed after an interruption) only
+    simulates the configs it has no result for.
+    Results whose output folders were deleted since are not reused. Results of
+    simulations stopped early are only reused with allow_stopped_early.
+    """
+
+    def __init__(
+        self, path: str, simulator_version: str, allow_stopped_early: bool = False
+    ):
+        self.path = path
+        self.simulator_version = simulator_version
+        self.allow_stopped_early = allow_stopped_early
+
+    def find(self, config_file) -> Optional[SweepPoint]:
+        conn = open_store(self.path)
+        try:
+            row = conn.execute(
+                "SELECT name, hnp, stopped_early, log_dir, pcap_dir FROM points "
+                + "WHERE config_sha256 = ? AND simulator_version = ?",
+                (WfConfig.read(config_file).digest(), self.simulator_version),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        point = SweepPoint(row[0], bool(row[1]), bool(row[2]), row[3], row[4])
+        if point.stopped_early and not self.allow_stopped_early:
+            return None
+        if not (os.path.isdir(point.log_dir) and os.path.isdir(point.pcap_dir)):
+            return None
+        return point
+
+    def record(self, config_file, hnp: bool, output_dirs: dict):
+        # replaces any earlier result of the same config and simulator
+        log_dir = os.path.abspath(output_dirs["log"])
+        conn = open_store(self.path)
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        WfConfig.read(config_file).digest(),
+                        self.simulator_version,
+                        Path(config_file).stem,
+                        int(hnp),
+                        int(bool(simulation_info(log_dir).get("stopped_early"))),
+                        log_dir,
+                        os.path.abspath(output_dirs["pcap"]),
+                        datetime.now().isoformat(),
+                    ),
+                )
+        finally:
+            conn.close()
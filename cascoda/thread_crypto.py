@@ -0,0 +1,205 @@
+import hashlib
+import hmac
+import struct
+from typing import Optional
+
+
+def _xtime(a: int) -> int:
+    a <<= 1
+    return (a ^ 0x11B) if a & 0x100 else a
+
+
+def _build_sbox() -> list[int]:
+    # multiplicative inverse in GF(2^8) followed by the AES affine transform
+    sbox = [0] * 256
+    p = q = 1
+    while True:
+        p = p ^ _xtime(p)
+        q ^= q << 1
+        q ^= q << 2
+        q ^= q << 4
+        q &= 0xFF
+        if q & 0x80:
+            q ^= 0x09
+        x = q ^ (q << 1 | q >> 7) ^ (q << 2 | q >> 6) ^ (q << 3 | q >> 5)
+        x ^= q << 4 | q >> 4
+        sbox[p] = (x ^ 0x63) & 0xFF
+        if p == 1:
+            break
+    sbox[0] = 0x63
+    return sbox
+
+
+_SBOX = _build_sbox()
+
+# T-tables: SubBytes, ShiftRows and MixColumns folded into one lookup per byte
+_TE0 = []
+for _s in _SBOX:
+    _s2 = _xtime(_s) & 0xFF
+    _TE0.append((_s2 << 24) | (_s << 16) | (_s << 8) | (_s2 ^ _s))
+_TE1 = [((t >> 8) | (t << 24)) & 0xFFFFFFFF for t in _TE0]
+_TE2 = [((t >> 16) | (t << 16)) & 0xFFFFFFFF for t in _TE0]
+_TE3 = [((t >> 24) | (t << 8)) & 0xFFFFFFFF for t in _TE0]
+_RCON = [0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80, 0x1B, 0x36]
+
+
+def expand_key(key: bytes) -> list[int]:
+    """
+    Returns the 44 word AES-128 encryption key schedule.
+    """
+    if len(key) != 16:
+        raise ValueError("AES-128 requires a 16 byte key")
+    w = list(struct.unpack(">4I", key))
+    for i in range(4, 44):
+        t = w[i - 1]
+        if i % 4 == 0:
+            t = ((t << 8) | (t >> 24)) & 0xFFFFFFFF
+            t = (
+                (_SBOX[t >> 24] << 24)
+                | (_SBOX[(t >> 16) & 0xFF] << 16)
+                | (_SBOX[(t >> 8) & 0xFF] << 8)
+                | _SBOX[t & 0xFF]
+            ) ^ (_RCON[i // 4 - 1] << 24)
+        w.append(w[i - 4] ^ t)
+    return w
+
+
+def aes_encrypt_block(schedule: list[int], block: bytes) -> bytes:
+    s0, s1, s2, s3 = struct.unpack(">4I", block)
+    s0 ^= schedule[0]
+    s1 ^= schedule[1]
+    s2 ^= schedule[2]
+    s3 ^= schedule[3]
+    for r in range(1, 10):
+        k = 4 * r
+        t0 = (
+            _TE0[s0 >> 24]
+            ^ _TE1[(s1 >> 16) & 0xFF]
+            ^ _TE2[(s2 >> 8) & 0xFF]
+            ^ _TE3[s3 & 0xFF]
+            ^ schedule[k]
+        )
+        t1 = (
+            _TE0[s1 >> 24]
+            ^ _TE1[(s2 >> 16) & 0xFF]
+            ^ _TE2[(s3 >> 8) & 0xFF]
+            ^ _TE3[s0 & 0xFF]
+            ^ schedule[k + 1]
+        )
+        t2 = (
+            _TE0[s2 >> 24]
+            ^ _TE1[(s3 >> 16) & 0xFF]
+            ^ _TE2[(s0 >> 8) & 0xFF]
+            ^ _TE3[s1 & 0xFF]
+            ^ schedule[k + 2]
+        )
+        t3 = (
+            _TE0[s3 >> 24]
+            ^ _TE1[(s0 >> 16) & 0xFF]
+            ^ _TE2[(s1 >> 8) & 0xFF]
+            ^ _TE3[s2 & 0xFF]
+            ^ schedule[k + 3]
+        )
+        s0, s1, s2, s3 = t0, t1, t2, t3
+    # final round has no MixColumns
+    out = []
+    for a, b, c, d, k in (
+        (s0, s1, s2, s3, schedule[40]),
+        (s1, s2, s3, s0, schedule[41]),
+        (s2, s3, s0, s1, schedule[42]),
+        (s3, s0, s1, s2, schedule[43]),
+    ):
+        out.append(
+            (
+                (_SBOX[a >> 24] << 24)
+                | (_SBOX[(b >> 16) & 0xFF] << 16)
+                | (_SBOX[(c >> 8) & 0xFF] << 8)
+                | _SBOX[d & 0xFF]
+            )
+            ^ k
+        )
+    return struct.pack(">4I", *out)
+
+
+def _xor(a: bytes, b: bytes) -> bytes:
+    return bytes(x ^ y for x, y in zip(a, b))
+
+
+def _ccm_keystream(schedule: list[int], nonce: bytes, length: int) -> bytes:
+    # counter blocks A_i = flags (L' = 1) || nonce || i, starting at i = 1
+    blocks = [
+        aes_encrypt_block(schedule, b"\x01" + nonce + struct.pack(">H", i))
+        for i in range(1, (length + 15) // 16 + 1)
+    ]
+    return b"".join(blocks)[:length]
+
+
+def _ccm_mac(
+    schedule: list[int], nonce: bytes, a_data: bytes, m_data: bytes, mic_len: int
+) -> bytes:
+    flags = (0x40 if a_data else 0) | (((mic_len - 2) // 2) << 3) | 0x01
+    x = aes_encrypt_block(
+        schedule, bytes([flags]) + nonce + struct.pack(">H", len(m_data))
+    )
+    blocks = b""
+    if a_data:
+        auth = struct.pack(">H", len(a_data)) + a_data
+        blocks += auth + b"\x00" * (-len(auth) % 16)
+    blocks += m_data + b"\x00" * (-len(m_data) % 16)
+    for i in range(0, len(blocks), 16):
+        x = aes_encrypt_block(schedule, _xor(x, blocks[i : i + 16]))
+    return x[:mic_len]
+
+
+def ccm_star_decrypt(
+    schedule: list[int],
+    nonce: bytes,
+    a_data: bytes,
+    c_data: bytes,
+    mic_len: int,
+    encrypted: bool = True,
+) -> Optional[bytes]:
+    """
+    Decrypts and authenticates an IEEE 802.15.4 CCM* payload.
+    Returns the plaintext, or None if the MIC does not match (wrong key/nonce).
+    """
+    if len(c_data) < mic_len:
+        return None
+    body, mic = c_data[: len(c_data) - mic_len], c_data[len(c_data) - mic_len :]
+    if encrypted:
+        plaintext = _xor(body, _ccm_keystream(schedule, nonce, len(body)))
+    else:
+        plaintext = body
+        a_data = a_data + body
+    if mic_len:
+        s0 = aes_encrypt_block(schedule, b"\x01" + nonce + b"\x00\x00")
+        expected = _ccm_mac(
+            schedule, nonce, a_data, plaintext if encrypted else b"", mic_len
+        )
+        if _xor(mic, s0[:mic_len]) != expected:
+            return None
+    return plaintext
+
+
+def ccm_star_encrypt(
+    schedule: list[int], nonce: bytes, a_data: bytes, m_data: bytes, mic_len: int
+) -> bytes:
+    """
+    Encrypts m_data and appends the MIC (the inverse of ccm_star_decrypt).
+    """
+    ciphertext = _xor(m_data, _ccm_keystream(schedule, nonce, len(m_data)))
+    if not mic_len:
+        return ciphertext
+    s0 = aes_encrypt_block(schedule, b"\x01" + nonce + b"\x00\x00")
+    mic = _xor(_ccm_mac(schedule, nonce, a_data, m_data, mic_len), s0[:mic_len])
+    return ciphertext + mic
+
+
+def thread_mac_key(network_key: bytes, key_sequence: int) -> bytes:
+    """
+    Derives the Thread MAC key for key_sequence (second half of HMAC-SHA256).
+    """
+    digest = hmac.new(
+        network_key, struct.pack(">I", key_sequence) + b"Thread", hashlib.sha256
+    ).digest()
+    return digest[16:]
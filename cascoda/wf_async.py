@@ -0,0 +1,397 @@
+import argparse
+import asyncio
+import os
+import signal
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+from cascoda import instrument
+from cascoda.airline_log import AIRLINE_LOG, HNP_MESSAGE, follow_log
+from cascoda.archive import Archiver, add_compress_argument
+from cascoda.scheduler import JOBS_ROOT, JobManifest, prepare_workdir
+from cascoda.whitefield import (
+    POLL_MAX,
+    POLL_MIN,
+    WHITEFIELD_PATH,
+    airline_pids,
+    finish_simulation,
+    invoked_config,
+    pid_running,
+)
+
+# time limits (seconds) of the Whitefield scripts, a hung script is killed
+START_TIMEOUT = 120
+STOP_TIMEOUT = 60
+STATUS_TIMEOUT = 10
+# seconds a script gets to exit after SIGTERM before it is killed
+KILL_GRACE = 2
+
+
+class CommandResult(NamedTuple):
+    returncode: int
+    lines: list[str]  # stdout and stderr, in the order written
+
+
+async def _terminate(process: asyncio.subprocess.Process):
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), KILL_GRACE)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+async def run_command(
+    args: list[str],
+    cwd,
+    timeout: Optional[float] = None,
+    on_line: Optional[Callable[[str], None]] = None,
+) -> CommandResult:
+    """
+    Runs a command without blocking the event loop. Each line it writes is
+    passed to on_line as soon as it is read, instead of buffering the whole
+    output. If the command is still running after timeout seconds it is
+    terminated and TimeoutError is raised. If the calling task is cancelled
+    the command is terminated too.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    lines = []
+
+    async def read() -> int:
+        assert process.stdout is not None
+        async for raw in process.stdout:
+            line = raw.decode("utf-8", "replace").rstrip()
+            lines.append(line)
+            if on_line is not None:
+                on_line(line)
+        return await process.wait()
+
+    try:
+        returncode = await asyncio.wait_for(read(), timeout)
+    except asyncio.TimeoutError:
+        await _terminate(process)
+        raise TimeoutError(f"{args[0]} still running after {timeout} s") from None
+    except asyncio.CancelledError:
+        await _terminate(process)
+        raise
+    return CommandResult(returncode, lines)
+
+
+async def wait_for_pids(pids):
+    """
+    Returns once every process in pids has exited. The event loop watches
+    their pidfds (Linux >= 5.3), else they are polled with a growing interval.
+    """
+    loop = asyncio.get_running_loop()
+    fds = []
+    try:
+        waiters = []
+        for pid in pids:
+            try:
+                fd = os.pidfd_open(pid)
+            except ProcessLookupError:
+                continue
+            except (AttributeError, OSError):  # no pidfd support
+                break
+            fds.append(fd)
+            waiter = loop.create_future()
+            loop.add_reader(fd, _on_exit, loop, fd, waiter)
+            waiters.append(waiter)
+        else:
+            await asyncio.gather(*waiters)
+            return
+    finally:
+        for fd in fds:
+            loop.remove_reader(fd)
+            os.close(fd)
+
+    interval = POLL_MIN
+    while any(pid_running(pid) for pid in pids):
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, POLL_MAX)
+
+
+def _on_exit(loop: asyncio.AbstractEventLoop, fd: int, waiter: asyncio.Future):
+    # a pidfd stays readable once its process exits, only wake up once
+    loop.remove_reader(fd)
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class WhitefieldController:
+    """
+    Controls the Whitefield simulations of one working directory (wf_path) from
+    an asyncio event loop, the coroutine counterpart of whitefield.py. The
+    start, stop and status scripts run as non-blocking subprocesses with their
+    own time limits, their output printed line by line as it comes. Several
+    controllers (e.g. one per isolated job directory, see run_batch) share one
+    event loop and thread.
+    """
+
+    def __init__(self, wf_path=WHITEFIELD_PATH, name: Optional[str] = None):
+        self.wf_path = str(wf_path)
+        # prefixes the printed lines, so concurrent simulations can be told apart
+        self.name = name or os.path.basename(os.path.normpath(self.wf_path))
+
+    def _print(self, line: str):
+        print(f"[{self.name}] {line}")
+
+    async def start(self, config_file, timeout: Optional[float] = START_TIMEOUT):
+        result = await run_command(
+            ["./invoke_whitefield.sh", str(config_file)],
+            self.wf_path,
+            timeout,
+            self._print,
+        )
+        if not any("Started OK" in line for line in result.lines):
+            self._print("ERROR config file not found (look for typos)")
+
+    async def stop(self, timeout: Optional[float] = STOP_TIMEOUT):
+        await run_command(
+            ["./scripts/wfshell", "stop_whitefield"],
+            self.wf_path,
+            timeout,
+            self._print,
+        )
+
+    async def status(self, timeout: Optional[float] = STATUS_TIMEOUT) -> list[str]:
+        result = await run_command(
+            ["./whitefield_status.sh"],
+            os.path.join(self.wf_path, "scripts"),
+            timeout,
+        )
+        return result.lines
+
+    async def wait_for_completion(
+        self, timeout: Optional[float] = None, ignore_pids=()
+    ) -> float:
+        """
+        Waits until the simulation running from wf_path stops, like
+        whitefield.wait_for_completion but without blocking the event loop.
+        Returns the wall time waited in seconds, raises TimeoutError after
+        timeout seconds.
+        """
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._wait(ignore_pids), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Whitefield still running after {timeout} s") from None
+        return time.monotonic() - started
+
+    async def _wait(self, ignore_pids):
+        pids = airline_pids(self.wf_path, ignore_pids)
+        if pids:
+            await wait_for_pids(pids)
+            return
+        interval = POLL_MIN
+        while "Whitefield stopped" not in await self.status():
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, POLL_MAX)
+
+    async def run(
+        self,
+        config_file,
+        timeout: Optional[float] = None,
+        stop_on: Optional[str] = None,
+        archiver: Optional[Archiver] = None,
+    ) -> dict:
+        """
+        Runs one simulation like whitefield.run_simulation (timeout, stop_on and
+        archiver work the same way) and returns its output directories.
+        If the task is cancelled, Whitefield is stopped and the outputs are left
+        in wf_path.
+        """
+        with instrument.stage("simulation", config=str(config_file)):
+            return await self._run(config_file, timeout, stop_on, archiver)
+
+    async def _run(self, config_file, timeout, stop_on, archiver) -> dict:
+        wf_config_file = invoked_config(config_file)
+        self._print("invoking whitefield with " + str(wf_config_file))
+        started = time.monotonic()
+        started_at = datetime.now()
+        already_running = airline_pids(self.wf_path) or []
+        try:
+            with instrument.stage("simulation.start"):
+                await self.start(wf_config_file)
+            with instrument.stage("simulation.wait"):
+                timed_out, stopped_early = await self._wait_or_stop(
+                    timeout, stop_on, already_running
+                )
+        except asyncio.CancelledError:
+            # don't leave the simulation running
+            await asyncio.shield(self.stop())
+            raise
+        wall_time = time.monotonic() - started
+        if stopped_early:
+            self._print(f"Stopped early, found: {stop_on}")
+        with instrument.stage("simulation.stop"):
+            await self.stop()
+        # moving the folders is a rename, unless it copies across file systems
+        return await asyncio.to_thread(
+            finish_simulation,
+            config_file,
+            self.wf_path,
+            started_at,
+            wall_time,
+            timed_out,
+            stopped_early,
+            archiver,
+            timeout,
+        )
+
+    async def _wait_or_stop(self, timeout, stop_on, already_running):
+        # (timed out, stopped early), the log is followed with stop_on
+        waiter = asyncio.ensure_future(
+            self.wait_for_completion(timeout, already_running)
+        )
+        follower = None
+        if stop_on is not None:
+            follower = asyncio.ensure_future(
+                follow_log(os.path.join(self.wf_path, "log", AIRLINE_LOG), stop_on)
+            )
+        try:
+            if follower is not None:
+                await asyncio.wait(
+                    {waiter, follower}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if _matched(follower) and not waiter.done():
+                    await self.stop()
+            await waiter
+            timed_out = False
+        except TimeoutError:
+            timed_out = True
+        finally:
+            for task in (waiter, follower):
+                if task is not None and not task.done():
+                    task.cancel()
+        stopped_early = follower is not None and _matched(follower)
+        if follower is not None and follower.done() and not follower.cancelled():
+            error = follower.exception()
+            if error is not None:
+                self._print(f"WARNING could not follow {AIRLINE_LOG}: {error!r}")
+        return timed_out, stopped_early
+
+
+# whether a follow_log task found its message (it may also have failed)
+def _matched(follower: asyncio.Future) -> bool:
+    return follower.done() and not follower.cancelled() and follower.exception() is None
+
+
+async def run_batch(
+    config_files: list[str],
+    concurrency: int = 2,
+    retries: int = 1,
+    timeout: Optional[float] = None,
+    stop_on: Optional[str] = None,
+    archiver: Optional[Archiver] = None,
+    jobs_root: str = JOBS_ROOT,
+    wf_path: str = WHITEFIELD_PATH,
+    manifest_path: Optional[str] = None,
+) -> list[dict]:
+    """
+    Runs every config with at most concurrency simulations at once, each in its
+    own working directory, all from the calling event loop (the coroutine
+    counterpart of scheduler.BatchScheduler.run_batch). A failed simulation is
+    retried up to retries times. Returns the job records in config order, also
+    written to a JSON manifest after every change.
+    """
+    manifest = JobManifest(manifest_path)
+    slots: asyncio.Queue = asyncio.Queue()
+    for slot in range(concurrency):
+        workdir = Path(jobs_root, f"slot_{slot}")
+        slots.put_nowait(WhitefieldController(prepare_workdir(workdir, wf_path)))
+
+    async def run_job(config_file: str) -> dict:
+        job = manifest.add(config_file)
+        controller = await slots.get()
+        started = manifest.start(job, controller.wf_path)
+        try:
+            for attempt in range(1, retries + 2):
+                manifest.record(job, attempts=attempt)
+                try:
+                    outputs = await controller.run(
+                        os.path.abspath(config_file), timeout, stop_on, archiver
+                    )
+                except Exception as e:
+                    manifest.attempt_failed(job, e, controller.wf_path)
+                    continue
+                manifest.succeeded(job, outputs)
+                break
+            else:
+                manifest.record(job, status="failed")
+        except asyncio.CancelledError:
+            manifest.record(job, status="cancelled")
+            raise
+        finally:
+            slots.put_nowait(controller)
+            manifest.finish(job, started)
+        return job
+
+    return list(await asyncio.gather(*(run_job(c) for c in config_files)))
+
+
+async def _main(args) -> list[dict]:
+    # Ctrl+C cancels the batch, which stops every running simulation
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGINT, asyncio.current_task().cancel  # type: ignore[union-attr]
+    )
+    with Archiver(args.compress) as archiver:
+        try:
+            return await run_batch(
+                args.configs,
+                args.concurrency,
+                args.retries,
+                args.timeout,
+                HNP_MESSAGE if args.early_stop else None,
+                archiver,
+            )
+        except asyncio.CancelledError:
+            print("Batch cancelled, see the manifest in ../logs")
+            return []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run Whitefield simulations concurrently from one event loop."
+    )
+    parser.add_argument("configs", nargs="+", help="config files to simulate")
+    parser.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=2,
+        help="number of simulations run at once in isolated working directories",
+    )
+    parser.add_argument(
+        "--retries", type=int, default=1, help="times a failed simulation is retried"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="seconds after which a simulation is stopped and counted as failed",
+    )
+    parser.add_argument(
+        "--early-stop",
+        action="store_true",
+        help="stop each simulation as soon as the HNP shows up in airline.log",
+    )
+    add_compress_argument(parser)
+    instrument.add_trace_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.tracing(args.trace, args.trace_format):
+        jobs = asyncio.run(_main(args))
+    for job in jobs:
+        print(f"{job['job_id']}: {job['status']} after {job['attempts']} attempts")
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional, Sequence
+
+CONFIG_TEMPLATE = "../config/wf_ot_v1_8.cfg"
+
+# "key=value #comment" or "key[1]=value"
+ENTRY_PATTERN = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)(?:\[([0-9-]+)\])?=(.*)$")
+# "randSeed=0xabcdef", commented out or not
+SEED_PATTERN = re.compile(r"^#?\s*randSeed=")
+PING_PATTERN = re.compile(r"ping\s+(?:-I\s+\S+\s+)?(\S+)\s+(\d+)\s+(\d+)")
+
+Position = tuple[int, int, int]
+
+
+class RunParams(NamedTuple):
+    # the parameters a generated config (and so its simulation run) differs by
+    n: int  # number of nodes
+    t: int  # virtual simulation time (minutes)
+    s: float  # receive sensitivity (dBm)
+    x: int  # node position iteration
+    p: int  # ping size
+
+    def file_name(self, seed: Optional[int] = None) -> str:
+        # replicates of the same params (see WfConfig.set_seed) differ by seed
+        replicate = "" if seed is None else f"_seed{seed}"
+        return (
+            f"wf_ot_n{self.n}_t{self.t}_s{self.s:g}_x{self.x}_p{self.p}"
+            + f"{replicate}.cfg"
+        )
+
+
+class WfConfig:
+    """
+    A Whitefield config file. Lines are kept as they are (comments included),
+    so a variant only changes the lines of the values that were set.
+    """
+
+    def __init__(self, lines: Sequence[str]):
+        self.lines = list(lines)
+
+    @classmethod
+    def parse(cls, text: str) -> "WfConfig":
+        return cls(text.splitlines())
+
+    @classmethod
+    def read(cls, path) -> "WfConfig":
+        with open(path, "r") as f:
+            return cls.parse(f.read())
+
+    def copy(self) -> "WfConfig":
+        return WfConfig(self.lines)
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.write(self.render())
+
+    def canonical(self) -> str:
+        # the entries in file order, without comments, blank lines or padding
+        return "".join(
+            f"{key}={value}\n" if index is None else f"{key}[{index}]={value}\n"
+            for _, key, index, value in self._entries()
+        )
+
+    def digest(self) -> str:
+        # equal for configs that only differ by comments or formatting
+        return hashlib.sha256(self.canonical().encode()).hexdigest()
+
+    def _entries(self):
+        # (line index, key, index in brackets or None, value without comment)
+        for i, line in enumerate(self.lines):
+            match = ENTRY_PATTERN.match(line)
+            if match:
+                key, index, value = match.groups()
+                yield i, key, index, value.split("#", 1)[0].strip()
+
+    def get(self, key: str, index: Optional[int] = None) -> Optional[str]:
+        wanted = None if index is None else str(index)
+        for _, k, i, value in self._entries():
+            if k == key and i == wanted:
+                return value
+        return None
+
+    def indexed(self, key: str) -> dict[int, str]:
+        # {index: value} of every key[index]=value line
+        return {
+            int(i): value
+            for _, k, i, value in self._entries()
+            if k == key and i is not None and i.isdigit()
+        }
+
+    def set(self, key: str, value, index: Optional[int] = None):
+        """
+        Replaces the line of key (or key[index]), comment included, like
+        config-editor.sh does. Keys that aren't in the file are left out.
+        """
+        name = key if index is None else f"{key}[{index}]"
+        wanted = None if index is None else str(index)
+        for i, k, idx, _ in list(self._entries()):
+            if k == key and idx == wanted:
+                self.lines[i] = f"{name}={value}"
+
+    def set_seed(self, seed: int):
+        """
+        Sets Airline's random seed, so the simulation can be repeated with the
+        same results. The template has the randSeed line commented out (a new
+        seed every run), it is uncommented, or added if there is none.
+        """
+        line = f"randSeed={seed:#x}"
+        for i, existing in enumerate(self.lines):
+            if SEED_PATTERN.match(existing):
+                self.lines[i] = line
+                return
+        self.lines.insert(0, line)
+
+    def set_node_positions(self, positions: Sequence[Position]):
+        # replaces every nodePosition line, from where the first one was
+        entries = [i for i, k, _, _ in self._entries() if k == "nodePosition"]
+        first = entries[0] if entries else len(self.lines)
+        new_lines = [
+            f"nodePosition[{node}]=" + ",".join(str(v) for v in position)
+            for node, position in enumerate(positions)
+        ]
+        self.lines = (
+            [line for i, line in enumerate(self.lines[:first]) if i not in entries]
+            + new_lines
+            + [
+                line
+                for i, line in enumerate(self.lines[first:], first)
+                if i not in entries
+            ]
+        )
+
+    def set_ping_size(self, size: int):
+        # every pinging node sends pings of this size
+        for node in self.ping_nodes:
+            self.set("nodePing", f"ping ff02::1 {size} 500 0.01 1;", node)
+
+    @property
+    def num_nodes(self) -> Optional[int]:
+        value = self.get("numOfNodes")
+        return int(value) if value else None
+
+    @property
+    def ping_nodes(self) -> list[int]:
+        return sorted(self.indexed("nodePing"))
+
+    @property
+    def max_theoretical_ping(self) -> int:
+        # the ping counts of every node (max echo replies without collisions)
+        total = 0
+        for command in self.indexed("nodePing").values():
+            match = PING_PATTERN.search(command)
+            if match:
+                total += int(match.group(3))
+        return total
+
+    @property
+    def network_key(self) -> Optional[bytes]:
+        # the Thread network key from the nodeConfig line
+        match = re.search(
+            r"networkkey\s+([0-9a-fA-F]{32})", self.get("nodeConfig") or ""
+        )
+        return bytes.fromhex(match.group(1)) if match else None
+
+    def variant(self, params: RunParams, positions: Sequence[Position]) -> "WfConfig":
+        """
+        Returns a copy with the node count, simulation time, receive
+        sensitivity (of every node), node positions and ping size of params.
+        """
+        if len(positions) != params.n:
+            raise ValueError(
+                f"{len(positions)} node positions given for {params.n} nodes"
+            )
+        config = self.copy()
+        config.set("numOfNodes", params.n)
+        config.set("simulationEndTime", params.t)
+        for node in range(params.n):
+            config.set("rxSensitivity", f"{params.s:g}", node)
+        config.set_node_positions(positions)
+        config.set_ping_size(params.p)
+        return config
+
+
+@lru_cache(maxsize=None)
+def load_template(path: str = CONFIG_TEMPLATE) -> WfConfig:
+    # parsed once per process, variants are copies
+    return WfConfig.read(path)
+
+
+def parse_positions(positions: str) -> list[Position]:
+    # "[0,0,0] [0,10,0]" -> [(0, 0, 0), (0, 10, 0)]
+    return [
+        tuple(int(v) for v in position.strip("[]").split(","))  # type: ignore
+        for position in positions.split()
+    ]
+
+
+def params_path(config_file_path) -> str:
+    return os.path.splitext(config_file_path)[0] + ".json"
+
+
+def write_variant(
+    config: WfConfig, params: RunParams, directory, seed: Optional[int] = None
+) -> str:
+    """
+    Writes config to directory under its params file name (and seed, for
+    replicates), with the params in a JSON file next to it (see run_params).
+    Returns the config file path.
+    """
+    path = os.path.join(directory, params.file_name(seed))
+    config.write(path)
+    data: dict = params._asdict()
+    if seed is not None:
+        data["seed"] = seed
+    with open(params_path(path), "w") as f:
+        json.dump(data, f, indent=4)
+    return path
+
+
+def run_params(config_file_path) -> RunParams:
+    """
+    Returns the params of a generated config, from its JSON file, or parsed from
+    the file name for configs generated before the JSON files existed.
+    """
+    try:
+        with open(params_path(config_file_path)) as f:
+            data = json.load(f)
+        return RunParams(*(data[field] for field in RunParams._fields))
+    except FileNotFoundError:
+        pass
+    values = [
+        float(s)
+        for s in re.findall(r"-?\d+\.?\d*", os.path.basename(str(config_file_path)))
+    ]
+    if len(values) < 5:
+        raise ValueError(f"no run params in the config file name {config_file_path}")
+    n, t, s, x, p = values[:5]
+    return RunParams(int(n), int(t), s, int(x), int(p))
+
+
+def replicate_seed(config_file_path) -> Optional[int]:
+    # the seed of a replicate config (see write_variant), None for other configs
+    try:
+        with open(params_path(config_file_path)) as f:
+            return json.load(f).get("seed")
+    except FileNotFoundError:
+        return None
@@ -1,10 +1,27 @@
-import shutil
+import functools
+import json
+import os
+import select
 import signal
+import sqlite3
 import subprocess
 import sys
 import time
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
+
+from cascoda import instrument
+from cascoda.airline_log import AIRLINE_LOG, LogFollower
+from cascoda.archive import Archiver, move_dir
+from cascoda.run_catalog import (
+    SIMULATION_INFO_FILE,
+    catalog_path,
+    record_run,
+    simulation_info,
+    simulation_status,
+)
+from cascoda.wf_config import WfConfig
 
 interrupt = False
 
@@ -22,6 +39,8 @@ WHITEFIELD_PATH = "../../whitefield/"
 CONFIG_PATH_OT = "../config/wf_ot_v1_8.cfg"
 SIMULATION_OUTPUTS = "../simulation_outputs"
 CASCODA_PATH = "../ot-wf-results-gen/cascoda/"
+# overrides the Whitefield version detected from its git checkout
+SIMULATOR_VERSION_ENV = "WHITEFIELD_VERSION"
 
 
 def create_backup_dirs(config_file, folders=["log", "pcap"]):
@@ -39,19 +58,19 @@ def create_backup_dirs(config_file, folders=["log", "pcap"]):
     return output_dirs
 
 
-# to move folder one directory up
-# https://stackoverflow.com/a/50368037
-def backup_log_pcap_files(config_file, folders=["log", "pcap"]):
-    # ensure directories exist (create if not exist) before attempting to move
-    # log folders
+# to move folder one directory up, a rename unless simulation_outputs is on
+# another file system (see archive.move_dir)
+def backup_log_pcap_files(
+    config_file, folders=["log", "pcap"], wf_path=WHITEFIELD_PATH
+):
     print(f"Whitefield processed the current config: {config_file}")
     print("Backing up pcap and log folders.")
     output_dirs = create_backup_dirs(config_file, folders)
     for folder in folders:
-        original_path = Path(WHITEFIELD_PATH + folder)
+        original_path = Path(wf_path, folder)
         # print(f"moving folder {folder}s from", original_path)
         # print("to output_dir", output_dirs[folder])
-        shutil.move(str(original_path), str(output_dirs[folder]))
+        move_dir(original_path, output_dirs[folder])
     return output_dirs
 
 
@@ -70,10 +89,10 @@ def progress_bar(n, max_dots=6):
 
 
 # start whitefield
-def start(config_file):
+def start(config_file, wf_path=WHITEFIELD_PATH):
     output = subprocess.run(
         ["./invoke_whitefield.sh", config_file],
-        cwd=WHITEFIELD_PATH,
+        cwd=wf_path,
         capture_output=True,
     )
     print(output.stdout.decode("utf-8").rstrip(), "\n")
@@ -84,22 +103,22 @@ def start(config_file):
 
 
 # stop whitefield
-def stop():
+def stop(wf_path=WHITEFIELD_PATH):
     output = subprocess.run(
         ["./scripts/wfshell", "stop_whitefield"],
-        cwd=WHITEFIELD_PATH,
+        cwd=wf_path,
         capture_output=True,
     )
     print(output.stdout.decode("utf-8").rstrip(), "\n")
     sys.stdout.flush()
 
 
-def whitefield_status():
+def whitefield_status(wf_path=WHITEFIELD_PATH):
     sys.stdout.flush()
     status_output = []
     output = subprocess.Popen(
         ["./whitefield_status.sh"],
-        cwd=WHITEFIELD_PATH + "/scripts",
+        cwd=os.path.join(wf_path, "scripts"),
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
@@ -113,45 +132,343 @@ def whitefield_status():
     return status_output
 
 
-def monitor(method_to_monitor, timer=2):
+# polling interval bounds (seconds) when Whitefield's processes can't be waited on
+POLL_MIN = 0.05
+POLL_MAX = 2
+# the ns-3 process invoke_whitefield.sh starts, the simulation ends when it exits
+AIRLINE_PROCESS = "airline"
+
+
+def simulation_pids(wf_path=WHITEFIELD_PATH):
+    """
+    Returns the pids of the processes running from wf_path (the airline and
+    stackline processes started by invoke_whitefield.sh), or None when /proc
+    is not available.
+    """
+    wf_path = os.path.realpath(wf_path)
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return None
+    pids = []
+    for entry in entries:
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            if os.readlink(f"/proc/{entry}/cwd") == wf_path:
+                pids.append(int(entry))
+        except OSError:  # exited, or owned by another user
+            continue
+    return pids
+
+
+def airline_pids(wf_path=WHITEFIELD_PATH, ignore_pids=()):
+    """
+    Returns the pids of the airline processes running from wf_path, or None
+    when /proc is not available. The stackline node processes and anything else
+    started from wf_path are left out, they may outlive the simulation.
+    ignore_pids are processes that were already running before it started.
+    """
+    pids = simulation_pids(wf_path)
+    if pids is None:
+        return None
+    return [
+        pid
+        for pid in pids
+        if pid not in ignore_pids
+        and _process_name(pid) == AIRLINE_PROCESS
+        and pid_running(pid)
+    ]
+
+
+def _process_name(pid) -> Optional[str]:
+    try:
+        with open(f"/proc/{pid}/comm") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def wait_for_pids(pids, timeout=None):
+    """
+    Blocks until every process in pids has exited, using pidfds (Linux >= 5.3)
+    or else polling with a growing interval. Returns False on timeout.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    poller = select.poll() if hasattr(os, "pidfd_open") else None
+    pidfds = {}
+    for pid in pids:
+        try:
+            fd = os.pidfd_open(pid) if poller is not None else None
+        except ProcessLookupError:
+            continue
+        except OSError:  # kernel without pidfd support
+            poller = None
+            fd = None
+        pidfds[pid] = fd
+        if fd is not None:
+            poller.register(fd, select.POLLIN)
+
+    interval = POLL_MIN
+    try:
+        while pidfds and not interrupt:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if poller is not None and None not in pidfds.values():
+                # wake up at least every POLL_MAX seconds to check for Ctrl+C
+                wait = POLL_MAX if remaining is None else min(remaining, POLL_MAX)
+                for fd, _ in poller.poll(wait * 1000):
+                    poller.unregister(fd)
+                    os.close(fd)
+                    pidfds = {p: f for p, f in pidfds.items() if f != fd}
+                continue
+            for pid in list(pidfds):
+                if not pid_running(pid):
+                    del pidfds[pid]
+            time.sleep(interval if remaining is None else min(interval, remaining))
+            interval = min(interval * 2, POLL_MAX)
+    finally:
+        for fd in pidfds.values():
+            if fd is not None:
+                os.close(fd)
+    return True
+
+
+# zombies (exited, not yet reaped) count as stopped
+def pid_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+    except OSError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def wait_for_completion(wf_path=WHITEFIELD_PATH, timeout=None, ignore_pids=()):
     """
-    Prints output of method_to_monitor() to a blank screen for timer seconds.
-    If Ctrl+C is pressed, the signal_handler is invoked and terminates this loop
+    Waits until the Whitefield simulation running from wf_path stops, returning
+    as soon as its airline process exits (see airline_pids). If airline can't
+    be found (no /proc, or Whitefield running from another directory)
+    whitefield_status.sh is polled instead, with an adaptive backoff (POLL_MIN
+    doubling up to POLL_MAX).
+    Returns the wall time waited in seconds, raises TimeoutError after timeout
+    seconds.
     """
-    # clear_screen()
-    output = []
+    started = time.monotonic()
+
+    def remaining():
+        if timeout is None:
+            return None
+        return max(timeout - (time.monotonic() - started), 0)
+
+    pids = airline_pids(wf_path, ignore_pids)
+    if pids:
+        if not wait_for_pids(pids, remaining()):
+            raise TimeoutError(f"Whitefield still running after {timeout} s")
+        sys.stdout.flush()
+        return time.monotonic() - started
+
+    interval = POLL_MIN
     n = 0
-    while not ("Whitefield stopped" in output):
-        # global interrupt set to true in signal_handler() on 'Ctrl+C'
-        if interrupt:
+    while not interrupt:
+        progress_bar(n)
+        if "Whitefield stopped" in whitefield_status(wf_path):
             break
-        else:
-            progress_bar(n)
-            # print output of method_to_monitor() for timer seconds
-            output = method_to_monitor()
-            if "Whitefield stopped" in output:
-                break
-            time.sleep(timer)
-            # clear_screen()
-            n += 1
-            continue
+        if remaining() == 0:
+            raise TimeoutError(f"Whitefield still running after {timeout} s")
+        wait = interval if timeout is None else min(interval, remaining())
+        time.sleep(wait)
+        interval = min(interval * 2, POLL_MAX)
+        n += 1
     sys.stdout.flush()
     print("\n")
+    return time.monotonic() - started
 
 
-def run_simulation(config_file):
+def simulation_wall_time(log_dir):
+    """
+    Returns the wall time (seconds) of the simulation whose logs were backed up
+    to log_dir, or None if it wasn't recorded.
+    """
+    return simulation_info(log_dir).get("wall_time_s")
+
+
+@functools.lru_cache(maxsize=None)
+def simulator_version(wf_path=WHITEFIELD_PATH) -> str:
+    """
+    Identifies the Whitefield build that runs the simulations: the
+    WHITEFIELD_VERSION environment variable if set, else the commit of the
+    Whitefield checkout ("-dirty" with local changes), else "unknown".
+    """
+    version = os.environ.get(SIMULATOR_VERSION_ENV)
+    if version:
+        return version
+    try:
+        output = subprocess.run(
+            ["git", "describe", "--always", "--dirty", "--abbrev=40"],
+            cwd=wf_path,
+            capture_output=True,
+        )
+    except OSError:
+        return "unknown"
+    return output.stdout.decode("utf-8").strip() or "unknown"
+
+
+def run_simulation(
+    config_file,
+    wf_path=WHITEFIELD_PATH,
+    timeout=None,
+    stop_on=None,
+    archiver: Optional[Archiver] = None,
+):
     """
     Runs simulation, and returns the directories of the output files (logs and pcaps)
-    whitefield has a constraint where it can only be invoked under WHITEFIELD_PATH.
-    CASCODA_PATH allows the start() method to find the configs
+    whitefield has a constraint where it can only be invoked under wf_path.
+    CASCODA_PATH allows the start() method to find relative config paths,
+    absolute config paths are passed through (e.g. for isolated job directories)
+    The simulation wall time is saved to the log folder (see simulation_wall_time).
+    If the simulation runs longer than timeout seconds it is stopped, its outputs
+    are still backed up, and TimeoutError is raised.
+    With stop_on (e.g. airline_log.HNP_MESSAGE), airline.log is followed while
+    the simulation runs and Whitefield is stopped as soon as the message is
+    logged, for callers that only need to know whether it appears.
+    Every backed up run is recorded in the run catalog (see run_catalog).
+    With an archiver, the backed up folders are then compressed in the
+    background while the caller goes on (see archive.Archiver).
     """
+    with instrument.stage("simulation", config=str(config_file)):
+        return _run_simulation(config_file, wf_path, timeout, stop_on, archiver)
+
+
+def _run_simulation(config_file, wf_path, timeout, stop_on, archiver):
+    wf_config_file = invoked_config(config_file)
     print("\n")
     print("---------------------" * 3)
-    print("invoking whitefield with " + CASCODA_PATH + config_file)
-    start(CASCODA_PATH + config_file)
-    monitor(whitefield_status, timer=2)
-    stop()
-    return backup_log_pcap_files(config_file)
+    print("invoking whitefield with " + wf_config_file)
+    started = time.monotonic()
+    started_at = datetime.now()
+    already_running = airline_pids(wf_path) or []
+    with instrument.stage("simulation.start"):
+        start(wf_config_file, wf_path)
+    follower = None
+    if stop_on is not None:
+        follower = LogFollower(
+            os.path.join(wf_path, "log", AIRLINE_LOG),
+            functools.partial(stop, wf_path),
+            stop_on,
+        )
+        follower.start()
+    try:
+        with instrument.stage("simulation.wait"):
+            wait_for_completion(wf_path, timeout, already_running)
+        timed_out = False
+    except TimeoutError:
+        timed_out = True
+    finally:
+        if follower is not None:
+            follower.finish()
+    wall_time = time.monotonic() - started
+    stopped_early = follower is not None and follower.matched
+    if stopped_early:
+        print(f"Stopped early, found: {stop_on}")
+    with instrument.stage("simulation.stop"):
+        stop(wf_path)
+    return finish_simulation(
+        config_file,
+        wf_path,
+        started_at,
+        wall_time,
+        timed_out,
+        stopped_early,
+        archiver,
+        timeout,
+    )
+
+
+# the config path passed to invoke_whitefield.sh (relative ones from CASCODA_PATH)
+def invoked_config(config_file) -> str:
+    return config_file if os.path.isabs(config_file) else CASCODA_PATH + config_file
+
+
+def finish_simulation(
+    config_file,
+    wf_path,
+    started_at: datetime,
+    wall_time: float,
+    timed_out: bool,
+    stopped_early: bool,
+    archiver: Optional[Archiver],
+    timeout,
+):
+    """
+    Saves the outputs of the simulation that was just stopped in wf_path (see
+    save_outputs) and returns their directories, or raises TimeoutError if it
+    timed out. The end of every run, whichever way it was waited for.
+    """
+    output_dirs = save_outputs(
+        config_file, wf_path, started_at, wall_time, timed_out, stopped_early, archiver
+    )
+    if timed_out:
+        raise TimeoutError(
+            f"{config_file} still running after {timeout} s, "
+            + f"partial outputs in {output_dirs['log'].parent}"
+        )
+    return output_dirs
+
+
+def save_outputs(
+    config_file,
+    wf_path,
+    started_at: datetime,
+    wall_time: float,
+    timed_out: bool,
+    stopped_early: bool,
+    archiver: Optional[Archiver] = None,
+):
+    """
+    Backs up the outputs of the simulation that just stopped in wf_path, saves
+    its simulation.json, records it in the run catalog and hands the backed up
+    folders to the archiver. Returns the output directories.
+    """
+    with instrument.stage("simulation.backup"):
+        output_dirs = backup_log_pcap_files(config_file, wf_path=wf_path)
+    info = {
+        "config_file": str(config_file),
+        "config_sha256": WfConfig.read(config_file).digest(),
+        "simulator_version": simulator_version(),
+        "wall_time_s": round(wall_time, 3),
+        "timed_out": timed_out,
+        "stopped_early": stopped_early,
+    }
+    with open(Path(output_dirs["log"], SIMULATION_INFO_FILE), "w") as f:
+        json.dump(info, f, indent=4)
+    try:
+        record_run(
+            catalog_path(SIMULATION_OUTPUTS),
+            config_file,
+            output_dirs["pcap"],
+            output_dirs["log"],
+            started_at,
+            datetime.now(),
+            info["wall_time_s"],
+            simulation_status(info),
+        )
+    except sqlite3.Error as e:
+        print(f"WARNING run not added to the run catalog: {e}")
+    if archiver is not None:
+        for output_dir in output_dirs.values():
+            archiver.submit(output_dir)
+    print(f"Simulation took {wall_time:.1f} s")
+    return output_dirs
 
 
 if __name__ == "__main__":
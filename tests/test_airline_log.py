@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+
+from cascoda.airline_log import log_stats, scan_log
+
+# the lines scan_log reads, the drops are counted whatever else is on the line
+LOG = b"""Setting node 1 ext_addr: 0xffffffffffffffff -> 0x66e80055237c0326
+In OTmsgrecvCallback, sim time: 1200, aliveNodes: 3
+[1 -> 2] snr <= snr_min, dropped
+In OTmsgrecvCallback, sim time: 2400, aliveNodes: 3
+[2->1] snr <= snr_min, dropped
+src: 1, dst: 2, snr <= snr_min, dropped
+src=0 dst=2 snr <= snr_min, dropped
+snr <= snr_min, dropped
+In OTmsgrecvCallback, sim time: 60000, aliveNodes: 3
+"""
+
+
+class TestScanLog(unittest.TestCase):
+    def test_scan_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "airline.log")
+            with open(path, "wb") as f:
+                f.write(LOG)
+            events = scan_log(path)
+        self.assertEqual(events.drops, 5)
+        self.assertEqual(events.first_drop_sim_time, 1200)
+        self.assertEqual(events.last_sim_time, 60000)
+        self.assertEqual(events.ext_addrs, {1: "66e80055237c0326"})
+        self.assertEqual(log_stats(events)["snr_drops"], 5)
+        self.assertEqual(log_stats(events)["registered_nodes"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from cascoda.archive import compress_file
+from cascoda.extract_stats import tshark_get_filtered_packets
+
+# stands in for tshark: prints one echo request if the pcap comes in on stdin,
+# fails like tshark does on an unreadable file otherwise
+FAKE_TSHARK = """#!/bin/sh
+if [ "$(cat)" = "pcap data" ]; then
+    printf '1600000001.5\\t1.5\\tfe80::1\\tff02::1\\t7\\t128\\n'
+else
+    echo "tshark: The file \\"-\\" isn't a capture file" >&2
+    exit 2
+fi
+"""
+
+
+class TestTshark(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        tshark = os.path.join(self.directory.name, "tshark")
+        with open(tshark, "w") as f:
+            f.write(FAKE_TSHARK)
+        os.chmod(tshark, os.stat(tshark).st_mode | stat.S_IEXEC)
+        path = self.directory.name + os.pathsep + os.environ.get("PATH", "")
+        patcher = mock.patch.dict(os.environ, {"PATH": path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_pcap(self, data: bytes) -> str:
+        with open(os.path.join(self.directory.name, "pkt-1-0.pcap"), "wb") as f:
+            f.write(data)
+        return self.directory.name + os.sep
+
+    def test_pcap_is_piped(self):
+        directory = self.write_pcap(b"pcap data")
+        capture = tshark_get_filtered_packets(directory, "pkt-1-0.pcap")
+        self.assertEqual(capture.start, 1600000000.0)
+        self.assertEqual([(p.seq, p.type) for p in capture.packets], [(7, 128)])
+
+    def test_compressed_pcap_is_decompressed(self):
+        directory = self.write_pcap(b"pcap data")
+        compress_file(directory + "pkt-1-0.pcap", "gzip")
+        capture = tshark_get_filtered_packets(directory, "pkt-1-0.pcap")
+        self.assertEqual(len(capture.packets), 1)
+
+    def test_failure_is_raised(self):
+        directory = self.write_pcap(b"not a pcap")
+        with self.assertRaisesRegex(RuntimeError, "isn't a capture file"):
+            tshark_get_filtered_packets(directory, "pkt-1-0.pcap")
+
+
+if __name__ == "__main__":
+    unittest.main()
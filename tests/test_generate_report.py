@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from cascoda.generate_report import get_data, table_widths
+
+
+class TestGetData(unittest.TestCase):
+    def test_request_stats_of_every_end_node(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stats.csv")
+            pd.DataFrame(
+                {
+                    "%_responded": [50.0, 60.0],
+                    "network_efficiency_%": [40.0, 45.0],
+                    "Node_10_request_stat": ["Node 10: 5", None],
+                    "Node_3_request_stat": ["Node 3: 4", "Node 3: 6"],
+                    "latency_p50_2": [0.1, 0.2],
+                    "n": [3, 3],
+                    "t": [100, 100],
+                    "s": [-100, -100],
+                    "x": [10, 20],
+                    "p": [83, 83],
+                }
+            ).to_csv(path, index=False)
+            reduced_df, _, sim_run_df = get_data(path)
+        self.assertEqual(
+            list(reduced_df.columns),
+            [
+                "%_responded",
+                "network_efficiency_%",
+                "Node_3_request_stat",
+                "Node_10_request_stat",
+                "n",
+                "t",
+                "s",
+                "x",
+                "p",
+            ],
+        )
+        self.assertEqual(list(reduced_df["Node_10_request_stat"]), ["Node 10: 5", ""])
+        self.assertEqual(sim_run_df.columns[0], "sim_run_params")
+
+    def test_table_widths(self):
+        self.assertEqual(table_widths(5), (32, 28, 40, 44, 44))
+        self.assertEqual(table_widths(6), (32, 28, 40) + (88 / 3,) * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
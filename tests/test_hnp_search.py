@@ -0,0 +1,72 @@
+import unittest
+
+from cascoda.hnp_search import find_hnp_onset
+
+MAX_X = 50
+
+
+class StubProbe:
+    # the HNP shows from onset on (never if None), every call is recorded
+    def __init__(self, onset):
+        self.onset = onset
+        self.calls = []
+
+    def __call__(self, x: int) -> bool:
+        self.calls.append(x)
+        return self.onset is not None and x >= self.onset
+
+
+def search(onset, mode, guess=None):
+    probe = StubProbe(onset)
+    return find_hnp_onset(probe, mode, MAX_X, guess), probe.calls
+
+
+class TestFindHnpOnset(unittest.TestCase):
+    # (mode, guess, onset) -> probes, onset at the first point, in the middle,
+    # at the last point and never
+    PROBES = {
+        ("linear", None, 1): 1,
+        ("linear", None, 17): 17,
+        ("linear", None, 50): 50,
+        ("linear", None, None): 50,
+        ("bisect", None, 1): 1,
+        ("bisect", None, 17): 9,
+        ("bisect", None, 50): 13,
+        ("bisect", None, None): 8,
+        ("neighbour", 17, 1): 6,
+        ("neighbour", 17, 17): 2,
+        ("neighbour", 16, 17): 2,
+        ("neighbour", 20, 17): 5,
+        ("neighbour", 17, 50): 8,
+        ("neighbour", 17, None): 8,
+        ("neighbour", 50, 50): 2,
+        ("neighbour", 50, None): 1,
+    }
+
+    def test_same_onset_as_linear(self):
+        for mode, guess in (("bisect", None), ("neighbour", 1), ("neighbour", 30)):
+            for onset in [None, *range(1, MAX_X + 1)]:
+                with self.subTest(mode=mode, guess=guess, onset=onset):
+                    found, calls = search(onset, mode, guess)
+                    self.assertEqual(found, search(onset, "linear")[0])
+                    self.assertEqual(found, onset)
+                    # every x is probed at most once
+                    self.assertEqual(len(calls), len(set(calls)))
+
+    def test_probes(self):
+        for (mode, guess, onset), probes in self.PROBES.items():
+            with self.subTest(mode=mode, guess=guess, onset=onset):
+                found, calls = search(onset, mode, guess)
+                self.assertEqual(found, onset)
+                self.assertEqual(len(calls), probes)
+
+    def test_neighbour_without_guess_is_bisect(self):
+        self.assertEqual(search(17, "neighbour")[1], search(17, "bisect")[1])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            find_hnp_onset(StubProbe(1), "binary")
+
+
+if __name__ == "__main__":
+    unittest.main()
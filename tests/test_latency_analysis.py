@@ -0,0 +1,88 @@
+import math
+import unittest
+
+import numpy as np
+
+from cascoda.extract_stats import timing_stats
+from cascoda.latency_analysis import match_replies, window_sums
+from cascoda.packet_table import PacketTable
+from cascoda.pcap_reader import ICMPV6_ECHO_REPLY, ICMPV6_ECHO_REQUEST
+from cascoda.retry_analysis import analyse_retries
+from cascoda.stats_export import split_stats
+
+
+def table(start: float, times, seqs, icmp_type: int) -> PacketTable:
+    count = len(seqs)
+    return PacketTable(
+        start,
+        np.asarray(times, dtype=np.float64),
+        np.asarray(seqs, dtype=np.int32),
+        np.full(count, icmp_type, dtype=np.uint8),
+        np.zeros(count, dtype=np.int32),
+        np.zeros(count, dtype=np.int32),
+        ["fe80::1"],
+    )
+
+
+class TestMatchReplies(unittest.TestCase):
+    def test_latency_from_first_attempt_to_first_reply(self):
+        latency = match_replies(
+            [1, 1, 2, 3, 5], [10, 10.5, 11, 12, 13], [3, 1, 7, 2], [12.3, 10.2, 9, 5]
+        )
+        self.assertEqual(latency.sequences.tolist(), [1, 2, 3, 5])
+        np.testing.assert_allclose(latency.latencies, [0.2, np.nan, 0.3, np.nan])
+        # the reply to 2 was sent before it was requested
+        np.testing.assert_allclose(latency.reply_times, [10.2, 12.3])
+
+
+class TestWindowSums(unittest.TestCase):
+    def test_sliding_windows(self):
+        times = np.array([0.5, 4.9, 5.0, 12.0, 19.99])
+        # windows [0, 10), [5, 15), [10, 20), [15, 25), [20, 30)
+        self.assertEqual(window_sums(times, 20.0, 10, 5).tolist(), [3, 2, 2, 1, 0])
+        self.assertEqual(window_sums(times, 20.0, 5, 5).tolist(), [2, 1, 1, 1, 0])
+
+    def test_window_must_be_a_multiple_of_step(self):
+        with self.assertRaises(ValueError):
+            window_sums(np.zeros(1), 10.0, 10, 3)
+
+
+class TestTimingStats(unittest.TestCase):
+    def test_series_stay_out_of_the_summary(self):
+        # node 0 requests 1, 1 (retried), 2 and 3, central (1) answers 1 and 2,
+        # the captures start 0.5 s apart
+        end_node = table(100.0, [0.0, 1.0, 2.0, 3.0], [1, 1, 2, 3], ICMPV6_ECHO_REQUEST)
+        central = table(100.5, [0.75, 2.0], [1, 2], ICMPV6_ECHO_REPLY)
+        requests = {0: end_node.seqs}
+        request_times = {0: end_node.times}
+        stats = timing_stats(
+            {0: end_node, 1: central},
+            1,
+            requests,
+            request_times,
+            {0: analyse_retries(end_node.seqs, end_node.times)},
+            {0: np.array([0, 1])},
+        )
+        self.assertEqual(stats["answered_requests"], 2)
+        self.assertAlmostEqual(stats["latency_mean_s"], (1.25 + 0.5) / 2)
+        self.assertEqual(stats["window_retries"], [1])
+
+        summary, series = split_stats(stats)
+        self.assertTrue(all(not isinstance(value, list) for value in summary.values()))
+        self.assertIn("latency_0", series)
+        self.assertEqual(
+            {key for key in series if key.startswith("window_")},
+            {
+                "window_starts",
+                "window_requests",
+                "window_retries",
+                "window_replies",
+                "window_throughput",
+                "window_mean_latency",
+            },
+        )
+        self.assertTrue(math.isnan(series["latency_0"][2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import io
+import struct
+import unittest
+
+from cascoda.pcap_reader import (
+    ICMPV6_ECHO_REPLY,
+    ICMPV6_ECHO_REQUEST,
+    LINKTYPE_IEEE802_15_4_WITHFCS,
+    PcapDecodeError,
+    read_echo_packets,
+)
+from cascoda.thread_crypto import ccm_star_encrypt, expand_key, thread_mac_key
+
+NETWORK_KEY = bytes.fromhex("00112233445566778899aabbccddeeff")
+PAN_ID = 0xFACE
+SENDER = bytes.fromhex("1122334455667788")
+RECEIVER = bytes.fromhex("8877665544332211")
+SHORT_SENDER = bytes.fromhex("0400")
+START = 1_600_000_000.0
+
+
+def mac_frame(src: bytes, dst: bytes, counter: int, payload: bytes, nonce_src=None):
+    # a data frame secured like Thread does (MIC-32 + encryption, key index 1),
+    # the nonce has the sender's extended address (nonce_src for a short src)
+    schedule = expand_key(thread_mac_key(NETWORK_KEY, 0))
+    dst_mode = 2 if len(dst) == 2 else 3
+    src_mode = 2 if len(src) == 2 else 3
+    fcf = 1 | (1 << 3) | (1 << 6) | (dst_mode << 10) | (1 << 12) | (src_mode << 14)
+    header = struct.pack("<HBH", fcf, counter & 0xFF, PAN_ID) + dst[::-1] + src[::-1]
+    header += bytes([5 | (1 << 3)]) + struct.pack("<I", counter) + b"\x01"
+    nonce = (nonce_src or src) + struct.pack(">I", counter) + b"\x05"
+    return header + ccm_star_encrypt(schedule, nonce, header, payload, 4) + b"\0\0"
+
+
+def echo_payload(icmp_type: int, seq: int) -> bytes:
+    # 6LoWPAN IPHC ICMPv6 echo, link-local addresses taken from the MAC header
+    icmp = bytes([icmp_type, 0, 0, 0]) + struct.pack(">HH", 0x1234, seq)
+    return bytes([0x7B, 0x33, 58]) + icmp + bytes(8)
+
+
+def pcap(frames: list) -> bytes:
+    data = struct.pack(
+        "<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, LINKTYPE_IEEE802_15_4_WITHFCS
+    )
+    for timestamp, frame in frames:
+        seconds = int(timestamp)
+        micros = int(round((timestamp - seconds) * 1e6))
+        data += struct.pack("<IIII", seconds, micros, len(frame), len(frame)) + frame
+    return data
+
+
+def pcapng_block(block_type: int, body: bytes) -> bytes:
+    body += bytes(-len(body) % 4)
+    length = struct.pack("<I", len(body) + 12)
+    return struct.pack("<I", block_type) + length + body + length
+
+
+def pcapng(frames: list, interface: int = 0) -> bytes:
+    # section header with an option (shb_userappl), an interface with
+    # microsecond timestamps, a name resolution block, then the packets
+    # (of the given interface id)
+    application = b"cascoda tests"
+    shb_option = struct.pack("<HH", 4, len(application)) + application
+    shb_option += bytes(-len(application) % 4) + bytes(4)
+    data = pcapng_block(
+        0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1) + shb_option
+    )
+    idb_options = struct.pack("<HHB3x", 9, 1, 6) + bytes(4)
+    data += pcapng_block(
+        1, struct.pack("<HHI", LINKTYPE_IEEE802_15_4_WITHFCS, 0, 0) + idb_options
+    )
+    data += pcapng_block(4, bytes(4))
+    for timestamp, frame in frames:
+        micros = int(round(timestamp * 1e6))
+        data += pcapng_block(
+            6,
+            struct.pack(
+                "<IIIII",
+                interface,
+                micros >> 32,
+                micros & 0xFFFFFFFF,
+                len(frame),
+                len(frame),
+            )
+            + frame,
+        )
+    return data
+
+
+def ping_frames(pings: int = 5) -> list:
+    frames = []
+    for seq in range(1, pings + 1):
+        frames.append(
+            (
+                START + seq,
+                mac_frame(SENDER, RECEIVER, 2 * seq, echo_payload(128, seq)),
+            )
+        )
+        frames.append(
+            (
+                START + seq + 0.25,
+                mac_frame(RECEIVER, SENDER, 2 * seq + 1, echo_payload(129, seq)),
+            )
+        )
+    return frames
+
+
+class TestReadEchoPackets(unittest.TestCase):
+    def test_pcap(self):
+        capture = read_echo_packets(io.BytesIO(pcap(ping_frames())), NETWORK_KEY)
+        self.assertEqual(capture.start, START + 1)
+        self.assertEqual(capture.undecrypted, 0)
+        self.assertEqual(
+            [(p.time, p.seq, p.type) for p in capture.packets],
+            [
+                (time, seq, icmp_type)
+                for seq in range(1, 6)
+                for time, icmp_type in (
+                    (seq - 1, ICMPV6_ECHO_REQUEST),
+                    (seq - 0.75, ICMPV6_ECHO_REPLY),
+                )
+            ],
+        )
+
+    def test_pcapng_round_trip(self):
+        frames = ping_frames()
+        from_pcap = read_echo_packets(io.BytesIO(pcap(frames)), NETWORK_KEY)
+        from_pcapng = read_echo_packets(io.BytesIO(pcapng(frames)), NETWORK_KEY)
+        self.assertEqual(len(from_pcapng.packets), 10)
+        self.assertEqual(from_pcapng, from_pcap)
+
+    def test_pcapng_packet_of_undescribed_interface(self):
+        data = io.BytesIO(pcapng(ping_frames(), interface=1))
+        with self.assertRaises(PcapDecodeError):
+            read_echo_packets(data, NETWORK_KEY)
+
+    def test_short_source_uses_learnt_extended_address(self):
+        frames = ping_frames(1)
+        # later frames of the same sender from its short address
+        for seq in range(2, 5):
+            payload = echo_payload(128, seq)
+            frames.append(
+                (
+                    START + seq,
+                    mac_frame(SHORT_SENDER, RECEIVER, 10 + seq, payload, SENDER),
+                )
+            )
+        capture = read_echo_packets(io.BytesIO(pcap(frames)), NETWORK_KEY)
+        self.assertEqual(capture.undecrypted, 0)
+        self.assertEqual([p.seq for p in capture.packets], [1, 1, 2, 3, 4])
+
+    def test_short_source_of_unknown_sender_is_undecrypted(self):
+        unknown = bytes.fromhex("0102030405060708")
+        frames = ping_frames(1) + [
+            (
+                START + 2,
+                mac_frame(SHORT_SENDER, RECEIVER, 20, echo_payload(128, 2), unknown),
+            )
+        ]
+        capture = read_echo_packets(io.BytesIO(pcap(frames)), NETWORK_KEY)
+        self.assertEqual(capture.undecrypted, 1)
+        self.assertEqual(len(capture.packets), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import math
+import random
+import statistics
+import unittest
+
+from cascoda.replicates import PointStats, Welford, replicate_point, t_critical
+
+
+class TestWelford(unittest.TestCase):
+    def test_same_as_statistics(self):
+        rng = random.Random(0)
+        values = [rng.gauss(60, 15) for _ in range(200)]
+        welford = Welford()
+        for value in values:
+            welford.add(value)
+        self.assertEqual(welford.count, 200)
+        self.assertAlmostEqual(welford.mean, statistics.mean(values), places=9)
+        self.assertAlmostEqual(welford.variance, statistics.variance(values), places=9)
+        self.assertAlmostEqual(welford.std, statistics.stdev(values), places=9)
+
+    def test_less_than_two_values(self):
+        welford = Welford()
+        welford.add(3.0)
+        self.assertEqual(welford.mean, 3.0)
+        self.assertTrue(math.isnan(welford.variance))
+        self.assertEqual(welford.half_width(), math.inf)
+
+
+class TestTCritical(unittest.TestCase):
+    def test_table_values(self):
+        # two sided critical values of Student's t, from the usual tables
+        for confidence, df, value in (
+            (0.95, 1, 12.706),
+            (0.95, 2, 4.303),
+            (0.95, 4, 2.776),
+            (0.95, 10, 2.228),
+            (0.95, 30, 2.042),
+            (0.99, 5, 4.032),
+            (0.90, 3, 2.353),
+        ):
+            with self.subTest(confidence=confidence, df=df):
+                self.assertAlmostEqual(t_critical(confidence, df), value, places=3)
+
+    def test_invalid_confidence(self):
+        with self.assertRaises(ValueError):
+            t_critical(95, 4)
+
+
+class StubReplicates:
+    # the stats of every replicate, by seed, from a fixed list of values
+    def __init__(self, values, failing=()):
+        self.values = values
+        self.failing = failing
+        self.seeds = []
+
+    def config_file(self, seed: int) -> str:
+        self.seeds.append(seed)
+        return f"seed{seed}.cfg"
+
+    def simulate(self, config_file_path: str) -> dict:
+        return {"log": config_file_path}
+
+    def extract(self, config_file_path: str, output_dirs: dict) -> dict:
+        seed = int(config_file_path[4:-4])
+        if seed in self.failing:
+            raise RuntimeError("no pcap")
+        value = self.values[seed % len(self.values)]
+        return {"%_responded": value, "network_efficiency_%": value / 2}
+
+
+def replicate(stub, precision, concurrency=1, max_replicates=10):
+    return replicate_point(
+        stub.config_file,
+        stub.simulate,
+        stub.extract,
+        PointStats("point"),
+        precision,
+        min_replicates=3,
+        max_replicates=max_replicates,
+        concurrency=concurrency,
+        base_seed=0,
+    )
+
+
+class TestReplicatePoint(unittest.TestCase):
+    def test_stops_once_converged(self):
+        stub = StubReplicates([50.0])
+        point = replicate(stub, precision=1.0)
+        self.assertEqual(point.replicates, 3)
+        self.assertEqual(stub.seeds, [0, 1, 2])
+        self.assertTrue(point.converged(1.0, 3))
+
+    def test_stops_at_max_replicates(self):
+        stub = StubReplicates([20.0, 80.0])
+        point = replicate(stub, precision=1.0)
+        self.assertEqual(point.replicates, 10)
+        self.assertFalse(point.converged(1.0, 3))
+        self.assertEqual(point.metrics["%_responded"].mean, 50.0)
+
+    def test_converges_when_interval_narrows(self):
+        # stops at the first replicate that brings the half width below 8
+        stub = StubReplicates([40.0, 60.0])
+        point = replicate(stub, precision=8.0, max_replicates=20)
+        welford = point.metrics["%_responded"]
+        self.assertLessEqual(welford.half_width(), 8.0)
+        smaller = Welford()
+        for seed in range(point.replicates - 1):
+            smaller.add(stub.values[seed % 2])
+        self.assertGreater(smaller.half_width(), 8.0)
+
+    def test_running_replicates_are_added(self):
+        # converged after the third, the fourth was already running
+        stub = StubReplicates([50.0])
+        point = replicate(stub, precision=1.0, concurrency=2)
+        self.assertEqual(point.replicates, 4)
+
+    def test_failed_replicates(self):
+        stub = StubReplicates([50.0], failing={1})
+        point = replicate(stub, precision=1.0)
+        self.assertEqual(point.failed, 1)
+        self.assertEqual(point.replicates, 3)
+        self.assertEqual(stub.seeds, [0, 1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+
+from cascoda.retry_analysis import analyse_retries, retries_per_packet
+
+
+def baseline_retries_per_packet(sequences):
+    # the sequential loop retries_per_packet replaced, kept as the reference
+    retries = []
+    count_retries = 0
+    prev_value = -1
+    for current_value in sequences:
+        if current_value == prev_value and current_value != 0 and prev_value != 0:
+            count_retries += 1
+            retries.append(count_retries)
+        elif current_value != prev_value and current_value != 0 and prev_value != 0:
+            retries.append(count_retries)
+            count_retries = 0
+        prev_value = current_value
+    return retries
+
+
+class TestRetriesPerPacket(unittest.TestCase):
+    def assert_same_as_baseline(self, sequences):
+        self.assertEqual(
+            retries_per_packet(sequences).tolist(),
+            baseline_retries_per_packet(sequences),
+            sequences,
+        )
+
+    def test_empty(self):
+        self.assert_same_as_baseline([])
+
+    def test_single_run(self):
+        self.assert_same_as_baseline([7])
+        self.assert_same_as_baseline([7, 7, 7, 7])
+
+    def test_repeated_sequence_numbers(self):
+        self.assert_same_as_baseline([1, 1, 2, 3, 3, 3, 4, 1, 1])
+        self.assert_same_as_baseline([5, 6, 5, 6, 6])
+
+    def test_wraparound(self):
+        # ICMPv6 sequence numbers are 16 bit, 0 keeps the count unchanged
+        self.assert_same_as_baseline([65534, 65535, 65535, 0, 0, 1, 1, 2])
+        self.assert_same_as_baseline([65535, 0, 1])
+        self.assert_same_as_baseline([0, 0, 0])
+
+    def test_random_sequences(self):
+        rng = np.random.default_rng(0)
+        for _ in range(500):
+            size = int(rng.integers(0, 40))
+            sequences = rng.integers(0, 4, size).tolist()
+            self.assert_same_as_baseline(sequences)
+
+
+class TestAnalyseRetries(unittest.TestCase):
+    def test_runs_and_histogram(self):
+        analysis = analyse_retries([1, 1, 2, 3, 3, 3, 1], times=np.arange(7.0))
+        self.assertEqual(analysis.run_values.tolist(), [1, 2, 3, 1])
+        self.assertEqual(analysis.run_starts.tolist(), [0, 2, 3, 6])
+        self.assertEqual(analysis.run_lengths.tolist(), [2, 1, 3, 1])
+        self.assertEqual(analysis.unique_sequences.tolist(), [1, 2, 3])
+        self.assertEqual(analysis.retries_per_sequence.tolist(), [2, 0, 2])
+        self.assertEqual(analysis.histogram.tolist(), [1, 0, 2])
+        self.assertEqual(analysis.retry_times.tolist(), [0.0, 2.0, 3.0, 6.0])
+        self.assertEqual(analysis.run_retries.tolist(), [1, 0, 2, 0])
+
+    def test_empty(self):
+        analysis = analyse_retries([])
+        self.assertEqual(analysis.run_values.size, 0)
+        self.assertEqual(analysis.histogram.size, 0)
+        self.assertEqual(analysis.retries_per_packet.size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+
+from cascoda.run_catalog import find_runs, record_run
+from cascoda.wf_config import RunParams, WfConfig, parse_positions, write_variant
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE = os.path.join(REPO, "config", "wf_ot_v1_8.cfg")
+POSITIONS = "[0,0,0] [0,15,0] [0,30,0]"
+
+
+class TestFindRuns(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.catalog = os.path.join(self.directory, "run_catalog.sqlite")
+        self.template = WfConfig.read(TEMPLATE)
+        self.backups = 0
+
+    def config(self, s, x, seed=None) -> str:
+        params = RunParams(n=3, t=1, s=s, x=x, p=83)
+        config = self.template.variant(params, parse_positions(POSITIONS))
+        return write_variant(config, params, self.directory, seed)
+
+    def record(self, config_file, status="ok") -> str:
+        # a backup folder per run, in the order they were backed up
+        self.backups += 1
+        pcap_dir = os.path.join(self.directory, "runs", f"pcap_{self.backups}")
+        record_run(self.catalog, config_file, pcap_dir, status=status)
+        return pcap_dir
+
+    def names(self, **kwargs) -> list:
+        return [run.name for run in find_runs(self.catalog, **kwargs)]
+
+    def test_numeric_order(self):
+        # decreasing sensitivity then increasing x, not the directory listing
+        for s, x in ((-105, 2), (-99, 10), (-100.5, 1), (-99, 2), (-105, 10)):
+            self.record(self.config(s, x))
+        self.assertEqual(
+            self.names(),
+            [
+                "wf_ot_n3_t1_s-99_x2_p83",
+                "wf_ot_n3_t1_s-99_x10_p83",
+                "wf_ot_n3_t1_s-100.5_x1_p83",
+                "wf_ot_n3_t1_s-105_x2_p83",
+                "wf_ot_n3_t1_s-105_x10_p83",
+            ],
+        )
+        self.assertEqual(
+            self.names(sensitivities=[-99, -105], positions=[10]),
+            ["wf_ot_n3_t1_s-99_x10_p83", "wf_ot_n3_t1_s-105_x10_p83"],
+        )
+
+    def test_latest_ok_run_per_name(self):
+        config = self.config(-99, 1)
+        self.record(config)
+        latest_ok = self.record(config)
+        self.record(config, status="timed_out")
+        self.record(config, status="stopped_early")
+
+        runs = find_runs(self.catalog)
+        self.assertEqual([run.pcap_dir for run in runs], [latest_ok])
+        self.assertEqual(runs[0].run_id, "wf_ot_n3_t1_s-99_x1_p83/pcap_2")
+        self.assertEqual(
+            [run.status for run in find_runs(self.catalog, all_runs=True)],
+            ["ok", "ok", "timed_out", "stopped_early"],
+        )
+
+    def test_failed_runs_only(self):
+        self.record(self.config(-99, 1), status="timed_out")
+        self.assertEqual(self.names(), [])
+        self.assertEqual(self.names(all_runs=True), ["wf_ot_n3_t1_s-99_x1_p83"])
+
+    def test_seeded_runs(self):
+        self.record(self.config(-99, 1))
+        for seed in (11, 12):
+            self.record(self.config(-99, 1, seed))
+
+        self.assertEqual(self.names(), ["wf_ot_n3_t1_s-99_x1_p83"])
+        runs = find_runs(self.catalog, replicates=True, all_runs=True)
+        self.assertEqual([run.seed for run in runs], [None, 11, 12])
+        # each seed has its own config, so its own latest run
+        runs = find_runs(self.catalog, replicates=True)
+        self.assertEqual(len(runs), 3)
+
+    def test_same_pcap_dir_recorded_once(self):
+        config = self.config(-99, 1)
+        pcap_dir = self.record(config)
+        record_run(self.catalog, config, pcap_dir, status="timed_out")
+        runs = find_runs(self.catalog, all_runs=True)
+        self.assertEqual([run.status for run in runs], ["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import contextlib
+import io
+import os
+import stat
+import subprocess
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+from cascoda.scheduler import BatchScheduler, prepare_workdir
+from cascoda.whitefield import airline_pids, start, stop, wait_for_completion
+
+# stand in for Whitefield: the simulation is an airline process sleeping in the
+# working directory, its outputs name the config it was started with
+STUB_SCRIPTS = {
+    "invoke_whitefield.sh": """#!/bin/sh
+mkdir -p log pcap
+echo "config $1" > log/airline.log
+echo "$1" > pcap/pkt-0-0.pcap
+bin/airline "$STUB_SIM_TIME" > /dev/null 2>&1 &
+echo $! > log/sim.pid
+echo "Started OK"
+""",
+    "bin/airline": """#!/bin/sh
+trap 'kill $! 2> /dev/null; exit' TERM
+sleep "$1" &
+wait
+""",
+    "scripts/wfshell": """#!/bin/sh
+kill "$(cat log/sim.pid)" 2> /dev/null
+echo "Whitefield stopped"
+""",
+    "scripts/whitefield_status.sh": """#!/bin/sh
+if kill -0 "$(cat ../log/sim.pid)" 2> /dev/null; then
+    echo "Whitefield running"
+else
+    echo "Whitefield stopped"
+fi
+""",
+}
+CONFIGS = ("wf_ot_n3_t1_s-100_x1_p83.cfg", "wf_ot_n3_t1_s-100_x2_p83.cfg")
+
+
+class StubWhitefieldCase(unittest.TestCase):
+    # a stub Whitefield in wf_path, configs to run and the outputs in root
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.wf_path = self.root / "whitefield"
+        for name, script in STUB_SCRIPTS.items():
+            path = self.wf_path / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(script)
+            path.chmod(path.stat().st_mode | stat.S_IEXEC)
+        self.configs = []
+        for name in CONFIGS:
+            path = self.root / "config" / name
+            path.parent.mkdir(exist_ok=True)
+            path.write_text("numOfNodes=3\nsimulationEndTime=1\n")
+            self.configs.append(str(path))
+        for patcher in (
+            mock.patch.dict(
+                os.environ, {"STUB_SIM_TIME": "0.5", "WHITEFIELD_VERSION": "stub"}
+            ),
+            mock.patch(
+                "cascoda.whitefield.SIMULATION_OUTPUTS",
+                str(self.root / "simulation_outputs"),
+            ),
+            contextlib.redirect_stdout(io.StringIO()),
+        ):
+            patcher.__enter__()
+            self.addCleanup(patcher.__exit__, None, None, None)
+
+
+class TestBatchScheduler(StubWhitefieldCase):
+    def test_slots_run_at_once_without_sharing_outputs(self):
+        scheduler = BatchScheduler(
+            concurrency=2,
+            retries=0,
+            manifest_path=str(self.root / "manifest.json"),
+            jobs_root=str(self.root / "jobs"),
+            wf_path=str(self.wf_path),
+        )
+        try:
+            records = scheduler.run_batch(self.configs)
+        finally:
+            scheduler.shutdown()
+
+        self.assertEqual([record["status"] for record in records], ["ok", "ok"])
+        self.assertNotEqual(records[0]["workdir"], records[1]["workdir"])
+        for config, record in zip(self.configs, records):
+            outputs = record["outputs"]
+            log = Path(outputs["log"], "airline.log").read_text()
+            self.assertEqual(log, f"config {config}\n")
+            pcap = Path(outputs["pcap"], "pkt-0-0.pcap").read_text()
+            self.assertEqual(pcap, f"{config}\n")
+        # both simulations were running at the same time
+        started = max(datetime.fromisoformat(r["started"]) for r in records)
+        finished = min(datetime.fromisoformat(r["finished"]) for r in records)
+        self.assertLess(started, finished)
+
+    def test_stopping_a_slot_leaves_the_other_running(self):
+        slots = [
+            prepare_workdir(self.root / "jobs" / f"slot_{slot}", self.wf_path)
+            for slot in range(2)
+        ]
+        for slot in slots:
+            self.assertFalse((slot / "log").is_symlink())
+            self.assertFalse((slot / "pcap").is_symlink())
+        with mock.patch.dict(os.environ, {"STUB_SIM_TIME": "30"}):
+            for config, slot in zip(self.configs, slots):
+                start(config, slot)
+                self.addCleanup(stop, slot)
+
+        stop(slots[0])
+        wait_for_completion(slots[0], timeout=5)
+        self.assertEqual(airline_pids(slots[0]), [])
+        self.assertEqual(len(airline_pids(slots[1])), 1)
+
+    def test_processes_outliving_airline_are_not_waited_for(self):
+        slot = prepare_workdir(self.root / "jobs" / "slot_0", self.wf_path)
+        start(self.configs[0], slot)
+        # e.g. a node process or a shell left in the working directory
+        stray = subprocess.Popen(["sleep", "30"], cwd=slot)
+        self.addCleanup(stray.wait)
+        self.addCleanup(stray.kill)
+        self.assertLess(wait_for_completion(slot, timeout=10), 5)
+        self.assertIsNone(stray.poll())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import unittest
+
+from cascoda.archive import compress_file, output_size
+from cascoda.stats_cache import cache_key
+
+
+class TestCacheKey(unittest.TestCase):
+    def test_compressing_keeps_the_key(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "pkt-1-0.pcap")
+            with open(path, "wb") as f:
+                f.write(bytes(range(256)) * 64)
+            key = cache_key(path, b"key", "native")
+            compress_file(path, "gzip")
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(output_size(path), 256 * 64)
+            self.assertEqual(cache_key(path, b"key", "native"), key)
+
+    def test_changed_pcap_changes_the_key(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "pkt-1-0.pcap")
+            with open(path, "wb") as f:
+                f.write(b"\0" * 100)
+            key = cache_key(path, None, "native")
+            with open(path, "ab") as f:
+                f.write(b"\0")
+            self.assertNotEqual(cache_key(path, None, "native"), key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from cascoda.stats_export import StatsExporter
+
+
+class TestStatsExporter(unittest.TestCase):
+    def test_summary_keeps_columns_of_every_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stats.csv")
+            with StatsExporter(path) as exporter:
+                exporter.write("a", {"replies_to_0": 1, "replies_to_2": 2, "t": [0.1]})
+                # another central node, so other end node columns
+                exporter.write("b", {"replies_to_0": 3, "replies_to_3": 4})
+                exporter.write("c", {"replies_to_2": 5})
+            with open(path, newline="") as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual(
+            list(rows[0]), ["replies_to_0", "replies_to_2", "run_id", "replies_to_3"]
+        )
+        self.assertEqual(
+            [(row["run_id"], row["replies_to_2"], row["replies_to_3"]) for row in rows],
+            [("a", "2", ""), ("b", "", "4"), ("c", "5", "")],
+        )
+        # list valued stats only go to the raw series
+        self.assertNotIn("t", rows[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
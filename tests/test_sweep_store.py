@@ -0,0 +1,173 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from cascoda.airline_log import HNP_MESSAGE
+from cascoda.hdn_detector import sweep_sensitivity
+from cascoda.run_catalog import SIMULATION_INFO_FILE
+from cascoda.sweep_store import SweepStore
+from cascoda.wf_config import (
+    RunParams,
+    WfConfig,
+    parse_positions,
+    run_params,
+    write_variant,
+)
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE = os.path.join(REPO, "config", "wf_ot_v1_8.cfg")
+POSITIONS = "[0,0,0] [0,15,0] [0,30,0]"
+
+
+class StoreCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.path = str(self.root / "sweep_results.sqlite")
+        self.outputs = 0
+
+    def output_dirs(self, stopped_early=False) -> dict:
+        # the backed up outputs of a simulation, as run_simulation returns them
+        self.outputs += 1
+        output_dirs = {
+            "log": self.root / "outputs" / f"log_{self.outputs}",
+            "pcap": self.root / "outputs" / f"pcap_{self.outputs}",
+        }
+        for path in output_dirs.values():
+            path.mkdir(parents=True)
+        info = {"stopped_early": stopped_early}
+        (output_dirs["log"] / SIMULATION_INFO_FILE).write_text(json.dumps(info))
+        return output_dirs
+
+
+class TestSweepStore(StoreCase):
+    def setUp(self):
+        super().setUp()
+        self.params = RunParams(n=3, t=1, s=-99, x=1, p=83)
+        self.config = WfConfig.read(TEMPLATE).variant(
+            self.params, parse_positions(POSITIONS)
+        )
+        self.config_file = write_variant(self.config, self.params, str(self.root))
+
+    def test_stored_point_is_reused(self):
+        store = SweepStore(self.path, "v1")
+        self.assertIsNone(store.find(self.config_file))
+        output_dirs = self.output_dirs()
+        store.record(self.config_file, True, output_dirs)
+
+        point = SweepStore(self.path, "v1").find(self.config_file)
+        self.assertEqual(point.name, "wf_ot_n3_t1_s-99_x1_p83")
+        self.assertTrue(point.hnp)
+        self.assertFalse(point.stopped_early)
+        self.assertEqual(point.output_dirs, output_dirs)
+
+    def test_comments_do_not_change_the_config(self):
+        store = SweepStore(self.path, "v1")
+        store.record(self.config_file, False, self.output_dirs())
+        with open(self.config_file, "a") as f:
+            f.write("\n# simulated again\n")
+        self.assertIsNotNone(store.find(self.config_file))
+
+    def test_changed_config_is_simulated_again(self):
+        store = SweepStore(self.path, "v1")
+        store.record(self.config_file, False, self.output_dirs())
+        self.config.set("simulationEndTime", "2")
+        self.config.write(self.config_file)
+        self.assertIsNone(store.find(self.config_file))
+
+    def test_other_simulator_version_is_simulated_again(self):
+        SweepStore(self.path, "v1").record(self.config_file, True, self.output_dirs())
+        self.assertIsNone(SweepStore(self.path, "v2").find(self.config_file))
+        self.assertIsNotNone(SweepStore(self.path, "v1").find(self.config_file))
+
+    def test_deleted_outputs_are_simulated_again(self):
+        store = SweepStore(self.path, "v1")
+        output_dirs = self.output_dirs()
+        store.record(self.config_file, True, output_dirs)
+        shutil.rmtree(output_dirs["pcap"])
+        self.assertIsNone(store.find(self.config_file))
+
+    def test_stopped_early(self):
+        SweepStore(self.path, "v1").record(
+            self.config_file, True, self.output_dirs(stopped_early=True)
+        )
+        self.assertIsNone(SweepStore(self.path, "v1").find(self.config_file))
+        point = SweepStore(self.path, "v1", True).find(self.config_file)
+        self.assertTrue(point.stopped_early)
+
+    def test_record_replaces_earlier_result(self):
+        store = SweepStore(self.path, "v1")
+        store.record(self.config_file, True, self.output_dirs())
+        output_dirs = self.output_dirs()
+        store.record(self.config_file, False, output_dirs)
+        point = store.find(self.config_file)
+        self.assertFalse(point.hnp)
+        self.assertEqual(point.output_dirs, output_dirs)
+
+
+class TestSweepReuse(StoreCase):
+    ONSET = 4
+
+    def setUp(self):
+        super().setUp()
+        # sweep_sensitivity writes to ../config and ../logs
+        (self.root / "config").mkdir()
+        shutil.copy(TEMPLATE, self.root / "config")
+        (self.root / "cascoda").mkdir()
+        cwd = os.getcwd()
+        os.chdir(self.root / "cascoda")
+        self.addCleanup(os.chdir, cwd)
+        self.simulated = []
+
+    def simulate(self, config_file_path) -> dict:
+        # the HNP shows from x = ONSET on
+        self.simulated.append(Path(config_file_path).stem)
+        output_dirs = self.output_dirs()
+        hnp = run_params(config_file_path).x >= self.ONSET
+        log = HNP_MESSAGE if hnp else "no drops"
+        (output_dirs["log"] / "airline.log").write_text(log + "\n")
+        return output_dirs
+
+    def sweep(self, store, search="linear", on_reused=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sweep_sensitivity(
+                -99, self.simulate, search, store=store, on_reused=on_reused
+            )
+
+    def test_sweep_run_again_reuses_every_point(self):
+        self.assertEqual(self.sweep(SweepStore(self.path, "v1")), self.ONSET)
+        self.assertEqual(len(self.simulated), self.ONSET)
+
+        reused = []
+        self.simulated.clear()
+        onset = self.sweep(
+            SweepStore(self.path, "v1"), on_reused=lambda c, o: reused.append(c)
+        )
+        self.assertEqual(onset, self.ONSET)
+        self.assertEqual(self.simulated, [])
+        self.assertEqual(len(reused), self.ONSET)
+
+    def test_new_simulator_version_simulates_again(self):
+        self.sweep(SweepStore(self.path, "v1"))
+        self.simulated.clear()
+        self.assertEqual(self.sweep(SweepStore(self.path, "v2")), self.ONSET)
+        self.assertEqual(len(self.simulated), self.ONSET)
+
+    def test_other_search_only_simulates_new_points(self):
+        self.sweep(SweepStore(self.path, "v1"))
+        self.simulated.clear()
+        # the linear sweep simulated x = 1 to ONSET, bisect probes further
+        self.assertEqual(self.sweep(SweepStore(self.path, "v1"), "bisect"), self.ONSET)
+        self.assertNotEqual(self.simulated, [])
+        for name in self.simulated:
+            self.assertGreater(run_params(name + ".cfg").x, self.ONSET)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from cascoda.thread_crypto import (
+    aes_encrypt_block,
+    ccm_star_decrypt,
+    ccm_star_encrypt,
+    expand_key,
+)
+
+
+class TestAes(unittest.TestCase):
+    def test_fips_197_vector(self):
+        # FIPS-197 appendix C.1
+        schedule = expand_key(bytes(range(16)))
+        self.assertEqual(
+            aes_encrypt_block(
+                schedule, bytes.fromhex("00112233445566778899aabbccddeeff")
+            ).hex(),
+            "69c4e0d86a7b0430d8cdb78070b4c55a",
+        )
+
+
+class TestCcmStar(unittest.TestCase):
+    # RFC 3610 packet vector #1 (CCM with an 8 byte MIC and a 13 byte nonce)
+    KEY = bytes.fromhex("c0c1c2c3c4c5c6c7c8c9cacbcccdcecf")
+    NONCE = bytes.fromhex("00000003020100a0a1a2a3a4a5")
+    HEADER = bytes(range(8))
+    MESSAGE = bytes(range(8, 31))
+    RESULT = bytes.fromhex(
+        "588c979a61c663d2f066d0c2c0f989806d5f6b61dac38417e8d12cfdf926e0"
+    )
+
+    def test_encrypt_vector(self):
+        schedule = expand_key(self.KEY)
+        self.assertEqual(
+            ccm_star_encrypt(schedule, self.NONCE, self.HEADER, self.MESSAGE, 8),
+            self.RESULT,
+        )
+
+    def test_decrypt_vector(self):
+        schedule = expand_key(self.KEY)
+        self.assertEqual(
+            ccm_star_decrypt(schedule, self.NONCE, self.HEADER, self.RESULT, 8),
+            self.MESSAGE,
+        )
+
+    def test_wrong_nonce_fails_the_mic(self):
+        schedule = expand_key(self.KEY)
+        nonce = bytes(13)
+        self.assertIsNone(
+            ccm_star_decrypt(schedule, nonce, self.HEADER, self.RESULT, 8)
+        )
+
+    def test_mic_only(self):
+        # security levels 1-3 authenticate the payload without encrypting it
+        schedule = expand_key(self.KEY)
+        payload = self.MESSAGE + ccm_star_encrypt(
+            schedule, self.NONCE, self.HEADER + self.MESSAGE, b"", 4
+        )
+        self.assertEqual(
+            ccm_star_decrypt(
+                schedule, self.NONCE, self.HEADER, payload, 4, encrypted=False
+            ),
+            self.MESSAGE,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import asyncio
+import json
+from pathlib import Path
+from unittest import mock
+
+from cascoda.airline_log import HNP_MESSAGE
+from cascoda.run_catalog import SIMULATION_INFO_FILE
+from cascoda.wf_async import WhitefieldController, run_batch
+from tests.test_scheduler import StubWhitefieldCase
+
+
+class TestWfAsync(StubWhitefieldCase):
+    def test_run_batch(self):
+        records = asyncio.run(
+            run_batch(
+                self.configs,
+                concurrency=2,
+                retries=0,
+                jobs_root=str(self.root / "jobs"),
+                wf_path=str(self.wf_path),
+                manifest_path=str(self.root / "manifest.json"),
+            )
+        )
+        self.assertEqual([record["status"] for record in records], ["ok", "ok"])
+        for config, record in zip(self.configs, records):
+            log = Path(record["outputs"]["log"], "airline.log").read_text()
+            self.assertEqual(log, f"config {config}\n")
+        manifest = json.loads((self.root / "manifest.json").read_text())
+        self.assertEqual(manifest, records)
+
+    def test_failed_log_follower_is_not_an_early_stop(self):
+        async def unreadable_log(log_path, message):
+            raise PermissionError(log_path)
+
+        controller = WhitefieldController(self.wf_path)
+        with mock.patch("cascoda.wf_async.follow_log", unreadable_log):
+            outputs = asyncio.run(controller.run(self.configs[0], stop_on=HNP_MESSAGE))
+        info = json.loads(Path(outputs["log"], SIMULATION_INFO_FILE).read_text())
+        self.assertFalse(info["stopped_early"])
+        # the simulation ran to its end instead of being stopped
+        self.assertGreaterEqual(info["wall_time_s"], 0.5)
@@ -0,0 +1,98 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from cascoda.wf_config import (
+    RunParams,
+    WfConfig,
+    parse_positions,
+    replicate_seed,
+    run_params,
+    write_variant,
+)
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE = os.path.join(REPO, "config", "wf_ot_v1_8.cfg")
+CONFIG_EDITOR = os.path.join(REPO, "cascoda", "config-editor.sh")
+POSITIONS = "[0,0,0] [0,15,0] [0,30,0]"
+
+
+@unittest.skipUnless(shutil.which("bash"), "config-editor.sh needs bash")
+class TestVariant(unittest.TestCase):
+    def config_editor(self, s, positions, ping) -> str:
+        # the config the shell script wrote for the sweeps before WfConfig
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "out.cfg")
+            subprocess.run(
+                [
+                    "bash",
+                    CONFIG_EDITOR,
+                    "-n",
+                    "3",
+                    "-t",
+                    "1",
+                    "-s",
+                    str(s),
+                    "-x",
+                    positions,
+                    "-p",
+                    str(ping),
+                    "-i",
+                    TEMPLATE,
+                    "-o",
+                    output,
+                ],
+                cwd=directory,
+                check=True,
+                capture_output=True,
+            )
+            with open(output) as f:
+                return f.read()
+
+    def test_same_as_config_editor(self):
+        template = WfConfig.read(TEMPLATE)
+        for s, x, p in ((-99, 1, 83), (-105, 7, 120), (-100.5, 2, 83)):
+            params = RunParams(n=3, t=1, s=s, x=x, p=p)
+            config = template.variant(params, parse_positions(POSITIONS))
+            self.assertEqual(config.render(), self.config_editor(s, POSITIONS, p))
+
+
+class TestRunParams(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.params = RunParams(n=3, t=1, s=-100.5, x=4, p=83)
+        self.config = WfConfig.read(TEMPLATE).variant(
+            self.params, parse_positions(POSITIONS)
+        )
+
+    def test_file_name(self):
+        # the names the sweeps gave configs before WfConfig
+        self.assertEqual(self.params.file_name(), "wf_ot_n3_t1_s-100.5_x4_p83.cfg")
+        self.assertEqual(
+            RunParams(3, 1, -99, 1, 83).file_name(11),
+            "wf_ot_n3_t1_s-99_x1_p83_seed11.cfg",
+        )
+
+    def test_json_round_trip(self):
+        path = write_variant(self.config, self.params, self.directory, seed=7)
+        self.assertEqual(run_params(path), self.params)
+        self.assertEqual(replicate_seed(path), 7)
+
+    def test_file_name_fallback(self):
+        for seed in (None, 7):
+            path = write_variant(self.config, self.params, self.directory, seed)
+            os.remove(os.path.splitext(path)[0] + ".json")
+            self.assertEqual(run_params(path), self.params)
+            self.assertIsNone(replicate_seed(path))
+
+    def test_no_params(self):
+        with self.assertRaises(ValueError):
+            run_params(os.path.join(self.directory, "wf_ot_v1_8.cfg"))
+
+
+if __name__ == "__main__":
+    unittest.main()